@@ -0,0 +1,359 @@
+"""
+File name: ann_index.py
+Python Version: 3.9
+
+Description:
+    This module provides an in-process approximate nearest neighbor index
+    (IVF) for cosine similarity search, used by LocalVectorStore:
+    - the vectors (normalized, float32) are saved in a .npy file,
+      memory-mapped when loaded
+    - the candidates are found probing the n_probe lists closest to the query
+      and scored with float16 copies of the vectors, kept in memory
+    - the best rescore_k candidates are scored again, exactly,
+      with the float32 vectors
+    - the lists are computed again when the number of vectors grows
+      by retrain_ratio since they were computed
+    - deleted vectors are masked, and skipped by the search
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+    index = IVFIndex(dim=768)
+    index.add(vectors)
+    index.build()
+    rows, scores = index.search(query, top_k=5)
+    index.save("local_index")
+
+License:
+    This code is released under the MIT License.
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+import json
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+VECTORS_FILE = "vectors.npy"
+CENTROIDS_FILE = "centroids.npy"
+ASSIGNMENTS_FILE = "assignments.npy"
+DELETED_FILE = "deleted.npy"
+INDEX_CONFIG_FILE = "index.json"
+
+
+def normalize(vectors) -> np.ndarray:
+    """
+    return the vectors (2D) as float32, with unit norm
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+
+    return vectors / norms
+
+
+def spherical_kmeans(vectors, n_clusters, n_iter=10, seed=42) -> np.ndarray:
+    """
+    k-means with cosine similarity, on unit vectors
+    return the centroids (unit vectors)
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(n_clusters):
+            members = vectors[assignments == c]
+            if len(members) > 0:
+                centroids[c] = members.sum(axis=0)
+            else:
+                # empty cluster: restart from a random vector
+                centroids[c] = vectors[rng.integers(len(vectors))]
+        centroids = normalize(centroids)
+
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted file index for cosine similarity.
+
+    Args:
+        dim (int): dimension of the vectors.
+        n_lists (int): number of lists (clusters). If None, it is
+        sqrt(number of vectors) each time the index is built.
+        n_probe (int): number of lists searched for each query.
+        rescore_k (int): number of candidates scored exactly, for each query.
+        It is at least top_k.
+        retrain_ratio (float): once built, the index is built again when
+        the number of vectors reaches retrain_ratio times the number
+        of vectors of the last build. If None, it's never built again.
+        trained_size (int): number of vectors of the last build.
+    """
+
+    def __init__(
+        self, dim, n_lists=None, n_probe=8, rescore_k=100, retrain_ratio=2.0, trained_size=0
+    ):
+        self.dim = dim
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.rescore_k = rescore_k
+        self.retrain_ratio = retrain_ratio
+        self.trained_size = trained_size
+
+        # vectors saved to disk (memory-mapped) and added since
+        self._base = np.zeros((0, dim), dtype=np.float32)
+        self._added = []
+        # float16 copy of all the vectors, to score the candidates
+        self._codes = np.zeros((0, dim), dtype=np.float16)
+        # True for the deleted rows, they keep their row number
+        self.deleted = np.zeros(0, dtype=bool)
+
+        self.centroids = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self._lists = None
+
+    def __len__(self):
+        return len(self._codes)
+
+    @property
+    def is_built(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def num_lists(self) -> int:
+        """
+        number of lists of the built index, 0 if it is not built
+        """
+        return 0 if self.centroids is None else len(self.centroids)
+
+    def vectors(self) -> np.ndarray:
+        """
+        return all the vectors (float32)
+        """
+        if not self._added:
+            return self._base
+        return np.concatenate([self._base] + self._added)
+
+    def _added_vectors(self) -> np.ndarray:
+        if len(self._added) > 1:
+            self._added = [np.concatenate(self._added)]
+        return self._added[0] if self._added else np.zeros((0, self.dim), dtype=np.float32)
+
+    def _get_rows(self, rows) -> np.ndarray:
+        """
+        return the float32 vectors of the (sorted) rows,
+        reading only them from the memory-mapped file
+        """
+        n_base = len(self._base)
+        split = np.searchsorted(rows, n_base)
+
+        return np.concatenate(
+            [np.asarray(self._base[rows[:split]]), self._added_vectors()[rows[split:] - n_base]]
+        )
+
+    def add(self, vectors) -> np.ndarray:
+        """
+        Add vectors to the index, they're normalized.
+        If the index is built, they're assigned to the closest list,
+        or the index is built again if it grew by retrain_ratio:
+        the lists computed on fewer vectors get too big, and no longer
+        follow the distribution of the vectors.
+
+        Returns:
+            the rows of the new vectors.
+        """
+        vectors = normalize(vectors)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dim {self.dim}, got {vectors.shape[1]}")
+
+        first_row = len(self)
+        self._added.append(vectors)
+        self._codes = np.concatenate([self._codes, vectors.astype(np.float16)])
+        self.deleted = np.concatenate([self.deleted, np.zeros(len(vectors), dtype=bool)])
+
+        if self.is_built:
+            new_assignments = np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+            self.assignments = np.concatenate([self.assignments, new_assignments])
+            self._lists = None
+
+            if self.retrain_ratio and len(self) >= self.retrain_ratio * self.trained_size:
+                self.build()
+
+        return np.arange(first_row, len(self))
+
+    def delete(self, rows):
+        """
+        Delete the vectors of the rows: they're no longer returned by search.
+        The rows of the other vectors don't change
+        """
+        self.deleted[np.asarray(rows, dtype=np.int64)] = True
+
+    def build(self, n_iter=10, max_train_size=50000):
+        """
+        Compute the lists (k-means on a sample of the vectors not deleted)
+        and assign the vectors to the lists.
+        If n_lists is None, the number of lists is sqrt(number of vectors)
+        """
+        vectors = self.vectors()
+        live_rows = np.flatnonzero(~self.deleted)
+        if len(live_rows) == 0:
+            return
+
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(live_rows))))
+        n_lists = min(n_lists, len(live_rows))
+
+        rng = np.random.default_rng(42)
+        if len(live_rows) > max_train_size:
+            live_rows = np.sort(rng.choice(live_rows, max_train_size, replace=False))
+        sample = np.asarray(vectors[live_rows])
+
+        self.centroids = spherical_kmeans(sample, n_lists, n_iter=n_iter)
+        self.trained_size = len(vectors)
+
+        # assign in blocks, to limit memory with big memory-mapped files
+        assignments = []
+        for i in range(0, len(vectors), 10000):
+            block = np.asarray(vectors[i : i + 10000])
+            assignments.append(np.argmax(block @ self.centroids.T, axis=1))
+        self.assignments = np.concatenate(assignments).astype(np.int32)
+        self._lists = None
+
+    def _get_lists(self):
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind="stable")
+            bounds = np.searchsorted(
+                self.assignments[order], np.arange(self.num_lists + 1)
+            )
+            self._lists = [order[bounds[i] : bounds[i + 1]] for i in range(self.num_lists)]
+        return self._lists
+
+    def search(
+        self, query, top_k=5, n_probe: Optional[int] = None, exact=False
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the top_k vectors most similar to query
+
+        Args:
+            query: the query vector.
+            top_k (int): number of results.
+            n_probe (int): number of lists searched, default self.n_probe.
+            exact (bool): if True, all the vectors are scored (brute force).
+
+        Returns:
+            the rows of the results and their cosine similarity,
+            by decreasing similarity. Deleted rows are skipped.
+        """
+        if len(self) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        query = normalize(query)[0]
+
+        if exact:
+            scores = np.concatenate([self._base @ query, self._added_vectors() @ query])
+            rows = np.flatnonzero(~self.deleted)
+            return _top(rows, scores[rows], top_k)
+
+        if self.is_built:
+            n_probe = min(n_probe or self.n_probe, self.num_lists)
+            closest_lists = _top(np.arange(self.num_lists), self.centroids @ query, n_probe)[0]
+            lists = self._get_lists()
+            candidates = np.concatenate([lists[i] for i in closest_lists])
+        else:
+            candidates = np.arange(len(self))
+        candidates = candidates[~self.deleted[candidates]]
+
+        # approximate scores, with float16 vectors
+        # (converted to float32: numpy has no fast float16 matmul)
+        approx_scores = self._codes[candidates].astype(np.float32) @ query
+        candidates = _top(candidates, approx_scores, max(self.rescore_k, top_k))[0]
+
+        # exact scores of the best candidates
+        candidates = np.sort(candidates)
+        scores = self._get_rows(candidates) @ query
+
+        return _top(candidates, scores, top_k)
+
+    def save(self, path):
+        """
+        Save the index in the directory path
+        """
+        os.makedirs(path, exist_ok=True)
+
+        vectors_path = os.path.join(path, VECTORS_FILE)
+        tmp_path = vectors_path + ".tmp.npy"
+        np.save(tmp_path, np.asarray(self.vectors()))
+        os.replace(tmp_path, vectors_path)
+        # from now on, read from the new file
+        self._base = np.load(vectors_path, mmap_mode="r")
+        self._added = []
+
+        np.save(os.path.join(path, DELETED_FILE), self.deleted)
+        if self.is_built:
+            np.save(os.path.join(path, CENTROIDS_FILE), self.centroids)
+            np.save(os.path.join(path, ASSIGNMENTS_FILE), self.assignments)
+
+        with open(os.path.join(path, INDEX_CONFIG_FILE), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "dim": self.dim,
+                    "n_lists": self.n_lists,
+                    "n_probe": self.n_probe,
+                    "rescore_k": self.rescore_k,
+                    "retrain_ratio": self.retrain_ratio,
+                    "trained_size": self.trained_size,
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, path, mmap=True) -> "IVFIndex":
+        """
+        Load an index saved in the directory path.
+        With mmap, the float32 vectors are memory-mapped, not read in memory
+        """
+        with open(os.path.join(path, INDEX_CONFIG_FILE), encoding="utf-8") as f:
+            config = json.load(f)
+
+        index = cls(**config)
+        index._base = np.load(
+            os.path.join(path, VECTORS_FILE), mmap_mode="r" if mmap else None
+        )
+        index._codes = np.concatenate(
+            [np.asarray(index._base[i : i + 10000]).astype(np.float16)
+             for i in range(0, len(index._base), 10000)]
+            or [np.zeros((0, index.dim), dtype=np.float16)]
+        )
+
+        deleted_path = os.path.join(path, DELETED_FILE)
+        if os.path.exists(deleted_path):
+            index.deleted = np.load(deleted_path)
+        else:
+            # saved before the deleted rows
+            index.deleted = np.zeros(len(index._base), dtype=bool)
+
+        centroids_path = os.path.join(path, CENTROIDS_FILE)
+        if os.path.exists(centroids_path):
+            index.centroids = np.load(centroids_path)
+            index.assignments = np.load(os.path.join(path, ASSIGNMENTS_FILE))
+            # saved before trained_size: the index was built with the vectors it had
+            if not index.trained_size:
+                index.trained_size = len(index.assignments)
+
+        return index
+
+
+def _top(rows, scores, k) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    return the k rows with the highest score, by decreasing score
+    """
+    if k < len(scores):
+        best = np.argpartition(-scores, k - 1)[:k]
+    else:
+        best = np.arange(len(scores))
+    best = best[np.argsort(-scores[best], kind="stable")]
+
+    return rows[best], scores[best]
@@ -0,0 +1,149 @@
+"""
+File name: benchmark_local_vector_store.py
+Python Version: 3.9
+
+Description:
+    Recall and latency of the IVF index used by LocalVectorStore,
+    compared with brute force cosine search.
+
+    By default it uses synthetic clustered embeddings. With --export it uses
+    the embeddings exported by export_oracle_tables.
+    The queries are held-out vectors, not added to the index: copies of
+    indexed vectors would be found in their own list even with n_probe=1.
+
+Usage:
+    python benchmark_local_vector_store.py --n-vectors 100000 --dim 768
+    python benchmark_local_vector_store.py --export chunks_export.jsonl
+    python benchmark_local_vector_store.py --initial-size 10000 --retrain-ratio 0
+
+License:
+    This code is released under the MIT License.
+"""
+
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+
+from ann_index import IVFIndex, normalize
+
+
+def synthetic_vectors(n_vectors, dim, n_clusters, spread, rng):
+    """
+    embeddings grouped in clusters, as the chunks of a set of documents.
+    With spread >= 1 the clusters overlap, as the topics of real documents
+    """
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(n_clusters, size=n_vectors)
+
+    return centers[labels] + spread * rng.normal(size=(n_vectors, dim)).astype(np.float32)
+
+
+def load_export(export_path):
+    with open(export_path, encoding="utf-8") as f:
+        return np.array([json.loads(line)["embedding"] for line in f], dtype=np.float32)
+
+
+def benchmark(index, queries, top_k, n_probe=None, exact=False):
+    """
+    return the results for each query and the latencies (msec.)
+    """
+    results, latencies = [], []
+    for query in queries:
+        start_time = time.perf_counter()
+        rows, _ = index.search(query, top_k=top_k, n_probe=n_probe, exact=exact)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        results.append(set(rows.tolist()))
+
+    return results, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the local IVF index")
+    parser.add_argument("--export", help="JSONL written by export_oracle_tables")
+    parser.add_argument("--n-vectors", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--n-clusters", type=int, default=200)
+    parser.add_argument(
+        "--spread", type=float, default=2.5, help="noise around the synthetic cluster centers"
+    )
+    parser.add_argument("--n-queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--n-lists", type=int, default=None)
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--rescore-k", type=int, default=100)
+    parser.add_argument(
+        "--initial-size",
+        type=int,
+        default=None,
+        help="build the index with the first vectors, then add the others in batches of 10000",
+    )
+    parser.add_argument(
+        "--retrain-ratio", type=float, default=2.0, help="see IVFIndex, 0 to never build again"
+    )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.export:
+        vectors = load_export(args.export)
+    else:
+        vectors = synthetic_vectors(
+            args.n_vectors + args.n_queries, args.dim, args.n_clusters, args.spread, rng
+        )
+
+    # queries: held-out vectors, from the same distribution as the index
+    held_out = np.zeros(len(vectors), dtype=bool)
+    held_out[rng.choice(len(vectors), args.n_queries, replace=False)] = True
+    queries = normalize(vectors[held_out])
+    vectors = vectors[~held_out]
+
+    index = IVFIndex(
+        vectors.shape[1],
+        n_lists=args.n_lists,
+        rescore_k=args.rescore_k,
+        retrain_ratio=args.retrain_ratio or None,
+    )
+    initial_size = args.initial_size or len(vectors)
+
+    start_time = time.perf_counter()
+    index.add(vectors[:initial_size])
+    index.build()
+    # as LocalVectorStore.from_export, the index may be built again
+    for i in range(initial_size, len(vectors), 10000):
+        index.add(vectors[i : i + 10000])
+    build_time = time.perf_counter() - start_time
+
+    with tempfile.TemporaryDirectory() as path:
+        # search memory-mapped vectors, as after LocalVectorStore.load
+        index.save(path)
+        index = IVFIndex.load(path)
+
+        print(
+            f"Vectors: {len(index)}, dim: {index.dim}, lists: {index.num_lists}, "
+            f"last build with {index.trained_size} vectors"
+        )
+        print(f"Build time: {build_time:.1f} sec.")
+        print()
+
+        truth, latencies = benchmark(index, queries, args.top_k, exact=True)
+        print(f"{'search':<16}{'recall@' + str(args.top_k):>12}{'mean ms':>10}{'p95 ms':>10}")
+        print(
+            f"{'brute force':<16}{1.0:>12.3f}"
+            f"{latencies.mean():>10.2f}{np.percentile(latencies, 95):>10.2f}"
+        )
+
+        for n_probe in args.n_probe:
+            results, latencies = benchmark(index, queries, args.top_k, n_probe=n_probe)
+            recall = np.mean(
+                [len(result & expected) / len(expected) for result, expected in zip(results, truth)]
+            )
+            print(
+                f"{'ivf n_probe=' + str(n_probe):<16}{recall:>12.3f}"
+                f"{latencies.mean():>10.2f}{np.percentile(latencies, 95):>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -50,6 +50,20 @@ TOP_K = 2
 # must be aligned with the create_tables.sql used
 EMBEDDINGS_BITS = 64
 
+# DB session pool, used for retrieval
+# max should be >= the number of concurrent requests
+DB_POOL_MIN = 1
+DB_POOL_MAX = 4
+DB_POOL_INCREMENT = 1
+# statements cached for each connection of the pool
+DB_STMT_CACHE_SIZE = 20
+# upper bounds (msec) of the buckets of the query latency histogram
+QUERY_LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+
+# rows inserted with a single executemany when saving
+# embeddings and chunks, 1 means row by row
+INGEST_BATCH_SIZE = 500
+
 # ID generation: LLINDEX, HASH, BOOK_PAGE_NUM
 # define the method to generate ID
 ID_GEN_METHOD = "HASH"
@@ -59,6 +73,23 @@ ADD_PHX_TRACING = True
 PHX_PORT = "7777"
 PHX_HOST = "0.0.0.0"
 
+# cache of the retrieval results for the questions
+RETRIEVAL_CACHE_SIZE = 1000
+# in sec.
+RETRIEVAL_CACHE_TTL = 3600
+# min cosine similarity between questions to reuse a result
+RETRIEVAL_CACHE_SIMILARITY = 0.95
+
+# client of the embedding and reranker model deployments
+# max connections kept alive and concurrent requests
+MD_POOL_SIZE = 10
+# timeout of a request, in sec.
+MD_TIMEOUT = 60
+# [query, text] pairs sent in a single request to the reranker
+RERANK_CHUNK_SIZE = 8
+# min sec. between refreshes of the security token of the LLM signer
+SIGNER_REFRESH_INTERVAL = 600
+
 #RAG Additional config
 CONDA_PACK_PATH = "oci://<bucket>@<namespace>/rag-oracle23db-poc_v3/gpu/PyTorch 2.0 for GPU on Python 3.9/2.0/pytorch20_p39_gpu_v2"
 
@@ -1,5 +1,8 @@
 import logging
 import re
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from typing import List
 
 # to generate id from text
@@ -12,7 +15,7 @@ from llama_index.core.node_parser import SentenceSplitter
 
 import oracledb
 
-from oracle_vector_db import save_embeddings_in_db
+from oracle_vector_db import save_embeddings_in_db, save_chunks_in_db
 
 # this way we don't show & share
 from config_private import (
@@ -35,6 +38,12 @@ from config import (
 
 # to create embeddings in batch
 BATCH_SIZE = 40
+# number of batches sent concurrently to the embedding model
+MAX_BATCHES_IN_FLIGHT = 4
+# number of processes reading and splitting the pdf files
+PARSE_WORKERS = 4
+# max number of books waiting to be embedded (or saved)
+PIPELINE_QUEUE_SIZE = 2
 
 #
 # Functions
@@ -148,15 +157,12 @@ def remove_short_pages(pages, threshold):
     """
     remove pages with < threshold chars
     """
-    n_removed = 0
-    for pag in pages:
-        if len(pag.text.split(" ")) < threshold:
-            pages.remove(pag)
-            n_removed += 1
+    # build a new list: removing from the list while iterating skips pages
+    long_pages = [pag for pag in pages if len(pag.text.split(" ")) >= threshold]
 
-    logging.info(f"Removed {n_removed} short pages...")
+    logging.info(f"Removed {len(pages) - len(long_pages)} short pages...")
 
-    return pages
+    return long_pages
 
 
 def check_tokenization_length(tokenizer, batch):
@@ -173,48 +179,31 @@ def check_tokenization_length(tokenizer, batch):
 def compute_embeddings(embed_model, nodes_text):
     """
     compute embeddings in batch
+
+    each batch is sent with a single call to the model,
+    with up to MAX_BATCHES_IN_FLIGHT batches processed concurrently.
+    The order of the embeddings is the order of nodes_text
     """
-    embeddings = []
-    for i in tqdm(range(0, len(nodes_text), BATCH_SIZE)):
-        batch = nodes_text[i : i + BATCH_SIZE]
+    batches = [
+        nodes_text[i : i + BATCH_SIZE] for i in range(0, len(nodes_text), BATCH_SIZE)
+    ]
 
+    def embed_batch(batch):
         # here we compute embeddings for a batch
-        #embeddings_batch = embed_model.embed_documents(batch)
-        #print("Model payload:")
-        #print([batch])
-        
-        for batch_temp in batch:
-            op=embed_model.verify(batch_temp)
-            #print(op['embeddings']); 
+        return embed_model.verify(batch)["embeddings"]
+
+    embeddings = []
+    with ThreadPoolExecutor(max_workers=MAX_BATCHES_IN_FLIGHT) as executor:
+        # map returns the results in the order of the batches
+        for embeddings_batch in tqdm(
+            executor.map(embed_batch, batches), total=len(batches)
+        ):
             # add to the final list
-            embeddings.extend(op['embeddings'])
+            embeddings.extend(embeddings_batch)
 
     return embeddings
 
 
-# this function is called once for each book
-# and saves in DB all the pages of the book + embeddings
-def save_chunks_in_db(pages_text, pages_id, pages_num, book_id, connection):
-    tot_errors = 0
-
-    with connection.cursor() as cursor:
-        logging.info("Saving texts to DB...")
-        cursor.setinputsizes(None, oracledb.DB_TYPE_CLOB)
-
-        for id, text, page_num in zip(tqdm(pages_id), pages_text, pages_num):
-            try:
-                cursor.execute(
-                    "insert into CHUNKS (ID, CHUNK, PAGE_NUM, DOCUMENTS_ID) values (:1, :2, :3, :4)",
-                    [id, text, page_num, book_id],
-                )
-            except Exception as e:
-                logging.error("Error in save chunks...")
-                logging.error(e)
-                tot_errors += 1
-
-    logging.info(f"Tot. errors in save_chunks: {tot_errors}")
-
-
 # with this function every book added to DB is registered with a unique id
 def register_document(book_name, connection):
     with connection.cursor() as cursor:
@@ -238,7 +227,96 @@ def register_document(book_name, connection):
 
     return new_key
 
+# get the id of a registered book, or register it
+def get_document_id(book_name, connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT MAX(ID) FROM DOCUMENTS WHERE NAME = :1", [book_name])
+        row = cursor.fetchone()
+
+    if row[0] is not None:
+        return row[0]
+
+    return register_document(book_name, connection)
+
+
+def load_saved_ids(connection):
+    """
+    return the set of the id already saved in VECTORS
+    """
+    with connection.cursor() as cursor:
+        cursor.arraysize = 10000
+        cursor.execute("SELECT ID FROM VECTORS")
+
+        return {row[0] for row in cursor}
+
+
+def read_and_split(book):
+    """
+    read and split a book, in pages or chunks depending on ENABLE_CHUNKING
+    runs in a worker process
+    """
+    if ENABLE_CHUNKING is False:
+        # chunks are pages
+        nodes_text, nodes_id, pages_num = read_and_split_in_pages([book])
+    else:
+        nodes_text, nodes_id, pages_num = read_and_split_in_chunks([book])
+
+    return book, nodes_text, nodes_id, pages_num
+
+
+def skip_saved_nodes(nodes_text, nodes_id, pages_num, saved_ids):
+    """
+    remove the nodes whose id is in saved_ids, and add the others to saved_ids
+    with HASH id the id is the hash of the text, so a node is saved only once
+    """
+    new_nodes = ([], [], [])
+
+    for text, id, page_num in zip(nodes_text, nodes_id, pages_num):
+        if id in saved_ids:
+            continue
+        saved_ids.add(id)
+        new_nodes[0].append(text)
+        new_nodes[1].append(id)
+        new_nodes[2].append(page_num)
+
+    return new_nodes
+
+
+def run_stage(name, input_queue, output_queue, process, errors):
+    """
+    a stage of the pipeline: takes books from input_queue, processes them
+    and puts the result in output_queue. None means no more books
+    """
+    try:
+        while True:
+            item = input_queue.get()
+            if item is None:
+                break
+            result = process(item)
+            if output_queue is not None:
+                output_queue.put(result)
+    except Exception as e:
+        logging.error(f"Error in {name}: {e}")
+        errors.append(e)
+        # drain the queue, so that the previous stage isn't blocked
+        while input_queue.get() is not None:
+            pass
+    finally:
+        if output_queue is not None:
+            output_queue.put(None)
+
+
 def load_documents(embedding_model):
+    """
+    read, split, embed and save in DB all the INPUT_FILES
+
+    It is a pipeline: books are read and split in PARSE_WORKERS processes,
+    while the embeddings of a book are computed the embeddings of the previous
+    book are saved. Queues between stages are bounded (PIPELINE_QUEUE_SIZE).
+
+    With ID_GEN_METHOD == "HASH" the chunks already saved in VECTORS
+    are skipped, so that running again on the same files is almost free.
+    """
     # connect to db
     # Configure logging
     logging.basicConfig(
@@ -251,34 +329,79 @@ def load_documents(embedding_model):
     with oracledb.connect(user=DB_USER, password=DB_PWD, dsn=DSN) as connection:
         logging.info("Successfully connected to Oracle Database...")
 
-        num_pages = []
-        for book in INPUT_FILES:
-            logging.info(f"Processing book: {book}...")
-
-            if ENABLE_CHUNKING is False:
-                # chunks are pages
-                logging.info("Chunks are pages of the book...")
-                nodes_text, nodes_id, pages_num = read_and_split_in_pages([book])
-                num_pages.append(len(nodes_text))
-            else:
-                logging.info(f"Enabled chunking, chunck_size: {MAX_CHUNK_SIZE}...")
-                nodes_text, nodes_id, pages_num = read_and_split_in_chunks([book])
-                
-                # create embeddings
-                # process in batch (max 96 for batch, chosen BATCH_SIZE, see above)
-                logging.info("Computing embeddings...")
-                embeddings = compute_embeddings(embedding_model, nodes_text)
-
-                # determine book_id and save in table BOOKS
-                logging.info("Registering document...")
-                book_id = register_document(book, connection)
-
-                # store embeddings
-                # here we save in DB
-                save_embeddings_in_db(embeddings, nodes_id, connection)
-
-                # store text chunks (pages for now)
-                save_chunks_in_db(nodes_text, nodes_id, pages_num, book_id, connection)
-
-                # a txn is a book
-                connection.commit()
\ No newline at end of file
+        if ID_GEN_METHOD == "HASH":
+            saved_ids = load_saved_ids(connection)
+            logging.info(f"Found {len(saved_ids)} chunks already saved...")
+        else:
+            # ids don't depend on the text, can't skip saved chunks
+            saved_ids = None
+
+        if ENABLE_CHUNKING is False:
+            logging.info("Chunks are pages of the book...")
+        else:
+            logging.info(f"Enabled chunking, chunck_size: {MAX_CHUNK_SIZE}...")
+
+        def embed(item):
+            book, nodes_text, nodes_id, pages_num = item
+            # create embeddings
+            # process in batch (max 96 for batch, chosen BATCH_SIZE, see above)
+            logging.info(f"Computing embeddings for {len(nodes_text)} chunks of {book}...")
+            embeddings = compute_embeddings(embedding_model, nodes_text)
+            return book, nodes_text, nodes_id, pages_num, embeddings
+
+        def save(item):
+            book, nodes_text, nodes_id, pages_num, embeddings = item
+
+            # determine book_id and save in table BOOKS
+            logging.info(f"Registering document {book}...")
+            book_id = get_document_id(book, connection)
+
+            # store embeddings
+            # here we save in DB
+            save_embeddings_in_db(embeddings, nodes_id, connection)
+
+            # store text chunks (pages for now)
+            save_chunks_in_db(nodes_text, nodes_id, pages_num, book_id, connection)
+
+            # a txn is a book
+            connection.commit()
+
+        embed_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        save_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        errors = []
+        stages = [
+            threading.Thread(
+                target=run_stage, args=("embed", embed_queue, save_queue, embed, errors)
+            ),
+            threading.Thread(
+                target=run_stage, args=("save", save_queue, None, save, errors)
+            ),
+        ]
+        for stage in stages:
+            stage.start()
+
+        try:
+            with ProcessPoolExecutor(max_workers=PARSE_WORKERS) as executor:
+                futures = [executor.submit(read_and_split, book) for book in INPUT_FILES]
+
+                for future in as_completed(futures):
+                    book, nodes_text, nodes_id, pages_num = future.result()
+                    n_read = len(nodes_text)
+
+                    if saved_ids is not None:
+                        nodes_text, nodes_id, pages_num = skip_saved_nodes(
+                            nodes_text, nodes_id, pages_num, saved_ids
+                        )
+
+                    logging.info(
+                        f"Read {n_read} chunks from {book}, {len(nodes_text)} new..."
+                    )
+                    if nodes_text and not errors:
+                        embed_queue.put((book, nodes_text, nodes_id, pages_num))
+        finally:
+            embed_queue.put(None)
+            for stage in stages:
+                stage.join()
+
+        if errors:
+            raise errors[0]
@@ -1,7 +1,3 @@
-import json
-import oci
-import requests
-
 from langchain_community.llms import OCIModelDeploymentVLLM
 import ads
 from langchain.chains import RetrievalQA
@@ -10,8 +6,9 @@ from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from langchain_core.documents import Document
 from langchain_core.retrievers import BaseRetriever
 from oracle_vector_db import oracle_query
-from config import COMMAND_MD_ENDPOINT, EMBEDDING_MD_ENDPOINT, RERANKER_MD_ENDPOINT, TOP_K
-from pprint import pprint
+from config import COMMAND_MD_ENDPOINT, TOP_K
+from retrieval_cache import RetrievalCache
+from model_deployment_client import ModelDeploymentClient, TokenRefresher
 
 ads.set_auth("resource_principal")
 command_md = OCIModelDeploymentVLLM(
@@ -20,19 +17,35 @@ command_md = OCIModelDeploymentVLLM(
 )
 model_name = f"<replace-with-your-model-name>"
 
+# results of the retrieval for previous questions
+retrieval_cache = RetrievalCache()
+# embedding and reranker models, sharing connections and signer
+md_client = ModelDeploymentClient()
+token_refresher = TokenRefresher()
+
 
 class CustomRetriever(BaseRetriever):
     def _get_relevant_documents(
         self, query: str, *, run_manager: CallbackManagerForRetrieverRun
     ) -> List[Document]:
+        cached_documents = retrieval_cache.get(query)
+        if cached_documents is not None:
+            print(f"Retrieval cache hit (exact): {retrieval_cache.stats()}")
+            return cached_documents
+
         matching_documents = []
         
         #Embedding model 
-        rps = oci.auth.signers.get_resource_principals_signer()
-        prediction = requests.post(EMBEDDING_MD_ENDPOINT, data=f'["{query}"]', auth=rps)
+        embedding = md_client.embed([query])[0]
+        cached_documents = retrieval_cache.get_similar(embedding)
+        if cached_documents is not None:
+            print(f"Retrieval cache hit (semantic): {retrieval_cache.stats()}")
+            return cached_documents
 
         #Search in DB
-        q_result = oracle_query(prediction.json()['embeddings'][0], TOP_K, True, False)
+        q_result = oracle_query(embedding, TOP_K, True, False)
+        if q_result is None:
+            return matching_documents
         text_list = []
         for n, id, sim in zip(q_result.nodes, q_result.ids, q_result.similarities):
             text_list.append(n.text)
@@ -41,16 +54,19 @@ class CustomRetriever(BaseRetriever):
         print(f'Reranker payload: {paired_list}')
         
         #ReRanker model
-        reranker_results = requests.post(RERANKER_MD_ENDPOINT, data=json.dumps(paired_list), auth=rps)  # make a prediction request        
-        max_value = max(reranker_results.json()['prediction'])
+        # chunks of pairs are scored in parallel
+        scores = md_client.rerank(query, text_list)
+        max_value = max(scores)
         if max_value < -3:
-            return matching_documents;
+            retrieval_cache.put(query, embedding, matching_documents)
+            return matching_documents
         # Find the index of the maximum value
-        max_index = reranker_results.json()['prediction'].index(max_value)
+        max_index = scores.index(max_value)
         print(f"The maximum value is: {max_value}")
         print(f"The index of the maximum value is: {max_index}")
         doc =  Document(page_content=paired_list[max_index][1], metadata={"source": "local"})        
         matching_documents.append(doc)
+        retrieval_cache.put(query, embedding, matching_documents)
         return matching_documents
 
 customRetriever = CustomRetriever()
@@ -72,9 +88,8 @@ def predict(data, model=load_model()):
     print(str)
     ads.set_auth("resource_principal")
     
-    pprint(vars(chain.combine_documents_chain.llm_chain.llm.auth['signer']))
-    chain.combine_documents_chain.llm_chain.llm.auth['signer'].refresh_security_token()
-    pprint(vars(chain.combine_documents_chain.llm_chain.llm.auth['signer']))
+    # refreshed at most every SIGNER_REFRESH_INTERVAL sec.
+    token_refresher.refresh(chain.combine_documents_chain.llm_chain.llm.auth['signer'])
     res = chain(data)
     print("\n")
     print("\n")
@@ -0,0 +1,269 @@
+"""
+File name: local_vector_store.py
+Python Version: 3.9
+
+Description:
+    This module provides LocalVectorStore, a Vector Store for llama-index
+    working without DB (offline or on the edge), a drop-in replacement
+    for OracleVectorStore. Vectors are searched with the IVF index of
+    ann_index.py, texts and metadata are kept in memory.
+
+    The store can be loaded from an export of the VECTORS and CHUNKS
+    tables (see export_oracle_tables).
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+    with oracledb.connect(...) as connection:
+        export_oracle_tables(connection, "chunks_export.jsonl")
+    v_store = LocalVectorStore.from_export("chunks_export.jsonl")
+    v_store.persist("local_index")
+    ...
+    v_store = LocalVectorStore.load("local_index")
+
+License:
+    This code is released under the MIT License.
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List
+
+from llama_index.core.schema import BaseNode, TextNode
+from llama_index.core.vector_stores.types import (
+    VectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+
+from ann_index import IVFIndex
+
+NODES_FILE = "nodes.jsonl"
+
+logger = logging.getLogger("ConsoleLogger")
+
+
+def export_oracle_tables(connection, export_path):
+    """
+    Export VECTORS, CHUNKS and the name of the documents in a JSONL file,
+    one chunk for line: id, embedding, text, file_name, page_label
+
+    Returns:
+        int: the number of chunks exported.
+    """
+    select = """select V.ID, V.VEC, C.CHUNK, C.PAGE_NUM, B.NAME
+                from VECTORS V, CHUNKS C, DOCUMENTS B
+                where C.ID = V.ID and
+                C.DOCUMENTS_ID = B.ID"""
+
+    n_rows = 0
+    with connection.cursor() as cursor:
+        cursor.arraysize = 1000
+        cursor.execute(select)
+
+        with open(export_path, "w", encoding="utf-8") as f:
+            for id, vec, chunk, page_num, name in cursor:
+                record = {
+                    "id": id,
+                    # VECTOR is fetched as array.array
+                    "embedding": list(vec),
+                    # CLOB
+                    "text": chunk.read() if hasattr(chunk, "read") else chunk,
+                    "file_name": name,
+                    "page_label": page_num,
+                }
+                f.write(json.dumps(record) + "\n")
+                n_rows += 1
+
+    logger.info(f"Exported {n_rows} chunks in {export_path}...")
+
+    return n_rows
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process Vector Store, with an IVF index on memory-mapped vectors
+
+    Args:
+        dim (int): dimension of the embeddings, if None set at the first add.
+        n_lists (int), n_probe (int), rescore_k (int), retrain_ratio (float):
+        see IVFIndex.
+        min_build_size (int): the index is built (clustered) when the store
+        has at least min_build_size vectors. Smaller stores are searched
+        by brute force.
+    """
+
+    stores_text: bool = True
+
+    def __init__(
+        self,
+        dim=None,
+        n_lists=None,
+        n_probe=8,
+        rescore_k=100,
+        retrain_ratio=2.0,
+        min_build_size=10000,
+        verbose=False,
+    ) -> None:
+        self.verbose = verbose
+        self.min_build_size = min_build_size
+        self._index_params = {
+            "n_lists": n_lists,
+            "n_probe": n_probe,
+            "rescore_k": rescore_k,
+            "retrain_ratio": retrain_ratio,
+        }
+
+        self.index = IVFIndex(dim, **self._index_params) if dim else None
+        # one for each row of the index
+        self.node_ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        # row of each node, deleted nodes are removed
+        self._rows: Dict[str, int] = {}
+
+    def add(
+        self,
+        nodes: List[BaseNode],
+    ) -> List[str]:
+        """Add nodes to index."""
+        if not nodes:
+            return []
+
+        if self.index is None:
+            self.index = IVFIndex(len(nodes[0].embedding), **self._index_params)
+
+        rows = self.index.add([node.embedding for node in nodes])
+        for node, row in zip(nodes, rows):
+            # a node added again replaces the previous one
+            self.delete_nodes([node.id_])
+            self.node_ids.append(node.id_)
+            self.texts.append(node.get_content())
+            self.metadata.append(node.metadata)
+            self._rows[node.id_] = int(row)
+
+        if not self.index.is_built and len(self.index) >= self.min_build_size:
+            logger.info(f"Building the index for {len(self.index)} vectors...")
+            self.index.build()
+
+        return [node.id_ for node in nodes]
+
+    def delete(self, node_id: str, **delete_kwargs: Any) -> None:
+        """
+        Delete the node with id node_id, if it is in the store
+        """
+        self.delete_nodes([node_id])
+
+    def delete_nodes(self, node_ids: List[str]) -> None:
+        """
+        Delete the nodes with ids node_ids. Their rows are masked in the index,
+        and their text and metadata are dropped
+        """
+        rows = [self._rows.pop(node_id) for node_id in node_ids if node_id in self._rows]
+        if not rows:
+            return
+
+        self.index.delete(rows)
+        for row in rows:
+            self.texts[row] = ""
+            self.metadata[row] = {}
+
+    def query(
+        self,
+        query: VectorStoreQuery,
+        **kwargs: Any,
+    ) -> VectorStoreQueryResult:
+        """Get nodes for response."""
+        if self.index is None:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        start_time = time.time()
+        rows, scores = self.index.search(
+            query.query_embedding, top_k=query.similarity_top_k
+        )
+
+        result_nodes = [
+            TextNode(id_=self.node_ids[row], text=self.texts[row], metadata=self.metadata[row])
+            for row in rows
+        ]
+
+        if self.verbose:
+            logger.info(f"Query duration: {round((time.time() - start_time) * 1000, 1)} msec.")
+
+        return VectorStoreQueryResult(
+            nodes=result_nodes,
+            similarities=[float(score) for score in scores],
+            ids=[self.node_ids[row] for row in rows],
+        )
+
+    def persist(self, persist_path=None, fs=None) -> None:
+        """
+        Save the index and the nodes in the directory persist_path
+        """
+        if self.index is None:
+            return
+
+        self.index.save(persist_path)
+
+        with open(os.path.join(persist_path, NODES_FILE), "w", encoding="utf-8") as f:
+            for node_id, text, metadata in zip(self.node_ids, self.texts, self.metadata):
+                f.write(json.dumps({"id": node_id, "text": text, "metadata": metadata}) + "\n")
+
+    @classmethod
+    def load(cls, persist_path, verbose=False) -> "LocalVectorStore":
+        """
+        Load a store saved with persist, the vectors are memory-mapped
+        """
+        v_store = cls(verbose=verbose)
+        v_store.index = IVFIndex.load(persist_path)
+        v_store._index_params = {
+            "n_lists": v_store.index.n_lists,
+            "n_probe": v_store.index.n_probe,
+            "rescore_k": v_store.index.rescore_k,
+            "retrain_ratio": v_store.index.retrain_ratio,
+        }
+
+        with open(os.path.join(persist_path, NODES_FILE), encoding="utf-8") as f:
+            for row, line in enumerate(f):
+                record = json.loads(line)
+                v_store.node_ids.append(record["id"])
+                v_store.texts.append(record["text"])
+                v_store.metadata.append(record["metadata"])
+                if not v_store.index.deleted[row]:
+                    v_store._rows[record["id"]] = row
+
+        return v_store
+
+    @classmethod
+    def from_export(cls, export_path, batch_size=10000, **kwargs) -> "LocalVectorStore":
+        """
+        Create a store from the JSONL written by export_oracle_tables
+        """
+        v_store = cls(**kwargs)
+
+        with open(export_path, encoding="utf-8") as f:
+            nodes = []
+            for line in f:
+                record = json.loads(line)
+                nodes.append(
+                    TextNode(
+                        id_=record["id"],
+                        text=record["text"],
+                        embedding=record["embedding"],
+                        metadata={
+                            "file_name": record["file_name"],
+                            "page_label": record["page_label"],
+                        },
+                    )
+                )
+                if len(nodes) == batch_size:
+                    v_store.add(nodes)
+                    nodes = []
+            v_store.add(nodes)
+
+        return v_store
@@ -0,0 +1,175 @@
+"""
+File name: retrieval_cache.py
+Python Version: 3.9
+
+Description:
+    This module provides a two-level cache for the results of the
+    retrieval (embedding + vector search + rerank) done for a question:
+    - an exact-match LRU cache on the normalized text of the question
+    - a semantic cache, reusing the result of a previous question whose
+      embedding has cosine similarity above a threshold
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+    cache = RetrievalCache()
+    docs = cache.get(query)
+    if docs is None:
+        embedding = ...
+        docs = cache.get_similar(embedding)
+    if docs is None:
+        docs = ...
+        cache.put(query, embedding, docs)
+
+License:
+    This code is released under the MIT License.
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config import (
+    RETRIEVAL_CACHE_SIZE,
+    RETRIEVAL_CACHE_TTL,
+    RETRIEVAL_CACHE_SIMILARITY,
+)
+
+
+def normalize_query(query: str) -> str:
+    """
+    lowercase, remove repeated blanks and the final punctuation
+    """
+    query = re.sub(r"\s+", " ", query.strip().lower())
+
+    return query.rstrip("?!. ")
+
+
+class RetrievalCache:
+    """
+    Thread safe cache of retrieval results, with TTL and LRU eviction.
+
+    Args:
+        max_size (int): max number of cached results.
+        ttl (float): seconds after which a result expires.
+        similarity_threshold (float): min cosine similarity between the
+        embeddings of two questions to reuse the result of the first.
+    """
+
+    def __init__(
+        self,
+        max_size=RETRIEVAL_CACHE_SIZE,
+        ttl=RETRIEVAL_CACHE_TTL,
+        similarity_threshold=RETRIEVAL_CACHE_SIMILARITY,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+
+        # normalized query -> (result, normalized embedding, expiration time)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def get(self, query: str) -> Optional[Any]:
+        """
+        Return the result cached for the same (normalized) question, or None
+        """
+        key = normalize_query(query)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > time.time():
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry[0]
+
+        return None
+
+    def get_similar(self, embedding: List[float]) -> Optional[Any]:
+        """
+        Return the result cached for the most similar question, if the
+        cosine similarity is above the threshold, otherwise None.
+        To be called after get(), it counts a miss when nothing is found
+        """
+        query_vector = _unit_vector(embedding)
+
+        with self._lock:
+            self._remove_expired()
+
+            if self._entries:
+                keys = list(self._entries.keys())
+                vectors = np.stack([entry[1] for entry in self._entries.values()])
+                similarities = vectors @ query_vector
+                best = int(np.argmax(similarities))
+
+                if similarities[best] >= self.similarity_threshold:
+                    self._entries.move_to_end(keys[best])
+                    self.semantic_hits += 1
+                    return self._entries[keys[best]][0]
+
+            self.misses += 1
+
+        return None
+
+    def put(self, query: str, embedding: List[float], result: Any):
+        """
+        Cache the result of the retrieval for a question
+        """
+        key = normalize_query(query)
+
+        with self._lock:
+            self._entries[key] = (
+                result,
+                _unit_vector(embedding),
+                time.time() + self.ttl,
+            )
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return the number of hits (exact and semantic) and misses,
+        and the hit rate
+        """
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            total = hits + self.misses
+
+            return {
+                "size": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / total, 3) if total else 0.0,
+            }
+
+    def _remove_expired(self):
+        now = time.time()
+        expired = [key for key, entry in self._entries.items() if entry[2] <= now]
+
+        for key in expired:
+            del self._entries[key]
+
+
+def _unit_vector(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+
+    return vector / norm if norm > 0 else vector
@@ -1,9 +1,12 @@
 # score.py 1.0 generated by ADS 2.8.9 on 20231213_231428
 import os
 from functools import lru_cache
+import numpy as np
 import onnxruntime as rt
  
 model_name = 'model-w-mean-pooling.onnx'
+# texts are sorted by length and padded to the longest of each micro batch
+MAX_BATCH_SIZE = 32
  
  
 """
@@ -30,6 +33,17 @@ def load_model(model_file_name=model_name):
         raise Exception(f'{model_file_name} is not found in model directory {model_dir}')
  
  
+@lru_cache(maxsize=1)
+def load_tokenizer():
+    """
+    Loads the tokenizer once, from the model directory
+    """
+    from transformers import BertTokenizer
+
+    model_dir = os.path.dirname(os.path.realpath(__file__))
+    return BertTokenizer.from_pretrained(model_dir)
+
+
 def pre_inference(data):
     """
     Preprocess data
@@ -44,13 +58,10 @@ def pre_inference(data):
     data: Data format after any processing.
  
     """
-    from transformers import BertTokenizer
-     
-    model_dir = os.path.dirname(os.path.realpath(__file__))
-    tokenizer = BertTokenizer.from_pretrained(model_dir)
-    inputs = tokenizer(data,return_tensors="np", padding=True)
-    onnx_inputs = {key: [l.tolist()for l in inputs[key] ] for key in inputs}
-    return onnx_inputs
+    tokenizer = load_tokenizer()
+    # padded to the longest text of data, the arrays are fed directly to the model
+    inputs = tokenizer(data, return_tensors="np", padding="longest", truncation=True)
+    return dict(inputs)
  
 def post_inference(outputs):
     """
@@ -64,10 +75,7 @@ def post_inference(outputs):
     -------
     yhat: Data format after any processing.
     """
-    outputs = [embed.tolist() for embed in outputs]
-#     for  embed in outputs:
-#         print(len(embed))
-    return outputs
+    return outputs.tolist()
  
 def predict(data, model=load_model()):
     """
@@ -85,7 +93,18 @@ def predict(data, model=load_model()):
         Format: {'prediction': output from model.predict method}
  
     """
-    onnx_transformed_input= pre_inference(data)
-     
-    embeds= model.run(None, dict(onnx_transformed_input))[0]
-    return {'embeddings':post_inference(embeds)}
\ No newline at end of file
+    if isinstance(data, str):
+        data = [data]
+
+    # sorting by length, the texts of a micro batch have similar length
+    # and little padding is needed
+    order = sorted(range(len(data)), key=lambda i: len(data[i]))
+    embeds = [None] * len(data)
+    for start in range(0, len(order), MAX_BATCH_SIZE):
+        indexes = order[start:start + MAX_BATCH_SIZE]
+        onnx_transformed_input = pre_inference([data[i] for i in indexes])
+        batch_embeds = model.run(None, onnx_transformed_input)[0]
+        for i, embed in zip(indexes, batch_embeds):
+            embeds[i] = embed
+
+    return {'embeddings': post_inference(np.stack(embeds)) if embeds else []}
\ No newline at end of file
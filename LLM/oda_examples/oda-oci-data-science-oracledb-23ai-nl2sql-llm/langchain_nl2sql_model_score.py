@@ -1,7 +1,3 @@
-import json
-import oci
-import requests
-
 from langchain_community.llms import OCIModelDeploymentVLLM
 import ads
 from oracle_vector_db import oracle_query, oracle_query
@@ -14,7 +10,7 @@ from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from langchain_core.documents import Document
 from langchain_core.retrievers import BaseRetriever
 from oracle_vector_db import oracle_query, oracle_query
-from config import COMMAND_MD_ENDPOINT, EMBEDDING_MD_ENDPOINT, RERANKER_MD_ENDPOINT, TOP_K
+from config import COMMAND_MD_ENDPOINT, TOP_K
 from pprint import pprint
 
 nl2sql_prompt_template = """ Given an input Question, create a syntactically correct Oracle SQL query to run. 
@@ -77,10 +73,6 @@ Can you please summarize the answer based on the data provided in the context? Y
 Summary:
 """
 
-import json
-import oci
-import requests
-
 from langchain_community.llms import OCIModelDeploymentVLLM
 import ads
 from oracle_vector_db import oracle_query, oracle_query
@@ -93,11 +85,12 @@ from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from langchain_core.documents import Document
 from langchain_core.retrievers import BaseRetriever
 from oracle_vector_db import oracle_query, oracle_query
-from config import COMMAND_MD_ENDPOINT, EMBEDDING_MD_ENDPOINT, RERANKER_MD_ENDPOINT, TOP_K
+from config import COMMAND_MD_ENDPOINT, TOP_K
+from retrieval_cache import RetrievalCache
+from model_deployment_client import ModelDeploymentClient, TokenRefresher
+from nl2sql_executor import SqlResultCache, execute_sql
 from pprint import pprint
 from langchain import PromptTemplate
-from config_private import DB_USER, DB_PWD, DB_HOST_IP, DB_SERVICE
-import oracledb
 import re
 
 ads.set_auth("resource_principal")
@@ -107,20 +100,38 @@ command_md = OCIModelDeploymentVLLM(
 )
 model_name = f"<replace-with-your-model-name>"
 
+# results of the retrieval for previous questions
+retrieval_cache = RetrievalCache()
+# embedding and reranker models, sharing connections and signer
+md_client = ModelDeploymentClient()
+token_refresher = TokenRefresher()
+# results of the generated queries
+sql_cache = SqlResultCache()
+
 
 class CustomRetriever(BaseRetriever):
     def _get_relevant_documents(
         self, query: str, *, run_manager: CallbackManagerForRetrieverRun
     ) -> List[Document]:
+        cached_documents = retrieval_cache.get(query)
+        if cached_documents is not None:
+            print(f"Retrieval cache hit (exact): {retrieval_cache.stats()}")
+            return cached_documents
+
         matching_documents = []
         
         #Embedding model 
-        rps = oci.auth.signers.get_resource_principals_signer()
         print(f"###Query {query}")
-        prediction = requests.post(EMBEDDING_MD_ENDPOINT, data=f'["{query}"]', auth=rps)
+        embedding = md_client.embed([query])[0]
+        cached_documents = retrieval_cache.get_similar(embedding)
+        if cached_documents is not None:
+            print(f"Retrieval cache hit (semantic): {retrieval_cache.stats()}")
+            return cached_documents
 
         #Search in DB
-        q_result = oracle_query(prediction.json()['embeddings'][0], TOP_K, True, False)        
+        q_result = oracle_query(embedding, TOP_K, True, False)
+        if q_result is None:
+            return matching_documents
         text_list = []
         for n, id, sim in zip(q_result.nodes, q_result.ids, q_result.similarities):
             text_list.append(n.text)
@@ -128,19 +139,22 @@ class CustomRetriever(BaseRetriever):
         
         #print(f'Reranker payload: {paired_list}')        
         #ReRanker model
-        reranker_results = requests.post(RERANKER_MD_ENDPOINT, data=json.dumps(paired_list), auth=rps)  # make a prediction request        
-        max_value = max(reranker_results.json()['prediction'])
+        # chunks of pairs are scored in parallel
+        scores = md_client.rerank(query, text_list)
+        max_value = max(scores)
         print(f"###Reranker Result Max value: {max_value}")
 
         if max_value < -13:
-            return matching_documents;
+            retrieval_cache.put(query, embedding, matching_documents)
+            return matching_documents
         # Find the index of the maximum value
-        max_index = reranker_results.json()['prediction'].index(max_value)
+        max_index = scores.index(max_value)
         #print(f"The maximum value is: {max_value}")
         #print(f"The index of the maximum value is: {max_index}")
         doc =  Document(page_content=paired_list[max_index][1], metadata={"source": "local"})        
         #print(f"###Contextttt: {doc}")
         matching_documents.append(doc)
+        retrieval_cache.put(query, embedding, matching_documents)
         return matching_documents
 
 
@@ -153,26 +167,10 @@ def load_model(model_file_name=model_name):
         return "default_model"
 
 def get_data_from_DB(query):
-    DSN = f"{DB_HOST_IP}/{DB_SERVICE}"
-    connection = oracledb.connect(user=DB_USER, password=DB_PWD, dsn=DSN, config_dir="/opt/oracle/config")
-    # Creating a cursor object
-    cursor = connection.cursor()
-
-    # Executing the query
-    cursor.execute(query)
-    # Fetching the column names
-    column_names = [desc[0] for desc in cursor.description]
-    result = ','.join(column_names) + '\n'
-
-    # Fetching and printing the results
-    for row in cursor:
-        row_values = [str(value).replace(',', ' ') for value in row]
-        result += ','.join(row_values) + '\n'
+    # pooled connection, with timeout and max number of rows
+    result = execute_sql(query)
     print(f"Query Result: {result}")
-    # Closing the cursor and connection
-    cursor.close()
-    connection.close()
-    return result;
+    return result
 
 def predict(data, model=load_model()):
     print(str)
@@ -186,7 +184,8 @@ def predict(data, model=load_model()):
     chain_type_kwargs={"prompt": prompt_template},
     retriever=customRetriever
 )
-    chain.combine_documents_chain.llm_chain.llm.auth['signer'].refresh_security_token()
+    # refreshed at most every SIGNER_REFRESH_INTERVAL sec.
+    token_refresher.refresh(chain.combine_documents_chain.llm_chain.llm.auth['signer'])
 
     res = chain(data)
     print(f"Output: {res['result']}")
@@ -203,8 +202,16 @@ def predict(data, model=load_model()):
         query_str = match
         
     query = query_str.replace(';', '')
-    result = get_data_from_DB(query)
-    
+
+    # the same query has the same result: skip the DB.
+    # the summary depends on the question too, it is always done
+    result = sql_cache.get(query)
+    if result is not None:
+        print(f"SQL cache hit: {sql_cache.stats()}")
+    else:
+        result = get_data_from_DB(query)
+        sql_cache.put(query, result)
+
     relational_data_summary_prompt = relational_data_summary_prompt_template.format(question=data, context_data=result)
     op=command_md.predict(relational_data_summary_prompt)
     print(f"Final Output: {op}")
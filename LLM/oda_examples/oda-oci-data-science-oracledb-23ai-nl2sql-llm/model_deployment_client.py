@@ -0,0 +1,166 @@
+"""
+File name: model_deployment_client.py
+Python Version: 3.9
+
+Description:
+    This module provides a client for the model deployments used by the RAG
+    (embedding and reranker models):
+    - a single HTTP session, keeping a pool of connections alive
+    - the resource principal signer is created once and cached
+    - requests can be sent concurrently (predict_async), the rerank of many
+      documents is split in chunks scored in parallel
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+    client = ModelDeploymentClient()
+    embedding = client.embed([query])[0]
+    scores = client.rerank(query, texts)
+
+License:
+    This code is released under the MIT License.
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, List
+
+import oci
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (
+    EMBEDDING_MD_ENDPOINT,
+    RERANKER_MD_ENDPOINT,
+    MD_POOL_SIZE,
+    MD_TIMEOUT,
+    RERANK_CHUNK_SIZE,
+    SIGNER_REFRESH_INTERVAL,
+)
+
+logger = logging.getLogger("ConsoleLogger")
+
+
+class ModelDeploymentClient:
+    """
+    Thread safe client for the predict endpoint of model deployments.
+
+    Args:
+        pool_size (int): max number of connections kept alive, for each host,
+        and max number of concurrent requests.
+        timeout (float): timeout of each request, in sec.
+    """
+
+    def __init__(self, pool_size=MD_POOL_SIZE, timeout=MD_TIMEOUT):
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix="md-client"
+        )
+
+        self._signer = None
+        self._signer_lock = threading.Lock()
+
+    def get_signer(self, renew=False):
+        """
+        Return the cached resource principal signer
+        """
+        with self._signer_lock:
+            if self._signer is None or renew:
+                self._signer = oci.auth.signers.get_resource_principals_signer()
+            return self._signer
+
+    def predict(self, endpoint: str, payload: Any) -> Any:
+        """
+        Send payload (as JSON) to the endpoint and return the JSON response.
+        If the request isn't authorized, the signer is created again and
+        the request retried once.
+        """
+        data = json.dumps(payload)
+
+        response = self.session.post(
+            endpoint, data=data, auth=self.get_signer(), timeout=self.timeout
+        )
+        if response.status_code == 401:
+            logger.info("Request not authorized, renewing the signer...")
+            response = self.session.post(
+                endpoint, data=data, auth=self.get_signer(renew=True), timeout=self.timeout
+            )
+        response.raise_for_status()
+
+        return response.json()
+
+    def predict_async(self, endpoint: str, payload: Any) -> Future:
+        """
+        Send the request in the background, return a Future for the response
+        """
+        return self.executor.submit(self.predict, endpoint, payload)
+
+    def embed(self, texts: List[str], endpoint=EMBEDDING_MD_ENDPOINT) -> List[List[float]]:
+        """
+        Return the embeddings of a list of texts
+        """
+        return self.predict(endpoint, texts)["embeddings"]
+
+    def rerank(
+        self,
+        query: str,
+        texts: List[str],
+        endpoint=RERANKER_MD_ENDPOINT,
+        chunk_size=RERANK_CHUNK_SIZE,
+    ) -> List[float]:
+        """
+        Return the score of each text for the query.
+        The [query, text] pairs are sent in chunks of chunk_size, in parallel
+        """
+        paired_list = [[query, text] for text in texts]
+
+        futures = [
+            self.predict_async(endpoint, paired_list[i : i + chunk_size])
+            for i in range(0, len(paired_list), chunk_size)
+        ]
+
+        scores = []
+        for future in futures:
+            scores.extend(future.result()["prediction"])
+
+        return scores
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+
+class TokenRefresher:
+    """
+    Refresh the security token of a signer at most every interval sec.,
+    instead of at every request
+    """
+
+    def __init__(self, interval=SIGNER_REFRESH_INTERVAL):
+        self.interval = interval
+        self._last_refresh = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, signer, force=False):
+        with self._lock:
+            last_refresh = self._last_refresh.get(id(signer))
+            if (
+                not force
+                and last_refresh is not None
+                and time.monotonic() - last_refresh < self.interval
+            ):
+                return
+            signer.refresh_security_token()
+            self._last_refresh[id(signer)] = time.monotonic()
@@ -0,0 +1,147 @@
+"""
+File name: nl2sql_executor.py
+Python Version: 3.9
+
+Description:
+    This module runs the SQL queries generated by the LLM:
+    - on a connection taken from the session pool of oracle_vector_db
+    - with a timeout, and fetching at most NL2SQL_MAX_ROWS rows
+    The results are cached, with a TTL,
+    using the normalized text of the query as key.
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+    result = sql_cache.get(query)
+    if result is None:
+        result = execute_sql(query)
+        sql_cache.put(query, result)
+
+License:
+    This code is released under the MIT License.
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from oracle_vector_db import get_pool
+
+from config import (
+    NL2SQL_MAX_ROWS,
+    NL2SQL_QUERY_TIMEOUT,
+    NL2SQL_CACHE_SIZE,
+    NL2SQL_CACHE_TTL,
+)
+
+logger = logging.getLogger("ConsoleLogger")
+
+
+# string literals, with their quotes escaped by doubling them
+STRING_LITERAL = re.compile(r"('(?:[^']|'')*')")
+
+
+def normalize_sql(query: str) -> str:
+    """
+    remove repeated blanks and the final semicolons, used as cache key.
+    string literals and the case are kept, they change the result
+    """
+    parts = STRING_LITERAL.split(query)
+    # odd parts are the literals
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r"\s+", " ", parts[i])
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def execute_sql(query: str, max_rows=NL2SQL_MAX_ROWS, timeout=NL2SQL_QUERY_TIMEOUT) -> str:
+    """
+    Execute the query and return the rows as CSV, the first line is the header.
+
+    Args:
+        query (str): the SQL query.
+        max_rows (int): max number of rows fetched. If the query returns
+        more rows, a final line says that the result has been truncated.
+        timeout (float): max duration of the query, in sec.
+    """
+    with get_pool().acquire() as connection:
+        # in msec., applies to each round trip
+        connection.call_timeout = int(timeout * 1000)
+        try:
+            with connection.cursor() as cursor:
+                # rows are fetched in a single round trip
+                cursor.arraysize = max_rows + 1
+                cursor.prefetchrows = max_rows + 2
+
+                cursor.execute(query)
+                column_names = [desc[0] for desc in cursor.description]
+                rows = cursor.fetchmany(max_rows + 1)
+        finally:
+            connection.call_timeout = 0
+
+    lines = [",".join(column_names)]
+    for row in rows[:max_rows]:
+        lines.append(",".join(str(value).replace(",", " ") for value in row))
+    if len(rows) > max_rows:
+        logger.info(f"Query result truncated to {max_rows} rows")
+        lines.append(f"(only the first {max_rows} rows are shown)")
+
+    return "\n".join(lines) + "\n"
+
+
+class SqlResultCache:
+    """
+    Thread safe cache of the results of the queries, with TTL and LRU eviction.
+    """
+
+    def __init__(self, max_size=NL2SQL_CACHE_SIZE, ttl=NL2SQL_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        # normalized query -> (result, expiration time)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query: str) -> Optional[Any]:
+        key = normalize_sql(query)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+
+        return None
+
+    def put(self, query: str, result: Any):
+        key = normalize_sql(query)
+
+        with self._lock:
+            self._entries[key] = (result, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
@@ -31,25 +31,34 @@ Warnings:
 
 import time
 import logging
+import bisect
+import threading
 
 import array
 from typing import List, Any, Dict
 from contextlib import contextmanager
 from tqdm import tqdm
 import oracledb
-import json
 from llama_index.core.vector_stores.types import (
     VectorStore,
     VectorStoreQuery,
     VectorStoreQueryResult,
 )
 
-import json
 from llama_index.core.schema import TextNode, BaseNode
 
 
 # load configs from here
 from config_private import DB_USER, DB_PWD, DB_HOST_IP, DB_SERVICE
+from config import (
+    DB_POOL_MIN,
+    DB_POOL_MAX,
+    DB_POOL_INCREMENT,
+    DB_STMT_CACHE_SIZE,
+    DB_CONFIG_DIR,
+    QUERY_LATENCY_BUCKETS_MS,
+    INGEST_BATCH_SIZE,
+)
 
 # But for now we don't need to compute the id.. it is set in the driving
 # code when the doc list is created
@@ -110,6 +119,119 @@ def optional_tracing(span_name):
         # provide a neutral context if no context is required
         yield None
 
+#
+# connection pool, shared by all the queries of the process
+#
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Return the session pool, creating it on first use.
+
+    The pool is sized with DB_POOL_MIN, DB_POOL_MAX and DB_POOL_INCREMENT
+    from config.py. Every pooled connection keeps a statement cache of
+    DB_STMT_CACHE_SIZE statements, so the vector search is parsed only once
+    per connection.
+    """
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = oracledb.create_pool(
+                    user=DB_USER,
+                    password=DB_PWD,
+                    dsn=f"{DB_HOST_IP}/{DB_SERVICE}",
+                    config_dir=DB_CONFIG_DIR,
+                    min=DB_POOL_MIN,
+                    max=DB_POOL_MAX,
+                    increment=DB_POOL_INCREMENT,
+                    stmtcachesize=DB_STMT_CACHE_SIZE,
+                    getmode=oracledb.POOL_GETMODE_WAIT,
+                )
+                logger.info(
+                    "Created DB pool (min=%s, max=%s)...", DB_POOL_MIN, DB_POOL_MAX
+                )
+    return _pool
+
+
+def close_pool():
+    """
+    Close the session pool, if created
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close(force=True)
+            _pool = None
+
+
+def clob_as_string(cursor, metadata):
+    """
+    Output type handler to fetch CLOB columns directly as str,
+    avoiding a round trip for each row to read the LOB
+    """
+    if metadata.type_code is oracledb.DB_TYPE_CLOB:
+        return cursor.var(oracledb.DB_TYPE_LONG, arraysize=cursor.arraysize)
+    return None
+
+
+class LatencyHistogram:
+    """
+    Thread safe histogram of latencies, in msec.
+
+    Args:
+        buckets (List[float]): the upper bounds of the buckets, in msec.
+        A last bucket collects all the values above the last bound.
+    """
+
+    def __init__(self, buckets=QUERY_LATENCY_BUCKETS_MS):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, elapsed_ms: float):
+        """
+        Register the latency of a single query
+        """
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, elapsed_ms)] += 1
+            self.count += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Return count, mean, max and the count for each bucket,
+        the buckets are labelled with their upper bound ("le")
+        """
+        with self._lock:
+            labels = [f"<={b}" for b in self.buckets] + [f">{self.buckets[-1]}"]
+            return {
+                "count": self.count,
+                "mean_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+                "max_ms": round(self.max_ms, 2),
+                "buckets": dict(zip(labels, self.counts)),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.count = 0
+            self.total_ms = 0.0
+            self.max_ms = 0.0
+
+
+# latency of all the calls to oracle_query
+query_latency = LatencyHistogram()
+
+
 def oracle_query(
     embed_query: List[float], top_k: int = 2, verbose=False, approximate=False
 ):
@@ -134,58 +256,57 @@ def oracle_query(
     """
     start_time = time.time()
 
-    # build the DSN from data taken from config.py
-    DSN = f"{DB_HOST_IP}/{DB_SERVICE}"
+    # 'f' single precision 'd' double precision
+    array_type = "d" if EMBEDDINGS_BITS == 64 else "f"
+    # the array is bound natively as a VECTOR
+    array_query = array.array(array_type, embed_query)
+
+    approx_clause = ""
+
+    if approximate:
+        # mean use HNSW indexes
+        approx_clause = "APPROXIMATE"
+
+    # changed select adding books (39/12/2023)
+    # changed distance to COSINE
+    # top_k is a bind variable, so that the statement is cached only once
+    select = f"""select V.id, C.CHUNK, C.PAGE_NUM,
+                VECTOR_DISTANCE(V.VEC, :1, COSINE) as d,
+                B.NAME 
+                from VECTORS V, CHUNKS C, DOCUMENTS B
+                where C.ID = V.ID and
+                C.DOCUMENTS_ID = B.ID
+                order by d
+                FETCH {approx_clause} FIRST :2 ROWS ONLY"""
 
+    if verbose:
+        logger.info(f"SQL Query: {select}")
 
     try:
-        with oracledb.connect(user=DB_USER, password=DB_PWD, dsn=DSN) as connection:
+        with get_pool().acquire() as connection:
             with connection.cursor() as cursor:
-                # 'f' single precision 'd' double precision
-                array_type = "d" if EMBEDDINGS_BITS == 64 else "f"
-                array_query = array.array(array_type, embed_query)
-                vector_list = array_query.tolist()
-                vector_str = json.dumps(vector_list)
-                approx_clause = ""
-
-                if approximate:
-                    # mean use HNSW indexes
-                    approx_clause = "APPROXIMATE"
-
-                # changed select adding books (39/12/2023)
-                # changed distance to COSINE
-                select = f"""select V.id, C.CHUNK, C.PAGE_NUM,
-                            VECTOR_DISTANCE(V.VEC, :1, COSINE) as d,
-                            B.NAME 
-                            from VECTORS V, CHUNKS C, DOCUMENTS B
-                            where C.ID = V.ID and
-                            C.DOCUMENTS_ID = B.ID
-                            order by d
-                            FETCH {approx_clause} FIRST {top_k} ROWS ONLY"""
-
-                if verbose:
-                    logger.info(f"SQL Query: {select}")
-
-                cursor.execute(select, [array_query])
-                rows = cursor.fetchall()
+                # CLOB are fetched as str
+                cursor.outputtypehandler = clob_as_string
+                cursor.arraysize = top_k
+                cursor.prefetchrows = top_k + 1
 
-                result_nodes, node_ids, similarities = [], [], []
+                cursor.execute(select, [array_query, top_k])
+                rows = cursor.fetchall()
 
-                # prepare output
-                for row in rows:
-                    # row[1] is a clob
-                    full_clob_data = row[1].read()
+        result_nodes, node_ids, similarities = [], [], []
 
-                    # 29/12: added book_name to metadata
-                    result_nodes.append(
-                        TextNode(
-                            id_=row[0],
-                            text=full_clob_data,
-                            metadata={"file_name": row[4], "page_label": row[2]},
-                        )
-                    )
-                    node_ids.append(row[0])
-                    similarities.append(row[3])
+        # prepare output
+        for row in rows:
+            # 29/12: added book_name to metadata
+            result_nodes.append(
+                TextNode(
+                    id_=row[0],
+                    text=row[1],
+                    metadata={"file_name": row[4], "page_label": row[2]},
+                )
+            )
+            node_ids.append(row[0])
+            similarities.append(row[3])
 
     except Exception as e:
         logger.error(f"Error occurred in oracle_query: {e}")
@@ -196,6 +317,7 @@ def oracle_query(
     )
 
     elapsed_time = time.time() - start_time
+    query_latency.observe(elapsed_time * 1000)
 
     if verbose:
         logger.info(f"Query duration: {round(elapsed_time, 1)} sec.")
@@ -203,56 +325,100 @@ def oracle_query(
     return q_result
 
 
-def save_embeddings_in_db(embeddings, pages_id, connection):
+def executemany_in_batches(cursor, sql, rows, batch_size, label):
+    """
+    Insert rows with executemany, in batches of batch_size rows.
+
+    Rows in error don't abort the batch: with batcherrors they're reported
+    (and counted) at the end of each batch.
+
+    Args:
+        cursor: the cursor used for the inserts.
+        sql (str): the insert statement.
+        rows (List[list]): the bind values, one list for each row.
+        batch_size (int): the max number of rows sent in a single round trip.
+        label (str): the name used in the log messages.
+
+    Returns:
+        int: the number of rows in error.
+    """
+    tot_errors = 0
+    start_time = time.time()
+
+    for i in tqdm(range(0, len(rows), batch_size)):
+        batch = rows[i : i + batch_size]
+        cursor.executemany(sql, batch, batcherrors=True)
+
+        for error in cursor.getbatcherrors():
+            logger.error(
+                f"Error in {label}, row {batch[error.offset][0]}: {error.message}"
+            )
+            tot_errors += 1
+
+    elapsed_time = time.time() - start_time
+    rows_per_sec = len(rows) / elapsed_time if elapsed_time > 0 else 0.0
+
+    logger.info(
+        f"Saved {len(rows) - tot_errors} rows in {label} "
+        f"in {round(elapsed_time, 1)} sec. ({round(rows_per_sec)} rows/sec)"
+    )
+    logger.info(f"Tot. errors in {label}: {tot_errors}")
+
+    return tot_errors
+
+
+def save_embeddings_in_db(
+    embeddings, pages_id, connection, batch_size=INGEST_BATCH_SIZE
+):
     """
     save the embeddings vector in Oracle DB
     pages_id: list with page numbers to save as metadata
+    batch_size: rows inserted with a single executemany, 1 means row by row
     """
-    tot_errors = 0
+    # 'f' single precision 'd' double precision
+    array_type = "d" if EMBEDDINGS_BITS == 64 else "f"
+
+    # vectors are bound natively as VECTOR
+    rows = [
+        [id, array.array(array_type, vector)]
+        for id, vector in zip(pages_id, embeddings)
+    ]
 
     with connection.cursor() as cursor:
-        logging.info("Saving embeddings to DB...")
-
-        for id, vector in zip(tqdm(pages_id), embeddings):
-            # 'f' single precision 'd' double precision
-            array_type = "d" if EMBEDDINGS_BITS == 64 else "f"
-            logging.info(array_type)
-            input_array = array.array(array_type, vector)
-            vector_list = input_array.tolist()
-            vector_str = json.dumps(vector_list)
-
-            try:
-                # insert single embedding
-                cursor.execute("insert into VECTORS values (:1, :2)", [id, vector_str])
-            except Exception as e:
-                logging.error("Error in save embeddings...")
-                logging.error(e)
-                tot_errors += 1
-
-    logging.info(f"Tot. errors in save_embeddings: {tot_errors}")    
-
-def save_chunks_in_db(pages_text, pages_id, pages_num, book_id, connection):
+        logger.info("Saving embeddings to DB...")
+
+        return executemany_in_batches(
+            cursor,
+            "insert into VECTORS values (:1, :2)",
+            rows,
+            batch_size,
+            "save_embeddings",
+        )
+
+
+def save_chunks_in_db(
+    pages_text, pages_id, pages_num, book_id, connection, batch_size=INGEST_BATCH_SIZE
+):
     """
     Save the chunks of text in the DB
+    batch_size: rows inserted with a single executemany, 1 means row by row
     """
-    tot_errors = 0
+    rows = [
+        [id, text, page_num, book_id]
+        for id, text, page_num in zip(pages_id, pages_text, pages_num)
+    ]
 
     with connection.cursor() as cursor:
         logger.info("Saving texts to DB...")
         cursor.setinputsizes(None, oracledb.DB_TYPE_CLOB)
 
-        for id, text, page_num in zip(tqdm(pages_id), pages_text, pages_num):
-            try:
-                cursor.execute(
-                    "insert into CHUNKS (ID, CHUNK, PAGE_NUM, BOOK_ID) values (:1, :2, :3, :4)",
-                    [id, text, page_num, book_id],
-                )
-            except Exception as e:
-                logger.error("Error in save chunks...")
-                logger.error(e)
-                tot_errors += 1
-
-    logger.info(f"Tot. errors in save_chunks: {tot_errors}")
+        return executemany_in_batches(
+            cursor,
+            "insert into CHUNKS (ID, CHUNK, PAGE_NUM, DOCUMENTS_ID) values (:1, :2, :3, :4)",
+            rows,
+            batch_size,
+            "save_chunks",
+        )
 
 
 #
@@ -276,6 +442,15 @@ class OracleVectorStore(VectorStore):
         # initialize the cache
         self.node_dict: Dict[str, BaseNode] = {}
 
+        # the pool is created here, not at the first query
+        get_pool()
+
+    def latency_histogram(self) -> Dict[str, Any]:
+        """
+        Return the histogram of the latencies of the queries, in msec.
+        """
+        return query_latency.snapshot()
+
     # get method is NOT needed
 
     def add(
@@ -345,9 +520,7 @@ class OracleVectorStore(VectorStore):
                 embeddings.append(node.embedding)
                 pages_num.append(node.metadata["page_label"])
 
-            with oracledb.connect(
-                user=DB_USER, password=DB_PWD, dsn=self.DSN
-            ) as connection:
+            with get_pool().acquire() as connection:
                 save_embeddings_in_db(embeddings, pages_id, connection)
 
                 # TODO: where should I get book_id?
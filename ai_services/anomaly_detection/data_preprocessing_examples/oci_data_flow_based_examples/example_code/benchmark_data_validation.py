@@ -0,0 +1,118 @@
+from pyspark.sql import SparkSession
+import argparse
+import time
+
+from data_validation import (
+    all_columns_null,
+    has_bad_format,
+    is_duplicate,
+    is_null,
+    is_sorted,
+    is_sufficient_datapoints,
+    valid_dtype,
+    valid_header,
+    valid_num_of_columns,
+    valid_num_of_datapoints,
+    validation_report,
+)
+
+
+def create_spark_session(session_name):
+    """
+    Create a Spark session
+    Args:
+        session_name: name to be assigned to the spark session
+    Return:
+        a spark session
+    """
+    spark_session = SparkSession.builder.appName(session_name).getOrCreate()
+    return spark_session
+
+
+def check_by_check(df):
+    """
+    Run each validation check as a separate Spark job, as validate_data did,
+    without stopping at the first failed check
+    Args:
+        df: input dataframe
+
+    Return:
+        a dict with the result of each check
+    """
+    results = {
+        "header_valid": valid_header(df),
+        "num_of_datapoints": valid_num_of_datapoints(df),
+        "num_of_columns": valid_num_of_columns(df),
+        "all_columns_null": all_columns_null(df),
+        "sufficient_datapoints": is_sufficient_datapoints(df),
+        "numeric": all(valid_dtype(df, c, "double") for c in df.columns if c != "timestamp"),
+    }
+    if "timestamp" in df.columns:
+        results["missing_timestamp"] = is_null(df, "timestamp")
+        results["duplicate_timestamp"] = is_duplicate(df, ["timestamp"])
+        results["bad_format"] = has_bad_format(df)
+        results["sorted"] = is_sorted(df)
+    return results
+
+
+def run(spark, name, function, df, repeat):
+    """
+    Return the result of function(df), the best time in seconds over repeat runs,
+    and the number of Spark jobs of a run
+    """
+    best_time = None
+    for i in range(repeat):
+        group = f"{name}-{time.time_ns()}"
+        spark.sparkContext.setJobGroup(group, group)
+        start_time = time.perf_counter()
+        result = function(df)
+        elapsed = time.perf_counter() - start_time
+        best_time = elapsed if best_time is None else min(best_time, elapsed)
+        num_jobs = len(spark.sparkContext.statusTracker().getJobIdsForGroup(group))
+    spark.sparkContext.setJobGroup("", "")
+    return result, best_time, num_jobs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--input",
+        required=True,
+        nargs="+",
+        help="CSV written by generate_synthetic_data.py, e.g. <output>/uniform",
+    )
+    parser.add_argument("--repeat", required=False, type=int, default=3)
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="cache the input in memory, by default each Spark job reads it again, as in data_validation.py",
+    )
+    args = parser.parse_args()
+
+    spark = create_spark_session("pySpark_data_validation_benchmark")
+
+    print(f"{'dataset':<40}{'rows':>10}{'columns':>9}{'checks s':>10}{'jobs':>6}{'single s':>10}{'jobs':>6}")
+    for path in args.input:
+        df = spark.read.csv(path, sep=",", inferSchema=False, header=True)
+        if args.cache:
+            df = df.cache()
+            df.count()
+
+        checks, checks_time, checks_jobs = run(spark, "checks", check_by_check, df, args.repeat)
+        report, report_time, report_jobs = run(spark, "report", validation_report, df, args.repeat)
+
+        print(
+            f"{path[-40:]:<40}{report['num_rows']:>10}{len(df.columns):>9}"
+            f"{checks_time:>10.2f}{checks_jobs:>6}{report_time:>10.2f}{report_jobs:>6}"
+        )
+        if report["timestamp"] is not None and (
+            checks["duplicate_timestamp"] != (report["timestamp"]["duplicates"] > 0)
+            or checks["bad_format"] != (report["timestamp"]["bad_format"] > 0)
+            or checks["sorted"] != (report["timestamp"]["unsorted"] == 0)
+        ):
+            print(f"  timestamp checks differ: {checks} {report['timestamp']}")
+        df.unpersist()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,18 @@
 from pyspark.sql import SparkSession
 from pyspark.sql import functions as F
+from pyspark.sql import Window
 import argparse
 from datetime import datetime
 
 MAX_NUM_COL = 300
 MAX_DATAPOINTS = 100
+# ISO 8601, the timestamps accepted by datetime.strptime(ts, "%Y-%m-%dT%H:%M:%SZ"):
+# fields of one or two digits, a day padded with a space, T and Z in any case.
+# Year 0 and days out of the month are checked separately.
+TIMESTAMP_PATTERN = (
+    r"(?i)^(\d{4})-(1[0-2]|0[1-9]|[1-9])-(3[01]|[12]\d|0[1-9]| ?[1-9])"
+    r"T(2[0-3]|[01]\d|\d):([0-5]\d|\d):([0-5]\d|\d)Z$"
+)
 
 
 def create_spark_session(session_name):
@@ -20,7 +28,7 @@ def create_spark_session(session_name):
 
 
 def is_null(df, column):
-    return df.filter(F.col(column).isNull() | F.isnan(column)).count() > 0
+    return df.filter(is_null_or_nan(column, dict(df.dtypes)[column])).count() > 0
 
 
 def is_duplicate(df, columns):
@@ -61,6 +69,15 @@ def validate_timestamp(df):
     if is_duplicate(df, ["timestamp"]):
         raise ValueError("Duplicate timestamp!")
 
+    # check if format is iso 8601
+    if has_bad_format(df):
+        raise ValueError("timestamps not is ISO 8601 format")
+    # check if timestamps are given sorted
+    if not is_sorted(df):
+        raise ValueError("timestamps not sorted!")
+
+
+def has_bad_format(df):
     def validate(ts, fmt="%Y-%m-%dT%H:%M:%SZ"):
         try:
             datetime.strptime(str(ts), fmt)
@@ -69,12 +86,15 @@ def validate_timestamp(df):
         return False
 
     validate_timestamp = F.udf(lambda x: validate(x))
-    # check if format is iso 8601
     df = df.withColumn("isbad", validate_timestamp(F.col("timestamp")))
+    return df.where(df.isbad == True).count() > 0
 
-    if df.where(df.isbad == True).count() > 0:
-        raise ValueError("timestamps not is ISO 8601 format")
-    # check if timestamps are given sorted
+
+def orderby_timestamp(df):
+    return df.orderBy("timestamp")
+
+
+def is_sorted(df):
     df = df.withColumn("idx1", F.monotonically_increasing_id())
     df = orderby_timestamp(df)
     df = df.withColumn("idx2", F.monotonically_increasing_id())
@@ -82,8 +102,7 @@ def validate_timestamp(df):
         "not_sorted",
         F.when((F.col("idx1") != F.col("idx2")), True).otherwise(False),
     )
-    if df.where(df.not_sorted == True).count() > 0:
-        raise ValueError("timestamps not sorted!")
+    return df.where(df.not_sorted == True).count() == 0
 
 
 def valid_num_of_columns(df):
@@ -108,32 +127,201 @@ def is_sufficient_datapoints(df):
 
 
 def all_columns_null(df):
+    dtypes = dict(df.dtypes)
     for c in df.columns:
         if c == "timestamp":
             continue
-        if df.filter(F.col(c).isNull() | F.isnan(c)).count() != df.count():
+        if df.filter(is_null_or_nan(c, dtypes[c])).count() != df.count():
             return False
     return True
 
 
-def validate_data(df):
+def is_null_or_nan(column, data_type):
+    """
+    Null condition of a column, NaN is only checked for floating point types.
+    A string is NaN if casting it to double gives NaN, but it's compared
+    as text: the cast fails on other strings when ANSI mode is on
+    """
+    condition = F.col(column).isNull()
+    if data_type in ("double", "float"):
+        condition = condition | F.isnan(column)
+    elif data_type == "string":
+        condition = condition | (F.lower(F.trim(F.col(column))) == "nan")
+    return condition
+
+
+def timestamp_key(column):
+    """
+    Sort key of the timestamps in ISO 8601 format (see TIMESTAMP_PATTERN), Null for the others.
+    The fields are extracted as numbers, without a datetime parser, which raises errors on
+    invalid values in ANSI mode or with the default spark.sql.legacy.timeParserPolicy
+    """
+    text = F.col(column).cast("string")
+
+    def field(index):
+        # "0" when the pattern doesn't match, so that the cast never fails
+        return F.concat(F.lit("0"), F.trim(F.regexp_extract(text, TIMESTAMP_PATTERN, index))).cast("long")
+
+    year, month, day, hour, minute, second = [field(i) for i in range(1, 7)]
+    leap_year = ((year % 4 == 0) & (year % 100 != 0)) | (year % 400 == 0)
+    days_in_month = (
+        F.when(month == 2, F.when(leap_year, 29).otherwise(28))
+        .when(month.isin(4, 6, 9, 11), 30)
+        .otherwise(31)
+    )
+    valid = text.rlike(TIMESTAMP_PATTERN) & (year >= 1) & (day <= days_in_month)
+    key = ((((year * 100 + month) * 100 + day) * 100 + hour) * 100 + minute) * 100 + second
+    return F.when(valid, key)
 
-    if not valid_header(df):
+
+def validation_report(df):
+    """
+    Compute all the validation checks in a single aggregation over the data,
+    and the number of distinct timestamps in a second job, instead of one Spark
+    job for each check and each column
+    Args:
+        df: input dataframe
+
+    Return:
+        a dict with
+            num_rows: number of data points
+            num_signals: number of columns, without timestamp
+            header_valid: False if the timestamp column is missing or a column has no name
+            null_counts: number of Null/NaN values in each column
+            non_numeric_columns: signal columns whose dtype is not double
+            timestamp: counts of missing, duplicate, not ISO 8601 and unsorted timestamps
+                (in time order), None if there is no timestamp column
+    """
+    columns = df.columns
+    dtypes = df.dtypes
+    has_timestamp = "timestamp" in columns
+
+    # the rows are narrowed to a Null flag for each column before the window,
+    # which sorts the rows of each partition
+    flags = [
+        F.when(is_null_or_nan(c, data_type), 1).otherwise(0).alias(f"null_{i}")
+        for i, (c, data_type) in enumerate(dtypes)
+    ]
+    aggregates = [F.count(F.lit(1)).alias("num_rows")]
+    aggregates += [F.sum(f"null_{i}").alias(f"null_{i}") for i in range(len(columns))]
+
+    if not has_timestamp:
+        df = df.select(*flags)
+    else:
+        timestamps = df.select("timestamp")
+        # the row id keeps the order of the input, its upper bits are the partition id
+        df = df.select(
+            *flags,
+            F.col("timestamp"),
+            F.monotonically_increasing_id().alias("_row_id"),
+            F.spark_partition_id().alias("_partition_id"),
+            timestamp_key("timestamp").alias("_ts"),
+        )
+        # compare each timestamp with the previous one, within each partition
+        window = Window.partitionBy("_partition_id").orderBy("_row_id")
+        df = (
+            df.withColumn("_prev_ts", F.lag("_ts").over(window))
+            .withColumn("_prev_row_id", F.lag("_row_id").over(window))
+            .withColumn("_next_row_id", F.lead("_row_id").over(window))
+        )
+        aggregates += [
+            F.sum(
+                F.when(F.col("timestamp").isNotNull() & F.col("_ts").isNull(), 1).otherwise(0)
+            ).alias("bad_format"),
+            F.sum(F.when(F.col("_ts") < F.col("_prev_ts"), 1).otherwise(0)).alias("unsorted"),
+            # first and last timestamp of each partition, to compare the partitions with each other
+            F.collect_list(
+                F.when(
+                    F.col("_prev_row_id").isNull() | F.col("_next_row_id").isNull(),
+                    F.struct("_row_id", "_ts"),
+                )
+            ).alias("boundaries"),
+        ]
+
+    result = df.agg(*aggregates).collect()[0]
+    if has_timestamp:
+        # a second job on the timestamp column only: with the other aggregates,
+        # countDistinct duplicates every row (Expand) and is slower than a separate scan
+        missing_timestamp = is_null_or_nan("timestamp", dict(dtypes)["timestamp"])
+        distinct_timestamps = timestamps.where(~missing_timestamp).distinct().count()
+
+    num_rows = result["num_rows"]
+    report = {
+        "num_rows": num_rows,
+        "num_signals": len(columns) - 1,
+        "header_valid": all(c.replace(" ", "") != "" for c in columns) and has_timestamp,
+        "null_counts": {c: result[f"null_{i}"] or 0 for i, c in enumerate(columns)},
+        "non_numeric_columns": [
+            c for c, data_type in dtypes if c != "timestamp" and data_type != "double"
+        ],
+        "timestamp": None,
+    }
+
+    if has_timestamp:
+        unsorted = result["unsorted"] or 0
+        previous_ts = None
+        for boundary in sorted(result["boundaries"], key=lambda b: b["_row_id"]):
+            if boundary["_ts"] is None:
+                continue
+            if previous_ts is not None and boundary["_ts"] < previous_ts:
+                unsorted += 1
+            previous_ts = boundary["_ts"]
+
+        missing = report["null_counts"]["timestamp"]
+        report["timestamp"] = {
+            "missing": missing,
+            # the missing timestamps are not counted in distinct_timestamps
+            "duplicates": num_rows - missing - distinct_timestamps,
+            "bad_format": result["bad_format"] or 0,
+            "unsorted": unsorted,
+        }
+
+    return report
+
+
+def check_report(report):
+    """
+    Raise the error of the first failed check of a validation report,
+    in the order of validate_data
+    Args:
+        report: output of validation_report
+    """
+    if not report["header_valid"]:
         raise ValueError("Invalid header")
-    if not valid_num_of_datapoints(df):
+    if report["num_rows"] > MAX_DATAPOINTS:
         raise ValueError(f"Number of data points exceed {MAX_DATAPOINTS}")
-    if not valid_num_of_columns(df):
+    if report["num_signals"] > MAX_NUM_COL:
         raise ValueError(f"Number of signals exceed {MAX_NUM_COL}")
-    if all_columns_null(df):
+    if all(n == report["num_rows"] for c, n in report["null_counts"].items() if c != "timestamp"):
         raise ValueError("At least one none Null column required")
-    if not is_sufficient_datapoints(df):
+    if report["num_rows"] < 6 * MAX_NUM_COL:
         raise ValueError("Insufficient sample_datasets")
-    for col in df.columns:
-        if col == "timestamp":
-            continue
-        if not valid_dtype(df, col, "double"):
-            raise TypeError(f"Data type of column {col} is not numeric")
-    validate_timestamp(df)
+    if report["non_numeric_columns"]:
+        raise TypeError(f"Data type of column {report['non_numeric_columns'][0]} is not numeric")
+
+    timestamp = report["timestamp"]
+    if timestamp["missing"] > 0:
+        raise ValueError("Missing timestamp!")
+    if timestamp["duplicates"] > 0:
+        raise ValueError("Duplicate timestamp!")
+    if timestamp["bad_format"] > 0:
+        raise ValueError("timestamps not is ISO 8601 format")
+    if timestamp["unsorted"] > 0:
+        raise ValueError("timestamps not sorted!")
+
+
+def validate_data(df):
+    """
+    Validate the input data for OCI Anomaly Detection
+    Args:
+        df: input dataframe
+
+    Return:
+        the validation report, see validation_report
+    """
+    report = validation_report(df)
+    check_report(report)
+    return report
 
 
 def main():
@@ -0,0 +1,62 @@
+import datetime
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+
+class FakeAnomalyDetectionClient:
+    """
+    Local stand-in for AnomalyDetectionClient, to run the tuner without the service.
+
+    A timestamp is anomalous when the absolute z-score of its value, with respect to the previous window_size - 1
+    values, is above a threshold decreasing with the sensitivity. As with the service, a higher sensitivity
+    detects more anomalies, and the first window_size - 1 timestamps have no detection.
+    """
+
+    def __init__(self, window_size: int = 10, latency_seconds: float = 0.0, max_score: float = 6.0):
+        self.window_size = window_size
+        self.latency_seconds = latency_seconds
+        self.max_score = max_score
+        self.calls = 0
+
+    def get_model(self, model_id):
+        return SimpleNamespace(data=SimpleNamespace(
+            id=model_id,
+            model_training_results=SimpleNamespace(window_size=self.window_size)))
+
+    def detect_anomalies(self, detect_anomalies_details, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency_seconds)
+
+        items = detect_anomalies_details.data
+        signal_names = detect_anomalies_details.signal_names
+        values = np.array([item.values for item in items], dtype=float)
+        threshold = (1 - detect_anomalies_details.sensitivity) * self.max_score
+
+        detection_results = []
+        for i in range(self.window_size - 1, len(items)):
+            history = values[i - self.window_size + 1:i]
+            mean = history.mean(axis=0)
+            std = history.std(axis=0) + 1e-9
+            scores = np.abs(values[i] - mean) / std
+            anomalies = [
+                SimpleNamespace(signal_name=name,
+                                actual_value=values[i][j],
+                                estimated_value=mean[j],
+                                anomaly_score=min(scores[j] / self.max_score, 1.0))
+                for j, name in enumerate(signal_names) if scores[j] > threshold
+            ]
+            detection_results.append(SimpleNamespace(
+                timestamp=_parse_timestamp(items[i].timestamp),
+                anomalies=anomalies))
+
+        return SimpleNamespace(data=SimpleNamespace(detection_results=detection_results))
+
+
+def _parse_timestamp(timestamp) -> datetime.datetime:
+    if not isinstance(timestamp, datetime.datetime):
+        timestamp = datetime.datetime.fromisoformat(str(timestamp).replace("Z", ""))
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    return timestamp
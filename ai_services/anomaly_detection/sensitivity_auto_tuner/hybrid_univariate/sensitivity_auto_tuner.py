@@ -2,25 +2,44 @@ import oci
 import pandas as pd
 import argparse
 import numpy as np
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
 from oci.ai_anomaly_detection.models import DataItem, InlineDetectAnomaliesRequest
 import time
-from sklearn import metrics
 from oci.ai_anomaly_detection import AnomalyDetectionClient
 
 
-def remove_nan(val):
-    if val != val:
-        return "0"
-    elif val == 1:
-        return 1
+# Sensitivity values are searched on a grid of 0.01 within the 0,1 bounds
+SENSITIVITY_STEP = 0.01
+SENSITIVITY_SAMPLES = np.round(np.arange(0.0, 1, SENSITIVITY_STEP), 2)
+GOLDEN_RATIO = (np.sqrt(5) - 1) / 2
+
+
+def get_window_size(ad_client: AnomalyDetectionClient, model_id: str) -> int:
+    return ad_client.get_model(model_id).data.model_training_results.window_size
+
+
+def score_predictions(y_true: np.ndarray, y_pred: np.ndarray) -> tuple:
+    """Returns the TPR and FPR of the predicted labels."""
+    y_true = np.asarray(y_true, dtype=bool)
+    y_pred = np.asarray(y_pred, dtype=bool)
+    tp = np.count_nonzero(y_true & y_pred)
+    fn = np.count_nonzero(y_true & ~y_pred)
+    fp = np.count_nonzero(~y_true & y_pred)
+    tn = np.count_nonzero(~y_true & ~y_pred)
+    tpr = tp / (tp + fn) if tp + fn else 0.0
+    fpr = fp / (fp + tn) if fp + tn else 0.0
+    return tpr, fpr
+
 
 def get_inference_results(label_df: pd.DataFrame,
                           sensitivity: float,
                           ad_client: AnomalyDetectionClient,
                           data: list,
                           model_id: str,
-                          signal_names: list) -> dict:
+                          signal_names: list,
+                          window_size: int = None) -> dict:
     inline_req = InlineDetectAnomaliesRequest(
         model_id=model_id,
         request_type="INLINE",
@@ -28,34 +47,19 @@ def get_inference_results(label_df: pd.DataFrame,
         sensitivity=sensitivity,
         data=data)
 
-    window_size = ad_client.get_model(model_id).data.model_training_results.window_size
+    if window_size is None:
+        window_size = get_window_size(ad_client, model_id)
     detect_response = ad_client.detect_anomalies(detect_anomalies_details=inline_req)
     anomaly_data = detect_response.data.detection_results
-    ret = pd.DataFrame(
-        columns=["date", "signalname", "anomaly_score", "actual_value", "estimated_value", "is_anomaly"])
-
-    # Adding detected anomaly labels
-    i = 0
-    for a in anomaly_data:
-        for anomaly in a.anomalies:
-            row = [str(a.timestamp).replace(" ","T")[:-6],
-                   anomaly.signal_name,
-                   anomaly.anomaly_score,
-                   anomaly.actual_value,
-                   anomaly.estimated_value,
-                   1]
-            i += 1
-            ret.loc[len(ret)] = row
-    ret = pd.merge(label_df, ret, how="outer")
-    ret['is_anomaly'] = ret.apply(lambda row : remove_nan(row['is_anomaly']), axis=1)
-
-    # Create report
-    y_true = label_df.anomaly.iloc[window_size - 1:].reset_index(drop=True).squeeze()
-    y_pred = ret.is_anomaly.iloc[window_size - 1:].reset_index(drop=True).squeeze().astype(int).to_numpy()
-
-    cm = metrics.confusion_matrix(y_true, y_pred)
-    tpr = metrics.recall_score(y_true, y_pred)
-    fpr = cm[0][1] / (cm[0][1] + cm[0][0])
+
+    # Timestamps with detected anomalies, in the format of the dataset
+    anomaly_dates = {str(a.timestamp).replace(" ", "T")[:-6] for a in anomaly_data if a.anomalies}
+    is_anomaly = label_df['date'].astype(str).isin(anomaly_dates).to_numpy()
+
+    # Create report, the first window_size - 1 timestamps have no prediction
+    y_true = label_df['anomaly'].to_numpy()[window_size - 1:]
+    y_pred = is_anomaly[window_size - 1:]
+    tpr, fpr = score_predictions(y_true, y_pred)
 
     row_res = {'TPR': tpr,
                'FPR': fpr,
@@ -66,6 +70,110 @@ def get_inference_results(label_df: pd.DataFrame,
     return row_res
 
 
+class SensitivityEvaluator:
+    """
+    Evaluates TPR and FPR for sensitivity values, with up to max_workers inference calls in parallel.
+    The results are cached, so each sensitivity value is sent only once.
+    """
+
+    def __init__(self,
+                 label_df: pd.DataFrame,
+                 ad_client: AnomalyDetectionClient,
+                 model_id: str,
+                 signal_names: list,
+                 max_workers: int = 4):
+        self.label_df = label_df
+        self.ad_client = ad_client
+        self.model_id = model_id
+        self.signal_names = signal_names
+        self.max_workers = max_workers
+
+        # Prepare inline request data
+        self.data = [DataItem(timestamp=timestamp, values=list(values))
+                     for timestamp, values in zip(label_df['date'], label_df[signal_names].to_numpy())]
+        # The model metadata is fetched once
+        self.window_size = get_window_size(ad_client, model_id)
+
+        self.results = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _evaluate(self, sensitivity: float) -> dict:
+        return get_inference_results(label_df=self.label_df,
+                                     sensitivity=sensitivity,
+                                     ad_client=self.ad_client,
+                                     data=self.data,
+                                     model_id=self.model_id,
+                                     signal_names=self.signal_names,
+                                     window_size=self.window_size)
+
+    def evaluate(self, indices) -> list:
+        """Returns the results for the sensitivity samples at the given indices, calling the service in parallel."""
+        with self._lock:
+            missing = sorted({i for i in indices if i not in self.results})
+        for i, res in zip(missing, self._executor.map(self._evaluate, SENSITIVITY_SAMPLES[missing])):
+            with self._lock:
+                self.results[i] = res
+        return [self.results[i] for i in indices]
+
+    def results_df(self) -> pd.DataFrame:
+        return pd.DataFrame.from_records([self.results[i] for i in sorted(self.results)],
+                                         columns=['TPR', 'FPR', 'Sensitivity'])
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def search_boundary(evaluator: SensitivityEvaluator, condition, first: bool) -> int:
+    """
+    Finds the index of the first (or last) sensitivity sample satisfying condition, assuming that condition is
+    monotonic in the sensitivity. Each step evaluates max_workers samples in parallel and narrows the interval
+    to one of the max_workers + 1 sub-intervals.
+
+    Returns None if no sample satisfies the condition.
+    """
+    lo, hi = 0, len(SENSITIVITY_SAMPLES) - 1
+    # With first=True, condition is False before the boundary and True after. With first=False, the reverse.
+    res_lo, res_hi = evaluator.evaluate([lo, hi])
+    if first:
+        if condition(res_lo):
+            return lo
+        if not condition(res_hi):
+            return None
+    else:
+        if condition(res_hi):
+            return hi
+        if not condition(res_lo):
+            return None
+
+    while hi - lo > 1:
+        points = np.unique(np.linspace(lo, hi, evaluator.max_workers + 2).round().astype(int)[1:-1])
+        points = [int(p) for p in points if lo < p < hi] or [(lo + hi) // 2]
+        for point, res in zip(points, evaluator.evaluate(points)):
+            if condition(res) == first:
+                hi = point
+                break
+            lo = point
+    return hi if first else lo
+
+
+def golden_section_search(evaluator: SensitivityEvaluator, lo: int, hi: int, objective) -> int:
+    """Finds the index of the sensitivity sample maximizing objective in [lo, hi], assuming it is unimodal."""
+    while hi - lo > 2:
+        a = int(round(hi - GOLDEN_RATIO * (hi - lo)))
+        b = int(round(lo + GOLDEN_RATIO * (hi - lo)))
+        if a == b:
+            b = a + 1
+        res_a, res_b = evaluator.evaluate([a, b])
+        if objective(res_a) >= objective(res_b):
+            hi = b
+        else:
+            lo = a
+    indices = list(range(lo, hi + 1))
+    scores = [objective(res) for res in evaluator.evaluate(indices)]
+    return indices[int(np.argmax(scores))]
+
+
 def tune_sensitivity(results: pd.DataFrame,
                      des_tpr: float,
                      des_fpr: float) -> float:
@@ -74,7 +182,7 @@ def tune_sensitivity(results: pd.DataFrame,
     # DF with the rows that have TPR >= des_tpr
     results = results.loc[(results['TPR'] >= des_tpr)]
     # DF with the rows that have FPR <= des_fpr
-    best_fpr = results.loc[(results['FPR'] <= des_fpr)]
+    best_fpr = results.loc[(results['FPR'] <= des_fpr)].copy()
 
     if not results.empty:
         if best_fpr.empty:
@@ -84,7 +192,7 @@ def tune_sensitivity(results: pd.DataFrame,
         else:
             # If there is an entry that satisfies FPR <= des_fpr , then we apply the function of TPR * (1 - FPR)
             # and sort for the function
-            best_fpr['function'] = best_fpr.apply(lambda row: row['TPR'] * (1 - row['FPR']), axis=1)
+            best_fpr['function'] = best_fpr['TPR'] * (1 - best_fpr['FPR'])
             results = best_fpr.sort_values('function', ascending=False)
             results = results.head(1)
         print(f"Optimal Sensitivity to use: {results['Sensitivity'].iloc[0]}\n")
@@ -99,37 +207,32 @@ def find_best_sensitivity(des_tpr: float,
                           des_fpr: float,
                           label_df: pd.DataFrame,
                           ad_client: AnomalyDetectionClient,
-                          model_id) -> float:
-    # Generate sensitivity samples
-    sensitivity_samples = np.arange(0.0, 1, 0.01)
-
-    # Prepare inline request data
+                          model_id,
+                          max_workers: int = 4,
+                          search: str = "adaptive") -> float:
     signal_names = ['value']
-    payloadData = []
-    for index, row in label_df.iterrows():
-        timestamp = row['date']
-        values = list(row[signal_names])
-        dItem = DataItem(timestamp=timestamp, values=values)
-        payloadData.append(dItem)
-
-    results = pd.DataFrame(columns=['TPR',
-                                    'FPR',
-                                    'Sensitivity'])
-
-    # Perform inference for each sensitivity sample
+    evaluator = SensitivityEvaluator(label_df, ad_client, model_id, signal_names, max_workers=max_workers)
+
     total_start_time = time.time()
-    for sensitivity_sample in sensitivity_samples:
-        res = get_inference_results(label_df=label_df,
-                                    sensitivity=sensitivity_sample,
-                                    ad_client=ad_client,
-                                    data=payloadData,
-                                    model_id=model_id,
-                                    signal_names=signal_names)
-        results = pd.concat([results, pd.DataFrame.from_records([res])], ignore_index=True)
+    try:
+        if search == "grid":
+            # Perform inference for each sensitivity sample
+            evaluator.evaluate(list(range(len(SENSITIVITY_SAMPLES))))
+        else:
+            # TPR and FPR increase with the sensitivity. The sensitivity values meeting both metrics are between
+            # the first one meeting the TPR metric and the last one meeting the FPR metric.
+            first_tpr = search_boundary(evaluator, lambda res: res['TPR'] >= des_tpr, first=True)
+            last_fpr = search_boundary(evaluator, lambda res: res['FPR'] <= des_fpr, first=False)
+            if first_tpr is not None and last_fpr is not None and first_tpr <= last_fpr:
+                golden_section_search(evaluator, first_tpr, last_fpr,
+                                      lambda res: res['TPR'] * (1 - res['FPR']))
+    finally:
+        evaluator.shutdown()
 
     total_end_time = time.time()
     print(f"Total time taken: {total_end_time - total_start_time}")
-    return tune_sensitivity(results, des_tpr, des_fpr)
+    print(f"Inference calls: {len(evaluator.results)}")
+    return tune_sensitivity(evaluator.results_df(), des_tpr, des_fpr)
 
 
 if __name__ == "__main__":
@@ -139,13 +242,22 @@ if __name__ == "__main__":
     parser.add_argument('--dataset_path', type=str, default='~/')
     parser.add_argument('--config_path', type=str, default='~/.oci/config')
     parser.add_argument('--model_id', type=str)
+    parser.add_argument('--max_workers', type=int, default=4)
+    parser.add_argument('--search', type=str, choices=['adaptive', 'grid'], default='adaptive')
+    parser.add_argument('--fake', action='store_true',
+                        help='Use a local fake AnomalyDetectionClient instead of the service')
     args = parser.parse_args()
 
-    # Setting up AnomalyDetectionClient
-    config = oci.config.from_file("~/.oci/config")
-    ad_client = AnomalyDetectionClient(config)
-
     # Read input dataset into DataFrame
     label_df = pd.read_csv(args.dataset_path)
 
-    find_best_sensitivity(args.des_tpr, args.des_fpr, label_df, ad_client, args.model_id)
+    # Setting up AnomalyDetectionClient
+    if args.fake:
+        from fake_anomaly_detection_client import FakeAnomalyDetectionClient
+        ad_client = FakeAnomalyDetectionClient()
+    else:
+        config = oci.config.from_file(args.config_path)
+        ad_client = AnomalyDetectionClient(config)
+
+    find_best_sensitivity(args.des_tpr, args.des_fpr, label_df, ad_client, args.model_id,
+                          max_workers=args.max_workers, search=args.search)
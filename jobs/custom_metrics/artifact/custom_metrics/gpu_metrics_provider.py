@@ -1,16 +1,219 @@
 from custom_metrics_provider import Metric, CustomMetricsProvider
+import atexit
 import subprocess
+import threading
+
+try:
+    import pynvml
+except ImportError:
+    pynvml = None
+
+
+NVIDIA_SMI_QUERY = [
+    "nvidia-smi",
+    "--query-gpu=pci.bus_id,power.draw,temperature.gpu,utilization.gpu,memory.total,memory.used",
+    "--format=csv,noheader,nounits"
+]
+
+
+def build_gpu_metrics(pci_bus: str, power_draw: float, temperature: float, utilization: float,
+                      memory_total: float, memory_used: float) -> list:
+    """
+    Builds the GPU metrics of a single GPU
+
+    Returns
+    -------
+    list
+        List of Metric objects.
+    """
+    dimensions = {"pci_bus": pci_bus}
+    return [
+        Metric("gpu.power_draw", float(power_draw), dimensions),
+        Metric("gpu.temperature", float(temperature), dimensions),
+        Metric("gpu.gpu_utilization", float(utilization), dimensions),
+        Metric("gpu.memory_usage", round(float(memory_used) / float(memory_total) * 100, 2), dimensions),
+    ]
+
+
+def parse_nvidia_smi_line(line: str) -> list:
+    """
+    Parses a line of nvidia-smi csv output
+
+    Parameters
+    ----------
+    line: str
+        A line of output, e.g. "00000000:00:04.0, 42.27, 40, 20, 16384, 15287"
+
+    Returns
+    -------
+    list
+        List of Metric objects, or an empty list if the line cannot be parsed.
+    """
+    line = line.strip()
+    if len(line) == 0:
+        return []
+    values = line.split(", ")
+    if len(values) < 6:
+        print(f"Unexpected nvidia-smi output format. Composing no metrics for output line: {line}")
+        return []
+    try:
+        return build_gpu_metrics(*values[:6])
+    except ValueError:
+        # Values may be "[N/A]" or "[Not Supported]"
+        print(f"Unexpected nvidia-smi output values. Composing no metrics for output line: {line}")
+        return []
+
+
+class NvmlSampler:
+    """
+    Samples GPU metrics with the NVML bindings, keeping the device handles open.
+    """
+
+    def __init__(self):
+        pynvml.nvmlInit()
+        self.handles = []
+        for i in range(pynvml.nvmlDeviceGetCount()):
+            handle = pynvml.nvmlDeviceGetHandleByIndex(i)
+            pci_bus = pynvml.nvmlDeviceGetPciInfo(handle).busId
+            if isinstance(pci_bus, bytes):
+                pci_bus = pci_bus.decode("utf-8")
+            self.handles.append((pci_bus, handle))
+
+    def get_metrics(self) -> list:
+        gpu_metrics = []
+        for pci_bus, handle in self.handles:
+            memory = pynvml.nvmlDeviceGetMemoryInfo(handle)
+            gpu_metrics.extend(build_gpu_metrics(
+                pci_bus,
+                # NVML reports the power in milliwatts.
+                pynvml.nvmlDeviceGetPowerUsage(handle) / 1000,
+                pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU),
+                pynvml.nvmlDeviceGetUtilizationRates(handle).gpu,
+                memory.total,
+                memory.used,
+            ))
+        return gpu_metrics
+
+    def stop(self) -> None:
+        pynvml.nvmlShutdown()
+
+
+class NvidiaSmiStream:
+    """
+    Samples GPU metrics from a single long-running "nvidia-smi --loop-ms" process.
+
+    The output is parsed line by line in a background thread, and the latest metrics of each GPU are kept.
+    A recorded output can be replayed by passing a file object as the stream, e.g. for testing without GPU.
+    """
+
+    def __init__(self, loop_ms: int = 1000, stream=None):
+        """
+        Initializes a NvidiaSmiStream object
+
+        Parameters
+        ----------
+        loop_ms: int
+            The sampling interval of nvidia-smi in milliseconds.
+        stream: file object
+            A text stream of nvidia-smi csv output. If None, nvidia-smi will be started.
+        """
+        self.process = None
+        if stream is None:
+            self.process = subprocess.Popen(
+                NVIDIA_SMI_QUERY + [f"--loop-ms={loop_ms}"],
+                stdout=subprocess.PIPE,
+                text=True,
+                bufsize=1,
+            )
+            stream = self.process.stdout
+        self.stream = stream
+        self.latest = {}
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.read, name="nvidia-smi-reader", daemon=True)
+        self.thread.start()
+
+    def read(self) -> None:
+        for line in self.stream:
+            gpu_metrics = parse_nvidia_smi_line(line)
+            if gpu_metrics:
+                with self.lock:
+                    self.latest[gpu_metrics[0].dimensions["pci_bus"]] = gpu_metrics
+
+    @property
+    def running(self) -> bool:
+        return self.thread.is_alive()
+
+    def get_metrics(self) -> list:
+        with self.lock:
+            return [metric for gpu_metrics in self.latest.values() for metric in gpu_metrics]
+
+    def stop(self) -> None:
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
 
 
 class GpuMetricsProvider(CustomMetricsProvider):
     """
     Custom GPU utilization metrics provider
+
+    GPU metrics are sampled with NVML if the pynvml package is available, otherwise with a long-running nvidia-smi
+    process. If neither is available, nvidia-smi is invoked for each sample.
     """
 
+    def __init__(self, loop_ms: int = 1000):
+        """
+        Initializes a GpuMetricsProvider object
+
+        Parameters
+        ----------
+        loop_ms: int
+            The sampling interval of the long-running nvidia-smi process in milliseconds.
+        """
+        self.sampler = None
+        self.available = True
+        if pynvml:
+            try:
+                self.sampler = NvmlSampler()
+            except Exception as e:
+                print(f"Unable to initialize NVML: {e}")
+        if self.sampler is None:
+            try:
+                self.sampler = NvidiaSmiStream(loop_ms=loop_ms)
+            except FileNotFoundError:
+                print("nvidia-smi not found. GPU metrics will not be collected.")
+                self.available = False
+            except Exception as e:
+                print(f"Unable to start nvidia-smi: {e}")
+        if self.sampler:
+            atexit.register(self.sampler.stop)
+
     def get_metrics(self) -> list:
         """
         Get custom GPU metrics
 
+        Returns
+        -------
+        list
+            List of Metric objects.
+        """
+        if not self.available:
+            return []
+        if isinstance(self.sampler, NvmlSampler):
+            try:
+                return self.sampler.get_metrics()
+            except Exception as e:
+                print(f"Unexpected error encountered querying GPU with NVML: {e}")
+        elif isinstance(self.sampler, NvidiaSmiStream) and self.sampler.running:
+            gpu_metrics = self.sampler.get_metrics()
+            if gpu_metrics:
+                return gpu_metrics
+        return self.get_metrics_from_subprocess()
+
+    @staticmethod
+    def get_metrics_from_subprocess() -> list:
+        """
+        Get custom GPU metrics by invoking nvidia-smi
+
         Returns
         -------
         list
@@ -21,25 +224,10 @@ class GpuMetricsProvider(CustomMetricsProvider):
             # Example output:
             # 00000000:00:04.0, 42.27, 40, 20, 16384, 15287
             # 00000000:00:05.0, 41.30, 42, 0, 16384, 479
-            nvidia_smi_output = subprocess.check_output([
-                "nvidia-smi",
-                "--query-gpu=pci.bus_id,power.draw,temperature.gpu,utilization.gpu,memory.total,memory.used",
-                "--format=csv,noheader,nounits"
-            ]).decode("utf-8")
+            nvidia_smi_output = subprocess.check_output(NVIDIA_SMI_QUERY).decode("utf-8")
 
             for line in nvidia_smi_output.split("\n"):
-                if len(line) > 0:
-                    values = line.split(", ")
-                    if len(values) >= 6:
-                        dimensions = {"pci_bus": values[0]}
-                        gpu_metrics.append(Metric("gpu.power_draw", float(values[1]), dimensions))
-                        gpu_metrics.append(Metric("gpu.temperature", float(values[2]), dimensions))
-                        gpu_metrics.append(Metric("gpu.gpu_utilization", float(values[3]), dimensions))
-                        gpu_metrics.append(
-                            Metric("gpu.memory_usage", round(float(values[5]) / float(values[4]) * 100, 2), dimensions)
-                        )
-                    else:
-                        print(f"Unexpected nvidia-smi output format. Composing no metrics for output line: {line}")
+                gpu_metrics.extend(parse_nvidia_smi_line(line))
         except Exception as e:
             print(f"Unexpected error encountered querying GPU: {e}")
 
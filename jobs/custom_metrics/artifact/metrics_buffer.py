@@ -0,0 +1,375 @@
+import datetime
+import glob
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+import oci
+
+
+# The maximum number of metric objects allowed in a single PostMetricData call.
+# See https://docs.oracle.com/iaas/api/#/en/monitoring/20180401/MetricData/PostMetricData
+MAX_METRICS_PER_CALL = 50
+# The Monitoring Service rejects datapoints with timestamps older than 2 hours.
+MAX_DATAPOINT_AGE_SECONDS = 2 * 60 * 60
+
+
+class MetricAggregate:
+    """
+    Aggregated values of a metric stream (a metric name and a set of dimensions) within a submission interval.
+    """
+
+    def __init__(self, name: str, dimensions: dict):
+        self.name = name
+        self.dimensions = dimensions
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.min_time = None
+        self.max = None
+        self.max_time = None
+        self.last_time = None
+
+    def add(self, value: float, timestamp: datetime.datetime) -> None:
+        value = float(value)
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min, self.min_time = value, timestamp
+        if self.max is None or value > self.max:
+            self.max, self.max_time = value, timestamp
+        self.last_time = timestamp
+
+    def to_datapoints(self) -> list:
+        """
+        Converts the aggregated values into datapoints.
+
+        The minimum and the maximum are sent as datapoints with count 1, and the remaining samples are sent as a
+        single datapoint with their mean as the value and their number as the count. With this, the min(), max(),
+        mean(), sum() and count() of the samples queried from the Monitoring Service are exact.
+
+        Returns
+        -------
+        list
+            List of dictionaries, each containing timestamp (ISO format), value and count.
+        """
+        if self.count == 1:
+            return [_datapoint(self.last_time, self.total, 1)]
+        datapoints = [
+            _datapoint(self.min_time, self.min, 1),
+            _datapoint(self.max_time, self.max, 1),
+        ]
+        if self.count > 2:
+            remaining = self.count - 2
+            mean = (self.total - self.min - self.max) / remaining
+            datapoints.append(_datapoint(self.last_time, mean, remaining))
+        return datapoints
+
+    def to_record(self) -> dict:
+        return {
+            "name": self.name,
+            "dimensions": self.dimensions,
+            "datapoints": self.to_datapoints(),
+        }
+
+
+def _datapoint(timestamp: datetime.datetime, value: float, count: int) -> dict:
+    return {"timestamp": timestamp.isoformat(), "value": value, "count": count}
+
+
+class MetricBuffer:
+    """
+    Thread safe buffer aggregating metric samples until they are drained for submission.
+    """
+
+    def __init__(self, default_dimensions: dict = None):
+        """
+        Initializes a MetricBuffer object
+
+        Parameters
+        ----------
+        default_dimensions: dict
+            Dimensions added to every metric, e.g. the job run OCID.
+        """
+        self.default_dimensions = default_dimensions if default_dimensions else {}
+        self._aggregates = {}
+        self._lock = threading.Lock()
+
+    def add(self, metric, timestamp: datetime.datetime) -> None:
+        """
+        Adds a sample of a metric
+
+        Parameters
+        ----------
+        metric: Metric
+            The Metric object
+        timestamp: datetime.datetime
+            The time the metric was sampled
+        """
+        dimensions = dict(metric.dimensions)
+        dimensions.update(self.default_dimensions)
+        key = (metric.name, tuple(sorted(dimensions.items())))
+        with self._lock:
+            aggregate = self._aggregates.get(key)
+            if aggregate is None:
+                aggregate = MetricAggregate(metric.name, dimensions)
+                self._aggregates[key] = aggregate
+            aggregate.add(metric.value, timestamp)
+
+    def drain(self) -> list:
+        """
+        Removes all aggregated metrics from the buffer
+
+        Returns
+        -------
+        list
+            List of metric records, each containing name, dimensions and datapoints.
+        """
+        with self._lock:
+            aggregates = self._aggregates
+            self._aggregates = {}
+        return [aggregate.to_record() for aggregate in aggregates.values()]
+
+
+class MetricSender:
+    """
+    Submits metric records to the Monitoring Service in batches.
+
+    Failed calls are retried with exponential backoff. When the service is still unreachable after all retries,
+    the records are written to the spill directory and submitted again with the next flush.
+    A spill file is removed only once all its records are submitted. Datapoints older than the service accepts
+    are dropped, and the oldest spill files are removed when the spill directory is larger than max_spill_bytes.
+    """
+
+    def __init__(
+        self,
+        client: oci.monitoring.MonitoringClient,
+        namespace: str,
+        compartment_id: str,
+        batch_size: int = MAX_METRICS_PER_CALL,
+        max_retries: int = 5,
+        backoff_seconds: float = 1.0,
+        max_backoff_seconds: float = 30.0,
+        spill_dir: str = None,
+        max_spill_bytes: int = 10 * 1024 * 1024,
+        max_datapoint_age_seconds: float = MAX_DATAPOINT_AGE_SECONDS,
+    ):
+        """
+        Initializes a MetricSender object
+
+        Parameters
+        ----------
+        client: oci.monitoring.MonitoringClient
+            The OCI Monitoring Service client, using the telemetry-ingestion endpoint.
+        namespace: str
+            The namespace of the metrics.
+        compartment_id: str
+            The compartment OCID of the metrics.
+        batch_size: int
+            The maximum number of metrics submitted in a single call.
+        max_retries: int
+            The maximum number of retries for each call.
+        backoff_seconds: float
+            The initial wait time before retrying a call. The wait time is doubled for each retry.
+        max_backoff_seconds: float
+            The maximum wait time before retrying a call.
+        spill_dir: str
+            The directory for saving the metrics which cannot be submitted. Metrics are dropped if this is None.
+        max_spill_bytes: int
+            The maximum size of the spill directory. The oldest files are removed first.
+        max_datapoint_age_seconds: float
+            Datapoints older than this are not submitted again, as the service rejects them.
+        """
+        self.client = client
+        self.namespace = namespace
+        self.compartment_id = compartment_id
+        self.batch_size = min(batch_size, MAX_METRICS_PER_CALL)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+        self.max_datapoint_age_seconds = max_datapoint_age_seconds
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def send(self, records: list) -> int:
+        """
+        Submits metric records, including the records spilled to disk by previous calls
+
+        Parameters
+        ----------
+        records: list
+            List of metric records returned by MetricBuffer.drain()
+
+        Returns
+        -------
+        int
+            The number of records submitted.
+        """
+        submitted = 0
+        for filename in self._spill_files():
+            sent, remaining = self._post_all(self._load_spilled(filename))
+            submitted += sent
+            if remaining:
+                # The service is unreachable, keep the records not submitted in the file.
+                self._write_records(filename, remaining)
+                self._spill(records)
+                return submitted
+            os.remove(filename)
+        sent, remaining = self._post_all(records)
+        if remaining:
+            self._spill(remaining)
+        return submitted + sent
+
+    def _post_all(self, records: list) -> tuple:
+        """
+        Submits metric records in batches, until a batch cannot be submitted
+
+        Returns
+        -------
+        tuple
+            The number of records submitted and the list of records not submitted.
+        """
+        for start in range(0, len(records), self.batch_size):
+            if not self._post(records[start:start + self.batch_size]):
+                return start, records[start:]
+        return len(records), []
+
+    def convert_to_metric_data_details(self, record: dict) -> oci.monitoring.models.MetricDataDetails:
+        """
+        Converts a metric record into an oci.monitoring.models.MetricDataDetails object for submission to the
+        Monitoring Service.
+
+        Parameters
+        ----------
+        record: dict
+            The metric record containing name, dimensions and datapoints
+
+        Returns
+        -------
+        oci.monitoring.models.MetricDataDetails
+            The oci.monitoring.models.MetricDataDetails object containing the metric details
+        """
+        return oci.monitoring.models.MetricDataDetails(
+            namespace=self.namespace,
+            compartment_id=self.compartment_id,
+            name=record["name"],
+            dimensions=record["dimensions"],
+            datapoints=[
+                oci.monitoring.models.Datapoint(
+                    timestamp=datetime.datetime.fromisoformat(datapoint["timestamp"]),
+                    value=datapoint["value"],
+                    count=datapoint["count"])
+                for datapoint in record["datapoints"]
+            ]
+        )
+
+    def _post(self, batch: list) -> bool:
+        """
+        Submits a batch of metric records with retries
+
+        Returns
+        -------
+        bool
+            False if the service is unreachable after all retries, otherwise True.
+        """
+        post_metric_details = oci.monitoring.models.PostMetricDataDetails(
+            metric_data=[self.convert_to_metric_data_details(record) for record in batch]
+        )
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.client.post_metric_data(post_metric_data_details=post_metric_details)
+                if response.data.failed_metrics_count:
+                    # Metrics rejected by the service will not succeed with retries.
+                    for failed_metric in response.data.failed_metrics:
+                        print(f"Metric rejected: {failed_metric.message}")
+                return True
+            except oci.exceptions.ServiceError as e:
+                if e.status != 429 and e.status < 500:
+                    print(f"Failed to submit {len(batch)} metrics, dropping them: {e.message}")
+                    return True
+                error = e
+            except (oci.exceptions.RequestException, oci.exceptions.ConnectTimeout) as e:
+                error = e
+            if attempt < self.max_retries:
+                wait = min(self.backoff_seconds * 2 ** attempt, self.max_backoff_seconds)
+                # Add jitter so that multiple job runs do not retry at the same time.
+                wait = random.uniform(wait / 2, wait)
+                print(f"Failed to submit metrics ({error}), retrying in {wait:.1f} seconds.")
+                time.sleep(wait)
+        print(f"Failed to submit metrics after {self.max_retries} retries.")
+        return False
+
+    def has_spilled(self) -> bool:
+        """
+        Checks if there are metrics saved in the spill directory
+        """
+        return bool(self._spill_files())
+
+    def _spill_files(self) -> list:
+        """
+        Lists the spill files, oldest first
+        """
+        if not self.spill_dir:
+            return []
+        return sorted(glob.glob(os.path.join(self.spill_dir, "metrics-*.jsonl")))
+
+    def _spill(self, records: list) -> None:
+        if not records:
+            return
+        if not self.spill_dir:
+            print(f"Dropping {len(records)} metrics.")
+            return
+        filename = os.path.join(self.spill_dir, f"metrics-{time.time_ns()}-{uuid.uuid4().hex[:8]}.jsonl")
+        self._write_records(filename, records)
+        print(f"Saved {len(records)} metrics to {filename}")
+        self._limit_spill_size()
+
+    @staticmethod
+    def _write_records(filename: str, records: list) -> None:
+        # Write to a temporary file first, so that a crash does not leave a partial file.
+        temp_filename = filename + ".tmp"
+        with open(temp_filename, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        os.replace(temp_filename, filename)
+
+    def _limit_spill_size(self) -> None:
+        files = [(filename, os.path.getsize(filename)) for filename in self._spill_files()]
+        total = sum(size for _, size in files)
+        for filename, size in files:
+            if total <= self.max_spill_bytes:
+                break
+            print(f"Spill directory is larger than {self.max_spill_bytes} bytes, removing {filename}")
+            os.remove(filename)
+            total -= size
+
+    def _load_spilled(self, filename: str) -> list:
+        """
+        Loads the records in a spill file, without the datapoints too old to be accepted by the service
+        """
+        oldest = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+            seconds=self.max_datapoint_age_seconds
+        )
+        records = []
+        dropped = 0
+        with open(filename, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                datapoints = [
+                    datapoint for datapoint in record["datapoints"]
+                    if datetime.datetime.fromisoformat(datapoint["timestamp"]) >= oldest
+                ]
+                dropped += len(record["datapoints"]) - len(datapoints)
+                if datapoints:
+                    record["datapoints"] = datapoints
+                    records.append(record)
+        if dropped:
+            print(f"Dropping {dropped} datapoints older than {self.max_datapoint_age_seconds} seconds from {filename}")
+        return records
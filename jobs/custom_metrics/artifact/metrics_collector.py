@@ -0,0 +1,153 @@
+import concurrent.futures
+import glob
+import importlib
+import inspect
+import os
+import time
+
+from custom_metrics_provider import Metric, CustomMetricsProvider
+
+
+# Packages can register custom metric providers with this entry point group, for example, in setup.py:
+# entry_points={"custom_metrics.providers": ["my_provider = my_package.my_module:MyMetricsProvider"]}
+PROVIDER_ENTRY_POINT_GROUP = "custom_metrics.providers"
+PROVIDER_LATENCY_METRIC = "custom_metrics.provider_latency_ms"
+PROVIDER_TIMEOUT_METRIC = "custom_metrics.provider_timeout"
+
+
+def discover_providers(directory: str, names: list = None) -> list:
+    """
+    Discovers and initializes the custom metrics providers defined in the "*_provider.py" files in a directory
+    and registered with the "custom_metrics.providers" entry point group.
+
+    Parameters
+    ----------
+    directory: str
+        The directory containing the custom metrics providers. The directory must be in sys.path.
+    names: list
+        The class names of the providers to be initialized. If None, all providers will be initialized.
+
+    Returns
+    -------
+    list
+        List of CustomMetricsProvider objects.
+    """
+    provider_classes = {}
+    for filename in sorted(glob.glob(os.path.join(directory, "*_provider.py"))):
+        module_name = os.path.splitext(os.path.basename(filename))[0]
+        try:
+            module = importlib.import_module(module_name)
+        except Exception as e:
+            print(f"Unable to load custom metrics providers from {filename}: {e}")
+            continue
+        for name, cls in inspect.getmembers(module, inspect.isclass):
+            if (
+                issubclass(cls, CustomMetricsProvider)
+                and cls is not CustomMetricsProvider
+                and cls.__module__ == module_name
+            ):
+                provider_classes[name] = cls
+
+    for entry_point in _entry_points(PROVIDER_ENTRY_POINT_GROUP):
+        try:
+            cls = entry_point.load()
+            provider_classes[cls.__name__] = cls
+        except Exception as e:
+            print(f"Unable to load custom metrics provider {entry_point.name}: {e}")
+
+    providers = []
+    for name, cls in provider_classes.items():
+        if names and name not in names:
+            continue
+        try:
+            providers.append(cls())
+        except Exception as e:
+            print(f"Unable to initialize custom metrics provider {name}: {e}")
+    return providers
+
+
+def _entry_points(group: str) -> list:
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return []
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        return list(eps.select(group=group))
+    return list(eps.get(group, []))
+
+
+class MetricCollector:
+    """
+    Collects metrics from multiple providers concurrently.
+
+    Each provider is called in a thread pool with a timeout, so that a slow provider does not delay the others.
+    A provider is not called again until its previous call is finished. The collection latency of each provider is
+    reported as the "custom_metrics.provider_latency_ms" metric, and each timeout is reported as the
+    "custom_metrics.provider_timeout" metric, with the provider class name as the "provider" dimension.
+    """
+
+    def __init__(self, providers: list, timeout_seconds: float = 10):
+        """
+        Initializes a MetricCollector object
+
+        Parameters
+        ----------
+        providers: list
+            List of CustomMetricsProvider objects.
+        timeout_seconds: float
+            The default timeout for each provider. A provider can override it with a "timeout_seconds" attribute.
+        """
+        self.providers = providers
+        self.timeout_seconds = timeout_seconds
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(len(providers), 1), thread_name_prefix="metrics-provider"
+        )
+        self.pending = {}
+
+    def collect(self) -> list:
+        """
+        Collects metrics from all providers
+
+        Returns
+        -------
+        list
+            List of Metric objects, including the latency and timeout metrics of the providers.
+        """
+        started = time.monotonic()
+        futures = {}
+        for provider in self.providers:
+            previous = self.pending.get(provider)
+            if previous and not previous.done():
+                # The provider is still running since a previous collection.
+                continue
+            futures[provider] = self.executor.submit(self._timed_call, provider)
+            self.pending[provider] = futures[provider]
+
+        metrics = []
+        for provider, future in futures.items():
+            timeout = getattr(provider, "timeout_seconds", self.timeout_seconds)
+            name = type(provider).__name__
+            try:
+                provider_metrics, latency = future.result(
+                    timeout=max(0, started + timeout - time.monotonic())
+                )
+            except concurrent.futures.TimeoutError:
+                print(f"Custom metrics provider {name} timed out after {timeout} seconds.")
+                metrics.append(Metric(PROVIDER_TIMEOUT_METRIC, 1, {"provider": name}))
+                continue
+            except Exception as e:
+                print(f"Unexpected error encountered collecting metrics from {name}: {e}")
+                continue
+            metrics.extend(provider_metrics)
+            metrics.append(Metric(PROVIDER_LATENCY_METRIC, round(latency * 1000, 3), {"provider": name}))
+        return metrics
+
+    @staticmethod
+    def _timed_call(provider: CustomMetricsProvider) -> tuple:
+        started = time.monotonic()
+        provider_metrics = provider.get_metrics()
+        return provider_metrics, time.monotonic() - started
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False)
@@ -1,13 +1,17 @@
 import datetime
 import oci
 import os
+import signal
 import sys
+import tempfile
+import threading
 import time
 
 dir = os.path.dirname(__file__)
 custom_metric_dir = os.path.join(dir, "custom_metrics")
 sys.path.append(custom_metric_dir)
-from custom_metrics_provider import Metric
+from metrics_buffer import MetricBuffer, MetricSender
+from metrics_collector import MetricCollector, discover_providers
 
 METRIC_NAMESPACE=''
 
@@ -30,92 +34,146 @@ else:
 # When querying metrics, the smallest aggregation interval allowed is 1 minute.
 # See https://docs.oracle.com/iaas/Content/Monitoring/Reference/mql.htm#Interval
 METRIC_SUBMISSION_INTERVAL_SECONDS = 60
+# Metrics are sampled more frequently and aggregated locally before submission.
+METRIC_SAMPLING_INTERVAL_SECONDS = float(os.environ.get("METRICS_SAMPLING_INTERVAL_SECONDS", 5))
+# Metrics which cannot be submitted are saved in this directory and submitted again later.
+METRIC_SPILL_DIR = os.environ.get(
+    "METRICS_SPILL_DIR", os.path.join(tempfile.gettempdir(), "custom_metrics_spill")
+)
+# The maximum size of the spill directory in bytes, the oldest files are removed first.
+METRIC_SPILL_MAX_BYTES = int(os.environ.get("METRICS_SPILL_MAX_BYTES", 10 * 1024 * 1024))
+# Set this to submit metrics to a different endpoint, e.g. a local endpoint for testing.
+METRIC_INGESTION_ENDPOINT = os.environ.get("METRICS_INGESTION_ENDPOINT")
+
+# The timeout for collecting metrics from each provider.
+METRIC_PROVIDER_TIMEOUT_SECONDS = float(os.environ.get("METRICS_PROVIDER_TIMEOUT_SECONDS", 10))
 
 # Initialize custom metrics providers.
-from gpu_metrics_provider import GpuMetricsProvider
-from random_metrics_provider import RandomMetricsProvider
-metric_providers = [
-    GpuMetricsProvider(),
-    RandomMetricsProvider()
-]
+# Providers are discovered from the custom_metrics directory and the "custom_metrics.providers" entry points.
+# Set METRICS_PROVIDERS to a comma separated list of provider class names to use only some of them.
+metric_providers = discover_providers(
+    custom_metric_dir,
+    names=[name for name in os.environ.get("METRICS_PROVIDERS", "").split(",") if name]
+)
+metric_collector = MetricCollector(metric_providers, timeout_seconds=METRIC_PROVIDER_TIMEOUT_SECONDS)
 
 
-def convert_to_metric_data_details(metric: Metric, timestamp: datetime.datetime) -> \
-        oci.monitoring.models.MetricDataDetails:
+def get_default_dimensions() -> dict:
     """
-    Converts a Metric object into an oci.monitoring.models.MetricDataDetails object for submission to the Monitoring
-    Service. In addition to the dimensions defined on the input Metric, the job ocid and job run ocid are also added
-    as dimensions.
-
-    Parameters
-    ----------
-    metric: Metric
-        The Metric object to convert
-    timestamp: datetime.datetime
-        The timestamp to include on the metric datapoint
+    Gets the dimensions added to every metric. The job ocid and job run ocid are added for job runs, and the notebook
+    session ocid and project ocid are added for notebook sessions.
 
     Returns
     -------
-    oci.monitoring.models.MetricDataDetails
-        The oci.monitoring.models.MetricDataDetails object containing the metric details
+    dict
+        Dictionary of dimensions.
     """
-    dimensions = metric.dimensions
-
     # let's make it work for notebooks and jobs
     if os.environ.get("JOB_OCID"):
-        dimensions["job_run_ocid"] = os.environ.get("JOB_RUN_OCID")
-        dimensions["job_ocid"] = os.environ.get("JOB_OCID")        
+        return {
+            "job_run_ocid": os.environ.get("JOB_RUN_OCID"),
+            "job_ocid": os.environ.get("JOB_OCID"),
+        }
     elif os.environ.get("NB_SESSION_OCID"):
-        dimensions["nb_ocid"] = os.environ.get("NB_SESSION_OCID")
-        dimensions["nb_project_ocid"] = os.environ.get("PROJECT_OCID")
+        return {
+            "nb_ocid": os.environ.get("NB_SESSION_OCID"),
+            "nb_project_ocid": os.environ.get("PROJECT_OCID"),
+        }
     else:
         raise RuntimeError("This script must be run as part of a job run or a notebook.")
 
 
+def collect_metrics(buffer: MetricBuffer) -> None:
+    """
+    Collects metrics from all providers into the buffer
 
-    return oci.monitoring.models.MetricDataDetails(
-        namespace=METRIC_NAMESPACE,
-        compartment_id=METRIC_COMPARTMENT,
-        name=metric.name,
-        dimensions=dimensions,
-        datapoints=[
-            oci.monitoring.models.Datapoint(
-                timestamp=timestamp,
-                value=metric.value,
-                count=1)
-        ]
-    )
+    Parameters
+    ----------
+    buffer: MetricBuffer
+        The buffer aggregating the metrics
+    """
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    for metric in metric_collector.collect():
+        buffer.add(metric, timestamp)
 
 
-def submit_metrics(client: oci.monitoring.MonitoringClient) -> None:
+def submit_metrics(buffer: MetricBuffer, sender: MetricSender) -> None:
     """
-    Submit metrics to the Monitoring Service
+    Submit the aggregated metrics in the buffer to the Monitoring Service
 
     Parameters
     ----------
-    client: oci.monitoring.MonitoringClient
-        The OCI Monitoring Service client
+    buffer: MetricBuffer
+        The buffer aggregating the metrics
+    sender: MetricSender
+        The sender submitting the metrics in batches
     """
-    metric_data_details = []
-    timestamp = datetime.datetime.now()
-    for provider in metric_providers:
-        for metric in provider.get_metrics():
-            metric_data_details.append(convert_to_metric_data_details(metric, timestamp))
-    post_metric_details = oci.monitoring.models.PostMetricDataDetails(metric_data=metric_data_details)
-    client.post_metric_data(post_metric_data_details=post_metric_details)
+    records = buffer.drain()
+    if records or sender.has_spilled():
+        sender.send(records)
 
 
-if __name__ == "__main__":
-    signer = oci.auth.signers.get_resource_principals_signer()
+def flush_periodically(buffer: MetricBuffer, sender: MetricSender, stop_event: threading.Event) -> None:
+    """
+    Submits the aggregated metrics every METRIC_SUBMISSION_INTERVAL_SECONDS until stop_event is set.
+    Submitting metrics in a background thread ensures sampling is not delayed by slow or failed calls.
+    """
+    while not stop_event.wait(METRIC_SUBMISSION_INTERVAL_SECONDS):
+        try:
+            submit_metrics(buffer, sender)
+        except Exception as e:
+            print(f"Unexpected error encountered submitting metrics: {e}")
+
+
+def get_monitoring_client() -> oci.monitoring.MonitoringClient:
+    """
+    Creates the OCI Monitoring Service client for submitting metrics. Resource Principal is used for authentication
+    when available, otherwise the OCI API key config is used.
+    """
+    if oci.auth.signers.resource_principals_signer.OCI_RESOURCE_PRINCIPAL_VERSION in os.environ:
+        signer = oci.auth.signers.get_resource_principals_signer()
+        auth = dict(config={}, signer=signer)
+        region = signer.region
+    else:
+        config = oci.config.from_file()
+        auth = dict(config=config)
+        region = config["region"]
     # The default "telemetry.<region>.oraclecloud.com" endpoint is for querying metrics.
     # Metrics should be submitted with the "telemetry-ingestion" endpoint instead.
     # See note here: https://docs.oracle.com/iaas/api/#/en/monitoring/20180401/MetricData/PostMetricData
-    monitoring_client = oci.monitoring.MonitoringClient(
-        config={},
-        signer=signer,
-        service_endpoint=f"https://telemetry-ingestion.{signer.region}.oraclecloud.com"
+    endpoint = METRIC_INGESTION_ENDPOINT or f"https://telemetry-ingestion.{region}.oraclecloud.com"
+    # Retries are handled by MetricSender.
+    return oci.monitoring.MonitoringClient(
+        **auth,
+        service_endpoint=endpoint,
+        retry_strategy=oci.retry.NoneRetryStrategy(),
     )
 
-    while True:
-        submit_metrics(monitoring_client)
-        time.sleep(METRIC_SUBMISSION_INTERVAL_SECONDS)
+
+if __name__ == "__main__":
+    # Flush the remaining metrics when the job entrypoint terminates this script.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    metric_buffer = MetricBuffer(default_dimensions=get_default_dimensions())
+    metric_sender = MetricSender(
+        get_monitoring_client(),
+        namespace=METRIC_NAMESPACE,
+        compartment_id=METRIC_COMPARTMENT,
+        spill_dir=METRIC_SPILL_DIR,
+        max_spill_bytes=METRIC_SPILL_MAX_BYTES,
+    )
+    stop = threading.Event()
+    flush_thread = threading.Thread(
+        target=flush_periodically, args=(metric_buffer, metric_sender, stop), daemon=True
+    )
+    flush_thread.start()
+
+    try:
+        while True:
+            started = time.monotonic()
+            collect_metrics(metric_buffer)
+            time.sleep(max(0, METRIC_SAMPLING_INTERVAL_SECONDS - (time.monotonic() - started)))
+    finally:
+        stop.set()
+        flush_thread.join()
+        submit_metrics(metric_buffer, metric_sender)
@@ -0,0 +1,63 @@
+import argparse
+import json
+import random
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class IngestionHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for the PostMetricData API of the OCI Monitoring Service telemetry-ingestion endpoint.
+    Request signatures are not verified.
+    """
+
+    fail_rate = 0.0
+    max_metrics = 50
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.path.rstrip("/").endswith("/metrics"):
+            self._respond(404, {"code": "NotAuthorizedOrNotFound", "message": f"Unknown path {self.path}"})
+            return
+        if random.random() < self.fail_rate:
+            self._respond(503, {"code": "ServiceUnavailable", "message": "Simulated failure."})
+            return
+        metric_data = json.loads(body).get("metricData", [])
+        if len(metric_data) > self.max_metrics:
+            self._respond(400, {"code": "InvalidParameter", "message": f"Too many metrics: {len(metric_data)}"})
+            return
+        for metric in metric_data:
+            datapoints = metric.get("datapoints", [])
+            print(
+                f"{metric.get('name')} {metric.get('dimensions')} "
+                f"datapoints={len(datapoints)} count={sum(d.get('count', 1) for d in datapoints)}"
+            )
+        self._respond(200, {"failedMetricsCount": 0, "failedMetrics": []})
+
+    def _respond(self, status: int, payload: dict):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("opc-request-id", "local")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Starts a local endpoint accepting metrics submitted by metrics_submitter.py. "
+                    "Set the METRICS_INGESTION_ENDPOINT environment variable to http://localhost:<port> "
+                    "when running metrics_submitter.py."
+    )
+    parser.add_argument("--port", type=int, default=8000, help="The port to listen on. Defaults to 8000")
+    parser.add_argument("--fail-rate", type=float, default=0.0,
+                        help="The fraction of requests to fail with HTTP 503, between 0 and 1. Defaults to 0")
+    args = parser.parse_args()
+
+    IngestionHandler.fail_rate = args.fail_rate
+    server = ThreadingHTTPServer(("localhost", args.port), IngestionHandler)
+    print(f"Listening on http://localhost:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,186 @@
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Keys in the OCI API key config identifying the principal used for authentication.
+CONFIG_IDENTITY_KEYS = (
+    "user",
+    "fingerprint",
+    "tenancy",
+    "override_tenancy",
+    "region",
+    "key_file",
+    "security_token_file",
+)
+
+
+def auth_identity(oci_auth: dict) -> tuple:
+    """Returns a hashable tuple identifying the principal of an authentication dictionary.
+
+    Parameters
+    ----------
+    oci_auth : dict
+        A dictionary containing config and (optionally) signer, as returned by get_authentication().
+
+    Returns
+    -------
+    tuple
+        The identity of the authentication, which can be used as part of a cache key.
+    """
+    signer = oci_auth.get("signer")
+    if signer is not None:
+        return (type(signer).__name__, getattr(signer, "tenancy_id", None))
+    config = oci_auth.get("config") or {}
+    return ("api_key",) + tuple(config.get(key) for key in CONFIG_IDENTITY_KEYS)
+
+
+class ClientRegistry:
+    """Process-wide registry of OCI authentication and OCI clients.
+
+    The authentication is loaded once and re-used across requests.
+    API key config is re-loaded after auth_ttl seconds so that changes in the config file are picked up.
+    Resource principal and instance principal signers are kept and their security tokens are
+    refreshed by a background thread every refresh_interval seconds.
+
+    OCI clients are keyed by (client class, service endpoint, auth identity) and re-used for client_ttl seconds.
+    Each OCI client holds a requests session, which keeps the HTTP connections to the service alive.
+
+    The cache hits and misses are counted, see stats().
+    """
+
+    def __init__(
+        self, auth_loader, auth_ttl=300, client_ttl=3600, refresh_interval=600
+    ) -> None:
+        """Initializes the registry.
+
+        Parameters
+        ----------
+        auth_loader : callable
+            A function returning the authentication dictionary with config and (optionally) signer.
+        auth_ttl : int, optional
+            Number of seconds before re-loading API key config, by default 300.
+        client_ttl : int, optional
+            Number of seconds before re-creating an OCI client, by default 3600.
+        refresh_interval : int, optional
+            Number of seconds between refreshing the security token of a signer, by default 600.
+        """
+        self.auth_loader = auth_loader
+        self.auth_ttl = auth_ttl
+        self.client_ttl = client_ttl
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._auth = None
+        self._auth_loaded_at = 0
+        self._clients = {}
+        self._auth_hits = 0
+        self._auth_misses = 0
+        self._client_hits = 0
+        self._client_misses = 0
+        self._stop_event = threading.Event()
+        self._refresh_thread = None
+
+    def get_authentication(self) -> dict:
+        """Returns the cached authentication dictionary, loading it if needed."""
+        with self._lock:
+            if self._auth is None or (
+                not self._auth.get("signer")
+                and time.monotonic() - self._auth_loaded_at > self.auth_ttl
+            ):
+                self._auth_misses += 1
+                self._auth = self.auth_loader()
+                self._auth_loaded_at = time.monotonic()
+                self._prune_clients()
+                if self._auth.get("signer"):
+                    self._start_refresh_thread()
+            else:
+                self._auth_hits += 1
+            return self._auth
+
+    def get_client(self, client_class, **kwargs):
+        """Returns a cached OCI client, creating one if it does not exist or it is expired.
+
+        Parameters
+        ----------
+        client_class : type
+            The OCI client class, e.g. oci.data_science.DataScienceClient.
+        **kwargs :
+            Additional keyword arguments for initializing the client, e.g. service_endpoint.
+
+        Returns
+        -------
+        An instance of client_class.
+        """
+        oci_auth = self.get_authentication()
+        key = (
+            f"{client_class.__module__}.{client_class.__name__}",
+            tuple(sorted((k, v) for k, v in kwargs.items() if v is not None)),
+            auth_identity(oci_auth),
+        )
+        with self._lock:
+            cached = self._clients.get(key)
+            if cached and time.monotonic() - cached[1] < self.client_ttl:
+                self._client_hits += 1
+                return cached[0]
+            self._client_misses += 1
+            logger.debug("Creating %s for %s", client_class.__name__, key[1])
+            client = client_class(**oci_auth, **kwargs)
+            self._clients[key] = (client, time.monotonic())
+            return client
+
+    def stats(self) -> dict:
+        """Returns the number of cache hits and misses of the authentication and the clients,
+        and the number of cached clients.
+        """
+        with self._lock:
+            return {
+                "auth": {"hits": self._auth_hits, "misses": self._auth_misses},
+                "clients": {
+                    "hits": self._client_hits,
+                    "misses": self._client_misses,
+                    "size": len(self._clients),
+                },
+            }
+
+    def clear(self):
+        """Removes the cached authentication and clients."""
+        with self._lock:
+            self._auth = None
+            self._clients.clear()
+
+    def close(self):
+        """Stops the background signer refresh and clears the cache."""
+        self._stop_event.set()
+        self.clear()
+
+    def _prune_clients(self):
+        """Removes the clients which are expired or created with a different auth identity."""
+        identity = auth_identity(self._auth)
+        now = time.monotonic()
+        for key, (_, created_at) in list(self._clients.items()):
+            if key[2] != identity or now - created_at >= self.client_ttl:
+                self._clients.pop(key, None)
+
+    def _start_refresh_thread(self):
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._refresh_thread = threading.Thread(
+            target=self._refresh_signer, name="oci-signer-refresh", daemon=True
+        )
+        self._refresh_thread.start()
+
+    def _refresh_signer(self):
+        while not self._stop_event.wait(self.refresh_interval):
+            with self._lock:
+                signer = self._auth.get("signer") if self._auth else None
+            refresh = getattr(signer, "refresh_security_token", None)
+            if not refresh:
+                continue
+            try:
+                refresh()
+                logger.debug("Refreshed security token for %s", type(signer).__name__)
+            except Exception:
+                logger.exception("Failed to refresh security token.")
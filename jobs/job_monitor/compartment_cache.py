@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+
+
+logger = logging.getLogger(__name__)
+
+
+class CompartmentTree:
+    """An in-memory index of the compartments in a tenancy."""
+
+    def __init__(self, compartments: list) -> None:
+        """Initializes the index.
+
+        Parameters
+        ----------
+        compartments : list
+            A list of oci.identity.models.Compartment objects. The root compartment should be the first one.
+        """
+        self.compartments = compartments
+        self.by_id = {}
+        self.children_ids = defaultdict(list)
+        for compartment in compartments:
+            self.by_id[compartment.id] = compartment
+            parent_id = getattr(compartment, "compartment_id", None)
+            if parent_id and parent_id != compartment.id:
+                self.children_ids[parent_id].append(compartment.id)
+        self._hierarchy = None
+        self.loaded_at = time.monotonic()
+
+    def get(self, compartment_id):
+        """Returns the compartment with the specific OCID, or None if it is not in the tree."""
+        return self.by_id.get(compartment_id)
+
+    def children(self, compartment_id) -> list:
+        """Returns the direct child compartments of a compartment."""
+        return [self.by_id[ocid] for ocid in self.children_ids.get(compartment_id, [])]
+
+    def subtree(self, compartment_id) -> list:
+        """Returns a compartment and all its descendants in depth-first order.
+        The cost of the lookup is proportional to the size of the subtree.
+        """
+        if compartment_id not in self.by_id:
+            return []
+        results = []
+        stack = [self.by_id[compartment_id]]
+        while stack:
+            compartment = stack.pop()
+            results.append(compartment)
+            stack.extend(reversed(self.children(compartment.id)))
+        return results
+
+    def hierarchy(self) -> list:
+        """Returns all the compartments as (compartment, depth) tuples, each compartment followed by its subtree.
+        Compartments whose parent is not in the tree, e.g. when only the child compartments could be listed,
+        are the root of their own subtree.
+        """
+        if self._hierarchy is not None:
+            return self._hierarchy
+        results = []
+        for root in self.compartments:
+            parent_id = getattr(root, "compartment_id", None)
+            if parent_id in self.by_id and parent_id != root.id:
+                continue
+            depths = {}
+            for compartment in self.subtree(root.id):
+                if compartment.id == root.id:
+                    depths[compartment.id] = 0
+                else:
+                    depths[compartment.id] = depths[compartment.compartment_id] + 1
+                results.append((compartment, depths[compartment.id]))
+        self._hierarchy = results
+        return results
+
+
+class CompartmentCache:
+    """Caches the compartment tree of each tenancy.
+
+    When the cached tree is older than ttl seconds, the stale tree will be returned
+    while a background thread loads the compartments again.
+    Only the first request for a tenancy waits for the compartments to be loaded.
+    """
+
+    def __init__(self, loader, ttl=600) -> None:
+        """Initializes the cache.
+
+        Parameters
+        ----------
+        loader : callable
+            A function taking the tenancy OCID and returning a list of compartments, with the root compartment first.
+        ttl : int, optional
+            Number of seconds before the tree is refreshed, by default 600.
+        """
+        self.loader = loader
+        self.ttl = ttl
+        self._trees = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, tenancy_id) -> CompartmentTree:
+        """Returns the compartment tree of a tenancy."""
+        with self._lock:
+            tree = self._trees.get(tenancy_id)
+            if tree is not None:
+                if (
+                    time.monotonic() - tree.loaded_at > self.ttl
+                    and tenancy_id not in self._refreshing
+                ):
+                    self._refreshing.add(tenancy_id)
+                    threading.Thread(
+                        target=self._refresh,
+                        args=(tenancy_id,),
+                        name="compartment-refresh",
+                        daemon=True,
+                    ).start()
+                return tree
+        # Load the tree in the current thread when there is no cached tree.
+        tree = CompartmentTree(self.loader(tenancy_id))
+        with self._lock:
+            self._trees[tenancy_id] = tree
+        return tree
+
+    def invalidate(self, tenancy_id=None):
+        """Removes the cached tree of a tenancy, or all trees if tenancy_id is None."""
+        with self._lock:
+            if tenancy_id is None:
+                self._trees.clear()
+            else:
+                self._trees.pop(tenancy_id, None)
+
+    def _refresh(self, tenancy_id):
+        try:
+            tree = CompartmentTree(self.loader(tenancy_id))
+            with self._lock:
+                self._trees[tenancy_id] = tree
+            logger.debug(
+                "Refreshed %s compartments in tenancy %s.",
+                len(tree.compartments),
+                tenancy_id,
+            )
+        except Exception:
+            logger.exception("Failed to refresh compartments in tenancy %s.", tenancy_id)
+        finally:
+            with self._lock:
+                self._refreshing.discard(tenancy_id)
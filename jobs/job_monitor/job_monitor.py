@@ -1,10 +1,15 @@
 import datetime
+import hashlib
 import json
 import logging
 import os
 import re
+import time
+import threading
 import traceback
 import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import ads
 import oci
@@ -20,9 +25,17 @@ from flask import (
     render_template_string,
     make_response,
     redirect,
+    Response,
+    stream_with_context,
 )
+from flask import json as flask_json
 
 import metric_query
+import metric_series
+from client_registry import ClientRegistry
+from compartment_cache import CompartmentCache
+from log_cache import LogCache
+from run_events import RunEventHub
 from ads.common.oci_datascience import OCIDataScienceMixin
 from ads.common.oci_resource import OCIResource
 from ads.jobs import DataScienceJobRun, Job, DataScienceJob
@@ -62,6 +75,28 @@ OCI_KEY_PROFILE_NAME = os.environ.get("OCI_KEY_PROFILE", "DEFAULT")
 if os.path.exists(os.path.expanduser(OCI_KEY_CONFIG_LOCATION)):
     logger.info("Using OCI API Key config: %s", OCI_KEY_CONFIG_LOCATION)
     logger.info("Using OCI API Key profile: %s", OCI_KEY_PROFILE_NAME)
+
+# Authentication and OCI clients cache config, in seconds
+OCI_AUTH_CACHE_TTL = int(os.environ.get("OCI_AUTH_CACHE_TTL", 300))
+OCI_CLIENT_CACHE_TTL = int(os.environ.get("OCI_CLIENT_CACHE_TTL", 3600))
+OCI_SIGNER_REFRESH_INTERVAL = int(os.environ.get("OCI_SIGNER_REFRESH_INTERVAL", 600))
+COMPARTMENT_CACHE_TTL = int(
+    os.environ.get("COMPARTMENT_CACHE_TTL", config.get("compartment_cache_ttl", 600))
+)
+# Maximum number of concurrent metric queries in a batch request
+METRICS_QUERY_WORKERS = int(os.environ.get("METRICS_QUERY_WORKERS", 8))
+# Maximum number of job runs to be listed for each job
+JOB_RUNS_LIMIT = int(os.environ.get("JOB_RUNS_LIMIT", 50))
+# Maximum number of rendered job run HTML to be cached
+RENDER_CACHE_SIZE = int(os.environ.get("RENDER_CACHE_SIZE", 1000))
+# Log cache config
+LOG_CACHE_MAX_RUNS = int(os.environ.get("LOG_CACHE_MAX_RUNS", 100))
+LOG_CACHE_LINES = int(os.environ.get("LOG_CACHE_LINES", 10000))
+LOG_CACHE_MAX_COMPLETE_RUNS = int(os.environ.get("LOG_CACHE_MAX_COMPLETE_RUNS", 1000))
+# Push channel config, in seconds
+EVENTS_POLL_INTERVAL = int(os.environ.get("EVENTS_POLL_INTERVAL", 10))
+EVENTS_METRICS_INTERVAL = int(os.environ.get("EVENTS_METRICS_INTERVAL", 60))
+
 # Flask templates location
 app = Flask(
     __name__, template_folder=os.path.join(os.path.dirname(__file__), "templates")
@@ -84,8 +119,8 @@ def instance_principal_available():
         return False
 
 
-def get_authentication():
-    """Returns a dictionary containing the authentication needed for initializing OCI client (e.g. DataScienceClient).
+def load_authentication():
+    """Loads a dictionary containing the authentication needed for initializing OCI client (e.g. DataScienceClient).
     This function checks if OCI API key config exists, if config exists, it will be loaded and used for authentication.
     If config does not exist, resource principal or instance principal will be used if available.
     To use a config at a non-default location, set the OCI_KEY_LOCATION environment variable.
@@ -126,6 +161,21 @@ def get_authentication():
     return oci_auth
 
 
+clients = ClientRegistry(
+    load_authentication,
+    auth_ttl=OCI_AUTH_CACHE_TTL,
+    client_ttl=OCI_CLIENT_CACHE_TTL,
+    refresh_interval=OCI_SIGNER_REFRESH_INTERVAL,
+)
+
+
+def get_authentication():
+    """Returns the cached authentication dictionary for initializing OCI client.
+    See load_authentication() for details.
+    """
+    return clients.get_authentication()
+
+
 def load_oci_config():
     if not os.path.exists(os.path.expanduser(OCI_KEY_CONFIG_LOCATION)):
         return {}
@@ -215,27 +265,9 @@ def list_all_child_compartments(client: oci.identity.IdentityClient, compartment
     return compartments
 
 
-def init_components(compartment_id, project_id):
-    limit = request.args.get("limit", 10)
-    endpoint = check_endpoint()
-
-    if project_id:
-        compartment_id, project_id = check_compartment_project(
-            compartment_id, project_id
-        )
-    else:
-        compartment_id = None
-
-    auth = get_authentication()
-    if auth["config"]:
-        if "override_tenancy" in auth["config"]:
-            tenancy_id = auth["config"]["override_tenancy"]
-        else:
-            tenancy_id = auth["config"]["tenancy"]
-    else:
-        tenancy_id = auth["signer"].tenancy_id
-    logger.debug(f"Tenancy ID: {tenancy_id}")
-    client = oci.identity.IdentityClient(**auth)
+def load_compartments(tenancy_id):
+    """Loads the list of compartments in a tenancy, with the root compartment as the first item."""
+    client = clients.get_client(oci.identity.IdentityClient)
     compartments = []
     # User may not have permissions to list compartment.
     try:
@@ -248,7 +280,7 @@ def init_components(compartment_id, project_id):
             "ERROR: Unable to list all sub compartment in tenancy %s.", tenancy_id
         )
         try:
-            compartments.append(
+            compartments.extend(
                 list_all_child_compartments(client, compartment_id=tenancy_id)
             )
         except Exception as ex:
@@ -270,6 +302,36 @@ def init_components(compartment_id, project_id):
                 id=tenancy_id, name=" ** Root - Name N/A **"
             ),
         )
+    return compartments
+
+
+compartment_cache = CompartmentCache(load_compartments, ttl=COMPARTMENT_CACHE_TTL)
+
+
+def get_tenancy_id():
+    auth = get_authentication()
+    if auth["config"]:
+        if "override_tenancy" in auth["config"]:
+            return auth["config"]["override_tenancy"]
+        return auth["config"]["tenancy"]
+    return auth["signer"].tenancy_id
+
+
+def init_components(compartment_id, project_id):
+    limit = request.args.get("limit", 10)
+    endpoint = check_endpoint()
+
+    if project_id:
+        compartment_id, project_id = check_compartment_project(
+            compartment_id, project_id
+        )
+    else:
+        compartment_id = None
+
+    tenancy_id = get_tenancy_id()
+    logger.debug(f"Tenancy ID: {tenancy_id}")
+    # Compartments are listed in the dropdown under their parent compartment.
+    compartments = compartment_cache.get(tenancy_id).hierarchy()
     context = dict(
         compartment_id=compartment_id,
         project_id=project_id,
@@ -299,8 +361,8 @@ def list_jobs(compartment_id, project_id):
 
     # Calling OCI API here instead of ADS API is faster :)
     jobs = (
-        oci.data_science.DataScienceClient(
-            service_endpoint=endpoint, **get_authentication()
+        clients.get_client(
+            oci.data_science.DataScienceClient, service_endpoint=endpoint
         )
         .list_jobs(
             compartment_id=compartment_id,
@@ -326,31 +388,97 @@ def list_jobs(compartment_id, project_id):
     return jsonify({"limit": limit, "jobs": job_list})
 
 
+def list_recent_job_runs(job_id, compartment_id, limit, endpoint=None):
+    """Lists the most recent job runs of a job, excluding the deleted ones.
+    The job runs are fetched page by page, and the listing stops once there are enough job runs.
+    """
+    if limit <= 0:
+        return []
+    client = clients.get_client(
+        oci.data_science.DataScienceClient, service_endpoint=endpoint
+    )
+    runs = []
+    for summary in oci.pagination.list_call_get_all_results_generator(
+        client.list_job_runs,
+        "record",
+        compartment_id=compartment_id,
+        job_id=job_id,
+        sort_by="timeCreated",
+        sort_order="DESC",
+        limit=min(limit + 5, 100),
+    ):
+        if summary.lifecycle_state == "DELETED":
+            continue
+        runs.append(DataScienceJobRun.from_oci_model(summary))
+        if len(runs) >= limit:
+            break
+    return runs
+
+
+job_run_html_cache = OrderedDict()
+job_run_html_lock = threading.Lock()
+
+
+def render_job_run(run, job, job_yaml=None):
+    """Renders the HTML of a job run.
+    The HTML is cached until the lifecycle state, details or finish time of the job run changes,
+    or the job is updated.
+    job_yaml is the YAML of the job, which can be passed to avoid serializing the job for each run.
+    """
+    if job_yaml is None:
+        job_yaml = str(job)
+    key = (
+        run.id,
+        run.lifecycle_state,
+        run.lifecycle_details,
+        run.time_finished,
+        job.id,
+        hashlib.sha256(job_yaml.encode("utf-8")).hexdigest(),
+    )
+    with job_run_html_lock:
+        html = job_run_html_cache.get(key)
+        if html is not None:
+            job_run_html_cache.move_to_end(key)
+            return html
+    html = render_template("job_run_template.html", run=run, job=job)
+    with job_run_html_lock:
+        job_run_html_cache[key] = html
+        while len(job_run_html_cache) > RENDER_CACHE_SIZE:
+            job_run_html_cache.popitem(last=False)
+    return html
+
+
 @app.route("/job_runs/<job_id>")
 def list_job_runs(job_id):
     check_ocid(job_id)
-    check_endpoint()
+    endpoint = check_endpoint()
+    limit = request.args.get("limit", JOB_RUNS_LIMIT)
+    if isinstance(limit, str) and not limit.isdigit():
+        abort_with_json_error(400, "limit parameter must be an integer.")
+    limit = int(limit)
     job = Job.from_datascience_job(job_id)
-    runs = job.run_list()
+    runs = list_recent_job_runs(
+        job.id, job.infrastructure.compartment_id, limit, endpoint=endpoint
+    )
+    # The job YAML is rendered in the HTML of each job run.
+    job_yaml = str(job)
     run_list = []
     for run in runs:
-        if run.status == "DELETED":
-            continue
         run_data = {
             "ocid": run.id,
             "job_ocid": job.id,
-            "html": render_template("job_run_template.html", run=run, job=job),
+            "html": render_job_run(run, job, job_yaml),
         }
         run_list.append(run_data)
-    return jsonify({"runs": run_list})
+    return jsonify({"limit": limit, "runs": run_list})
 
 
 @app.route("/projects/<compartment_id>")
 def list_projects(compartment_id):
     endpoint = check_endpoint()
     logger.debug(f"Getting projects in compartment {compartment_id}")
-    ds_client = oci.data_science.DataScienceClient(
-        service_endpoint=endpoint, **get_authentication()
+    ds_client = clients.get_client(
+        oci.data_science.DataScienceClient, service_endpoint=endpoint
     )
     projects = oci.pagination.list_call_get_all_results(
         ds_client.list_projects, compartment_id=compartment_id, sort_by="displayName"
@@ -367,36 +495,42 @@ def list_projects(compartment_id):
     return jsonify(context)
 
 
-def format_logs(logs):
-    for log in logs:
-        if str(log["time"]).endswith("Z"):
-            log["time"] = log["time"].split(".")[0].replace("T", " ")
-        else:
-            log["time"] = str(log["time"])
-    logs = sorted(logs, key=lambda x: x["time"] if x["time"] else "")
-    logs = [str(log["time"]) + " " + log["message"] for log in logs]
-    return logs
+log_cache = LogCache(
+    max_runs=LOG_CACHE_MAX_RUNS,
+    capacity=LOG_CACHE_LINES,
+    max_complete_runs=LOG_CACHE_MAX_COMPLETE_RUNS,
+)
 
 
 @app.route("/logs/<job_run_ocid>")
 def get_logs(job_run_ocid):
+    """Returns the logs of a job run.
+    When the since parameter is specified with the cursor returned by the previous call,
+    only the new log lines will be returned.
+    If reset is True in the response, the logs contain all the cached lines and should replace the existing ones.
+    """
+    since = request.args.get("since")
+    if since is not None and not since.isdigit():
+        abort_with_json_error(400, "since parameter must be an integer.")
     logger.debug(f"Getting logs for {job_run_ocid}...")
     run = DataScienceJobRun.from_ocid(job_run_ocid)
     logger.debug(f"Job Run Status: {run.lifecycle_state} - {run.lifecycle_details}")
+    stopped = run.lifecycle_state in DataScienceJobRun.TERMINAL_STATES
     if not run.log_id:
-        logs = []
+        result = {"logs": [], "cursor": 0, "reset": True}
     else:
-        logs = run.logs()
-        logs = format_logs(logs)
-    logger.debug(f"{job_run_ocid} - {len(logs)} log messages.")
+        result = log_cache.get(run, terminal=stopped).since(
+            int(since) if since is not None else None
+        )
+    logger.debug(f"{job_run_ocid} - {len(result['logs'])} log messages.")
     context = {
         "ocid": job_run_ocid,
-        "logs": logs,
+        "logs": result["logs"],
+        "cursor": result["cursor"],
+        "reset": result["reset"],
         "status": run.lifecycle_state,
         "statusDetails": run.lifecycle_details,
-        "stopped": True
-        if run.lifecycle_state in DataScienceJobRun.TERMINAL_STATES
-        else False,
+        "stopped": stopped,
     }
     return jsonify(context)
 
@@ -512,10 +646,11 @@ def get_custom_metrics_namespace(job_run):
     return job_envs.get(CUSTOM_METRICS_NAMESPACE_ENV)
 
 
-def get_metrics_list(ocid):
-    job_run = DataScienceJobRun.from_ocid(ocid)
+def get_metrics_list(ocid, job_run=None):
+    if job_run is None:
+        job_run = DataScienceJobRun.from_ocid(ocid)
     custom_metric_namespace = get_custom_metrics_namespace(job_run)
-    client = oci.monitoring.MonitoringClient(**get_authentication())
+    client = clients.get_client(oci.monitoring.MonitoringClient)
     service_metrics = metric_query.list_job_run_metrics(
         job_run, SERVICE_METRICS_NAMESPACE, SERVICE_METRICS_DIMENSION, client
     )
@@ -558,18 +693,24 @@ def list_metrics(ocid):
     )
 
 
-@app.route("/metrics/<name>/<ocid>")
-def get_metrics(name, ocid):
-    job_run = DataScienceJobRun.from_ocid(ocid)
+def query_metric_series(job_run, name):
+    """Queries the values of a metric for a job run.
+
+    Returns
+    -------
+    list
+        A list of series, one for each unique combination of dimension values.
+        Each series is a list of dictionaries with timestamp and value.
+    """
     if name.startswith("gpu"):
         metric_namespace = get_custom_metrics_namespace(job_run)
         dimension = CUSTOM_METRICS_DIMENSION
     else:
-        metric_namespace = "oci_datascience_jobrun"
+        metric_namespace = SERVICE_METRICS_NAMESPACE
         dimension = SERVICE_METRICS_DIMENSION
     run_metrics = []
     if metric_namespace and job_run.time_started:
-        client = oci.monitoring.MonitoringClient(**get_authentication())
+        client = clients.get_client(oci.monitoring.MonitoringClient)
         results = metric_query.get_metric_values(
             job_run,
             name,
@@ -589,26 +730,236 @@ def get_metrics(name, ocid):
                         for p in result.aggregated_datapoints
                     ]
                 )
-    timestamps = set()
-    datasets = []
-    for metric in run_metrics:
-        timestamps.update([p["timestamp"] for p in metric])
-        datasets.append({p["timestamp"]: p["value"] for p in metric})
-    timestamps = list(timestamps)
-    timestamps.sort()
-    values = []
-    for dataset in datasets:
-        values.append([dataset.get(timestamp) for timestamp in timestamps])
+    return run_metrics
+
+
+def check_downsample():
+    """Returns the width and the downsampling method specified in the request.
+    The downsampling method can be "lttb" (default) or "minmax".
+    """
+    width = request.args.get("width")
+    if width is not None and not width.isdigit():
+        abort_with_json_error(400, "width parameter must be an integer.")
+    method = request.args.get("downsample", "lttb")
+    if method not in metric_series.DOWNSAMPLE_METHODS:
+        abort_with_json_error(
+            400,
+            f"downsample parameter must be one of {metric_series.DOWNSAMPLE_METHODS}.",
+        )
+    return int(width) if width else None, method
+
+
+def align_metric_series(run_metrics):
+    """Aligns multiple series on a single sorted timestamp axis.
+    Missing values are filled with None.
+    The series are downsampled when the width parameter is specified in the request.
+
+    Returns
+    -------
+    tuple
+        A list of timestamps and a list of values for each series.
+    """
+    width, method = check_downsample()
+    return metric_series.align_series(run_metrics, width=width, method=method)
+
+
+@app.route("/metrics/<name>/<ocid>")
+def get_metrics(name, ocid):
+    job_run = DataScienceJobRun.from_ocid(ocid)
+    timestamps, values = align_metric_series(query_metric_series(job_run, name))
     datasets = [{"label": f"#{i}", "data": v} for i, v in enumerate(values, start=1)]
     return jsonify(
         {
-            "metrics": get_metrics_list(ocid),
+            "metrics": get_metrics_list(ocid, job_run=job_run),
             "timestamps": timestamps,
             "datasets": datasets,
         }
     )
 
 
+def query_metrics_batch(job_run, names=None, width=None, method="lttb"):
+    """Queries multiple metrics of a job run concurrently and aligns the values on the same timestamps.
+
+    Returns
+    -------
+    dict
+        A dictionary containing metrics (the list of available metrics), timestamps and datasets.
+        datasets is a dictionary mapping each metric name to the list of series of the metric.
+    """
+    metrics = get_metrics_list(job_run.id, job_run=job_run)
+    if not names:
+        names = [metric["key"] for metric in metrics]
+
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(METRICS_QUERY_WORKERS, len(names)))
+    ) as executor:
+        results = list(
+            executor.map(lambda name: query_metric_series(job_run, name), names)
+        )
+
+    # Align all series of all metrics on the same timestamps.
+    timestamps, values = metric_series.align_series(
+        [series for run_metrics in results for series in run_metrics],
+        width=width,
+        method=method,
+    )
+    datasets = {}
+    offset = 0
+    for name, run_metrics in zip(names, results):
+        datasets[name] = [
+            {"label": f"#{i}", "data": v}
+            for i, v in enumerate(values[offset : offset + len(run_metrics)], start=1)
+        ]
+        offset += len(run_metrics)
+    return {
+        "metrics": metrics,
+        "timestamps": timestamps,
+        "datasets": datasets,
+    }
+
+
+@app.route("/metrics/batch/<ocid>")
+def get_metrics_batch(ocid):
+    """Returns the values of multiple metrics of a job run aligned on the same timestamps.
+    The metric names can be specified as comma separated values in the names parameter,
+    e.g. /metrics/batch/<ocid>?names=CpuUtilization,MemoryUtilization
+    All available metrics will be returned if names is not specified.
+    """
+    check_ocid(ocid)
+    width, method = check_downsample()
+    job_run = DataScienceJobRun.from_ocid(ocid)
+    names = [name for name in request.args.get("names", "").split(",") if name]
+    return jsonify(query_metrics_batch(job_run, names, width=width, method=method))
+
+
+def metrics_delta(previous, current):
+    """Returns the metric values in current which are not in previous.
+    All values are returned with reset set to True if the previous values are not a prefix of the current values.
+    """
+    size = len(previous["timestamps"]) if previous else 0
+    if (
+        not previous
+        or previous["timestamps"] != current["timestamps"][:size]
+        or previous["datasets"].keys() != current["datasets"].keys()
+        or any(
+            [series["data"] for series in previous["datasets"][name]]
+            != [series["data"][:size] for series in current["datasets"][name]]
+            for name in current["datasets"]
+        )
+    ):
+        return dict(current, reset=True)
+    return {
+        "metrics": current["metrics"],
+        "timestamps": current["timestamps"][size:],
+        "datasets": {
+            name: [
+                {"label": series["label"], "data": series["data"][size:]}
+                for series in datasets
+            ]
+            for name, datasets in current["datasets"].items()
+        },
+        "reset": False,
+    }
+
+
+def poll_run_events(job_run_ocid, state):
+    """Polls the status, logs and metrics of a job run and returns the events for the changes since the last poll.
+    The polling is done once the job run is in a terminal state and the full logs are cached.
+    """
+    run = DataScienceJobRun.from_ocid(job_run_ocid)
+    stopped = run.lifecycle_state in DataScienceJobRun.TERMINAL_STATES
+    events = []
+    status = {
+        "ocid": job_run_ocid,
+        "status": run.lifecycle_state,
+        "statusDetails": run.lifecycle_details,
+        "stopped": stopped,
+    }
+    if status != state.get("status"):
+        state["status"] = status
+        events.append(("status", status))
+
+    done = stopped
+    if run.log_id:
+        run_logs = log_cache.get(run, terminal=stopped)
+        result = run_logs.since(state.get("cursor"))
+        state["logs"] = run_logs
+        state["cursor"] = result["cursor"]
+        if result["logs"] or result["reset"]:
+            events.append(("logs", result))
+        done = stopped and run_logs.complete
+
+    now = time.monotonic()
+    if done or now - state.get("metrics_polled_at", 0) >= EVENTS_METRICS_INTERVAL:
+        state["metrics_polled_at"] = now
+        metrics = query_metrics_batch(run)
+        delta = metrics_delta(state.get("metrics"), metrics)
+        state["metrics"] = metrics
+        if delta["reset"] or delta["timestamps"]:
+            events.append(("metrics", delta))
+    return events, done
+
+
+def snapshot_run_events(job_run_ocid, state):
+    """Returns the events representing the latest state of a job run for a new subscriber."""
+    events = []
+    if "status" in state:
+        events.append(("status", state["status"]))
+    if "logs" in state:
+        events.append(("logs", state["logs"].since(None, until=state["cursor"])))
+    if "metrics" in state:
+        events.append(("metrics", dict(state["metrics"], reset=True)))
+    return events
+
+
+run_events = RunEventHub(
+    poll_run_events, snapshot_run_events, interval=EVENTS_POLL_INTERVAL
+)
+
+
+@app.route("/events")
+def stream_events():
+    """Streams the status, logs and metrics updates of job runs as server-sent events.
+    The OCIDs of the job runs are specified by the runs parameter, separated by commas,
+    so that a browser tab keeps a single connection for all the job runs on the page.
+    A single poller is shared by all clients subscribing to the same job run.
+    The data of each event contains the OCID of the job run as run.
+    An end event is sent once a job run is in a terminal state and the full logs are sent,
+    and the stream ends when all job runs ended.
+    """
+    job_run_ocids = [ocid for ocid in request.args.get("runs", "").split(",") if ocid]
+    if not job_run_ocids:
+        abort_with_json_error(400, "runs parameter must contain at least one job run OCID.")
+    for job_run_ocid in job_run_ocids:
+        check_ocid(job_run_ocid)
+    subscription = run_events.subscribe(job_run_ocids)
+
+    def generate():
+        try:
+            for item in subscription:
+                if item is None:
+                    # Keep-alive comment, which also detects disconnected clients.
+                    yield ": keep-alive\n\n"
+                    continue
+                job_run_ocid, event, data = item
+                data = {"run": job_run_ocid, "data": data}
+                yield f"event: {event}\ndata: {flask_json.dumps(data)}\n\n"
+        finally:
+            subscription.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/health")
+def health():
+    """Returns the status of the app and the statistics of the OCI auth and client cache."""
+    return jsonify({"status": "ok", "client_cache": clients.stats()})
+
+
 @app.route("/shapes/<compartment_ocid>")
 def supported_shapes(compartment_ocid):
     shapes = [
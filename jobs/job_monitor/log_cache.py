@@ -0,0 +1,266 @@
+import datetime
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+logger = logging.getLogger(__name__)
+
+
+def format_logs(logs):
+    for log in logs:
+        if str(log["time"]).endswith("Z"):
+            log["time"] = log["time"].split(".")[0].replace("T", " ")
+        else:
+            log["time"] = str(log["time"])
+    logs = sorted(logs, key=lambda x: x["time"] if x["time"] else "")
+    logs = [str(log["time"]) + " " + log["message"] for log in logs]
+    return logs
+
+
+def parse_log_time(value):
+    """Parses the time of a log record into a timezone aware datetime, or returns None if it cannot be parsed."""
+    if isinstance(value, datetime.datetime):
+        return value
+    try:
+        timestamp = datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    return timestamp
+
+
+class RunLogs:
+    """Log lines of a job run, numbered with an increasing sequence number.
+
+    Each line is stored with its sequence number, which is used as the cursor for tailing the logs.
+    When capacity is specified, only the most recent lines are kept.
+    """
+
+    def __init__(self, capacity=None, start_seq=0) -> None:
+        self.lines = deque(maxlen=capacity)
+        self.seq = start_seq
+        self.latest_time = None
+        self.seen = set()
+        self.complete = False
+        self.fetched_at = None
+        self.terminal_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def first_seq(self):
+        """The sequence number of the oldest line in the buffer."""
+        return self.lines[0][0] if self.lines else self.seq + 1
+
+    def add(self, records: list) -> int:
+        """Adds new log records, skipping the records already added.
+
+        Parameters
+        ----------
+        records : list
+            A list of log records (dictionaries with id, time and message) from OCI logging.
+
+        Returns
+        -------
+        int
+            The number of lines added.
+        """
+        new_records = []
+        for record in records:
+            key = self._record_key(record)
+            if key in self.seen:
+                continue
+            self.seen.add(key)
+            new_records.append(record)
+            record_time = parse_log_time(record.get("time"))
+            if record_time and (not self.latest_time or record_time > self.latest_time):
+                self.latest_time = record_time
+        # The next query starts from the latest time,
+        # only the records at the latest time could be returned again.
+        if records and self.latest_time is not None:
+            self.seen = {
+                self._record_key(record)
+                for record in records
+                if parse_log_time(record.get("time")) == self.latest_time
+            } or self.seen
+        for line in format_logs(new_records):
+            self.seq += 1
+            self.lines.append((self.seq, line))
+        return len(new_records)
+
+    @staticmethod
+    def _record_key(record):
+        return record.get("id") or (record.get("time"), record.get("message"))
+
+    def since(self, cursor=None, until=None) -> dict:
+        """Returns the lines after the cursor.
+
+        Parameters
+        ----------
+        cursor : int, optional
+            The sequence number of the last line received by the client.
+        until : int, optional
+            The sequence number of the last line to be returned, by default None, up to the latest line.
+
+        Returns
+        -------
+        dict
+            A dictionary containing logs, cursor and reset.
+            When reset is True, logs contains all lines in the buffer and the client should replace the existing lines.
+        """
+        if until is None or until > self.seq:
+            until = self.seq
+        reset = cursor is None or cursor < self.first_seq - 1 or cursor > until
+        if reset:
+            cursor = 0
+        lines = [line for seq, line in self.lines if cursor < seq <= until]
+        return {"logs": lines, "cursor": until, "reset": reset}
+
+
+class LogCache:
+    """Caches the logs of job runs so that each poll only fetches and returns new log lines.
+
+    The logs of active runs are kept in ring buffers of capacity lines,
+    and at most max_runs active runs are cached, with the least recently used evicted first.
+    Once a run reaches a terminal state and finalize_delay seconds have passed,
+    the full logs are fetched for the last time and kept for at most max_complete_runs runs,
+    with the least recently used evicted first.
+    New logs are fetched in pages of page_size records, oldest first, until all records are fetched.
+    """
+
+    def __init__(
+        self,
+        max_runs=100,
+        capacity=10000,
+        min_refresh_interval=5,
+        finalize_delay=60,
+        max_complete_runs=1000,
+        page_size=1000,
+    ) -> None:
+        """Initializes the cache.
+
+        Parameters
+        ----------
+        max_runs : int, optional
+            The maximum number of active runs to be cached, by default 100.
+        capacity : int, optional
+            The maximum number of lines to be kept for each active run, by default 10000.
+        min_refresh_interval : int, optional
+            Minimum number of seconds between fetching logs of the same run from OCI, by default 5.
+        finalize_delay : int, optional
+            Number of seconds to keep checking new logs after the run reaches a terminal state, by default 60.
+            Logs may still be processed by the OCI logging service after the run is stopped.
+        max_complete_runs : int, optional
+            The maximum number of finished runs to be cached with their full logs, by default 1000.
+        page_size : int, optional
+            The maximum number of log records fetched from OCI with a single query, by default 1000.
+        """
+        self.max_runs = max_runs
+        self.capacity = capacity
+        self.min_refresh_interval = min_refresh_interval
+        self.finalize_delay = finalize_delay
+        self.max_complete_runs = max_complete_runs
+        self.page_size = page_size
+        self._active = OrderedDict()
+        self._complete = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, run, terminal: bool) -> RunLogs:
+        """Returns the cached logs of a job run, fetching new logs from OCI if needed.
+
+        Parameters
+        ----------
+        run : DataScienceJobRun
+            The job run.
+        terminal : bool
+            Whether the job run is in a terminal state.
+
+        Returns
+        -------
+        RunLogs
+            The logs of the job run.
+        """
+        with self._lock:
+            run_logs = self._complete.get(run.id)
+            if run_logs:
+                self._complete.move_to_end(run.id)
+                return run_logs
+            run_logs = self._active.get(run.id)
+            if run_logs is None:
+                run_logs = RunLogs(capacity=self.capacity)
+                self._active[run.id] = run_logs
+            self._active.move_to_end(run.id)
+            while len(self._active) > self.max_runs:
+                self._active.popitem(last=False)
+
+        with run_logs.lock:
+            now = time.monotonic()
+            if terminal and run_logs.terminal_at is None:
+                run_logs.terminal_at = now
+            if (
+                run_logs.fetched_at is not None
+                and now - run_logs.fetched_at < self.min_refresh_interval
+            ):
+                return run_logs
+            if terminal and now - run_logs.terminal_at >= self.finalize_delay:
+                return self._finalize(run, run_logs)
+            if run_logs.latest_time is None:
+                run_logs.add(run.logs())
+            else:
+                self._fetch_new_logs(run, run_logs)
+            run_logs.fetched_at = now
+        return run_logs
+
+    def _fetch_new_logs(self, run, run_logs: RunLogs):
+        """Fetches all the log records since the latest time of the cached logs, page by page.
+
+        tail() only returns the most recent records,
+        the records are fetched oldest first instead, starting each page from the latest record fetched.
+        """
+        while True:
+            latest_time = run_logs.latest_time
+            records = run.logging.head(
+                source=run.id, limit=self.page_size, time_start=latest_time
+            )
+            run_logs.add(records)
+            if len(records) < self.page_size:
+                return
+            if run_logs.latest_time == latest_time:
+                # More than page_size records at the same time, the next page would be the same.
+                logger.warning(
+                    "More than %s log records at %s for %s.",
+                    self.page_size,
+                    latest_time,
+                    run.id,
+                )
+                return
+
+    def _finalize(self, run, run_logs: RunLogs) -> RunLogs:
+        if run_logs.first_seq <= 1:
+            # No line has been dropped from the buffer, fetch the remaining logs and keep all the lines.
+            complete_logs = RunLogs(start_seq=0)
+            complete_logs.lines.extend(run_logs.lines)
+            complete_logs.seq = run_logs.seq
+            complete_logs.seen = run_logs.seen
+            complete_logs.latest_time = run_logs.latest_time
+            if run_logs.latest_time is None:
+                complete_logs.add(run.logs())
+            else:
+                self._fetch_new_logs(run, complete_logs)
+        else:
+            # Some lines have been dropped, fetch the full logs again.
+            # Numbering the lines after the existing ones tells the clients to reset.
+            complete_logs = RunLogs(start_seq=run_logs.seq + 1)
+            complete_logs.add(run.logs())
+        complete_logs.complete = True
+        complete_logs.fetched_at = time.monotonic()
+        with self._lock:
+            self._complete[run.id] = complete_logs
+            self._complete.move_to_end(run.id)
+            while len(self._complete) > self.max_complete_runs:
+                self._complete.popitem(last=False)
+            self._active.pop(run.id, None)
+        logger.debug("Cached %s log lines for %s.", len(complete_logs.lines), run.id)
+        return complete_logs
@@ -0,0 +1,141 @@
+import numpy as np
+
+
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+
+
+def align_series(run_metrics: list, width: int = None, method: str = "lttb") -> tuple:
+    """Aligns multiple metric series on a single sorted timestamp axis.
+
+    Parameters
+    ----------
+    run_metrics : list
+        A list of series. Each series is a list of dictionaries with timestamp and value.
+    width : int, optional
+        The maximum number of points to be returned, e.g. the width of the chart in pixels.
+        By default None, all points will be returned.
+    method : str, optional
+        The downsampling method, "lttb" (Largest-Triangle-Three-Buckets) or "minmax", by default "lttb".
+        Downsampling selects the same timestamps for all series, based on the maximum value across the series.
+        Each series is scaled to [0, 1] before taking the maximum,
+        so that the series with the largest values, e.g. a metric in another unit, does not decide for all series.
+
+    Returns
+    -------
+    tuple
+        A list of timestamps and a list of values for each series.
+        Values missing in a series are None.
+    """
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(
+            f"Invalid downsampling method: {method}. Supported methods: {DOWNSAMPLE_METHODS}"
+        )
+    if not run_metrics:
+        return [], []
+    # Keep the original timestamp objects so that they are serialized the same way.
+    all_timestamps = np.array(
+        [p["timestamp"] for metric in run_metrics for p in metric], dtype=object
+    )
+    if not len(all_timestamps):
+        return [], [[] for _ in run_metrics]
+    keys = np.array([_timestamp_key(t) for t in all_timestamps], dtype=np.float64)
+    axis, first_index = np.unique(keys, return_index=True)
+    timestamps = all_timestamps[first_index]
+
+    matrix = np.full((len(run_metrics), len(axis)), np.nan)
+    offset = 0
+    for row, metric in enumerate(run_metrics):
+        size = len(metric)
+        if size:
+            positions = np.searchsorted(axis, keys[offset : offset + size])
+            matrix[row, positions] = np.array(
+                [np.nan if p["value"] is None else p["value"] for p in metric],
+                dtype=np.float64,
+            )
+        offset += size
+
+    if width and len(axis) > width:
+        envelope = np.fmax.reduce(_scale_rows(matrix), axis=0)
+        envelope = np.nan_to_num(envelope, nan=0.0)
+        if method == "lttb":
+            selected = lttb_indices(axis, envelope, width)
+        else:
+            selected = minmax_indices(envelope, width)
+        timestamps = timestamps[selected]
+        matrix = matrix[:, selected]
+
+    values = np.where(np.isnan(matrix), None, matrix).tolist()
+    return timestamps.tolist(), values
+
+
+def _scale_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scales each row to [0, 1], ignoring NaN. Constant rows are scaled to 0."""
+    scaled = np.full(matrix.shape, np.nan)
+    for row, values in enumerate(matrix):
+        if np.isnan(values).all():
+            continue
+        low, high = np.nanmin(values), np.nanmax(values)
+        scaled[row] = (values - low) / (high - low) if high > low else values - low
+    return scaled
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Selects the indices of the points to keep with the Largest-Triangle-Three-Buckets algorithm.
+    At most threshold indices are returned.
+    """
+    size = len(x)
+    if threshold >= size:
+        return np.arange(size)
+    if threshold < 3:
+        # The maximum, or the first and last points.
+        return np.array([int(np.argmax(y))]) if threshold == 1 else np.array([0, size - 1])
+    # The first and last points are always selected.
+    # The points in between are split into (threshold - 2) buckets.
+    edges = np.linspace(1, size - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = size - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average point of the next bucket
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = size - 1, size
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+
+def minmax_indices(y: np.ndarray, threshold: int) -> np.ndarray:
+    """Selects the indices of the minimum and maximum points in (threshold / 2) buckets.
+    At most threshold indices are returned.
+    """
+    size = len(y)
+    if threshold >= size:
+        return np.arange(size)
+    if threshold < 2:
+        return np.array([int(np.argmax(y))])
+    buckets = threshold // 2
+    edges = np.linspace(0, size, buckets + 1).astype(int)
+    indices = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end <= start:
+            continue
+        bucket = y[start:end]
+        indices.append(start + int(np.argmin(bucket)))
+        indices.append(start + int(np.argmax(bucket)))
+    return np.unique(indices)
+
+
+def _timestamp_key(timestamp) -> float:
+    if hasattr(timestamp, "timestamp"):
+        return timestamp.timestamp()
+    return float(timestamp)
@@ -0,0 +1,177 @@
+import logging
+import queue
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """A subscriber of the events of one or more job runs.
+
+    Iterating the subscription yields (run_id, event, data) tuples,
+    and (run_id, "end", {}) once the poller of a job run is stopped.
+    None is yielded when there is no event within the keep-alive interval,
+    so that the caller can send a keep-alive message and detect disconnected clients.
+    The iteration stops when the pollers of all job runs are stopped.
+    """
+
+    END = "end"
+
+    def __init__(self, keep_alive=15) -> None:
+        self.keep_alive = keep_alive
+        self.queue = queue.Queue()
+        self.pollers = []
+
+    def put(self, run_id, event, data):
+        self.queue.put((run_id, event, data))
+
+    def end(self, run_id):
+        self.queue.put((run_id, self.END, {}))
+
+    def close(self):
+        for poller in self.pollers:
+            poller.unsubscribe(self)
+
+    def __iter__(self):
+        active = len(self.pollers)
+        while active:
+            try:
+                item = self.queue.get(timeout=self.keep_alive)
+            except queue.Empty:
+                yield None
+                continue
+            if item[1] == self.END:
+                active -= 1
+            yield item
+
+
+class RunPoller:
+    """Polls the updates of a job run in a background thread and sends the events to all subscribers."""
+
+    def __init__(self, hub, run_id, interval) -> None:
+        self.hub = hub
+        self.run_id = run_id
+        self.interval = interval
+        self.state = {}
+        self.subscribers = []
+        self.lock = threading.RLock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name=f"poller-{run_id}", daemon=True
+        )
+
+    def subscribe(self, subscription) -> bool:
+        """Adds a subscriber, or returns False if the poller is already stopped."""
+        with self.lock:
+            if self.stop_event.is_set():
+                return False
+            # Send the latest state to the new subscriber before any new event.
+            for event, data in self.hub.snapshot_fn(self.run_id, self.state):
+                subscription.put(self.run_id, event, data)
+            self.subscribers.append(subscription)
+        return True
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            if subscription in self.subscribers:
+                self.subscribers.remove(subscription)
+            no_subscriber = not self.subscribers
+        if no_subscriber:
+            self.stop()
+
+    def publish(self, event, data):
+        with self.lock:
+            for subscription in self.subscribers:
+                subscription.put(self.run_id, event, data)
+
+    def stop(self):
+        self.stop_event.set()
+        self.hub.remove(self)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                # Poll on a copy of the state without holding the lock,
+                # so that subscribing does not wait for the OCI calls.
+                state = dict(self.state)
+                events, done = self.hub.poll_fn(self.run_id, state)
+                # Events are published and the state is replaced while holding the lock,
+                # so that a new subscriber receives either the snapshot or the events, but not both.
+                with self.lock:
+                    self.state = state
+                    for event, data in events:
+                        self.publish(event, data)
+            except Exception as ex:
+                logger.exception("Failed to poll updates for %s.", self.run_id)
+                self.publish("error", {"error": str(ex)})
+                done = False
+            if done:
+                logger.debug("Stopped polling %s.", self.run_id)
+                break
+            self.stop_event.wait(self.interval)
+        with self.lock:
+            self.stop_event.set()
+            for subscription in self.subscribers:
+                subscription.end(self.run_id)
+            self.subscribers.clear()
+        self.stop()
+
+
+class RunEventHub:
+    """Keeps a single poller for each job run with subscribers.
+
+    The poller is started when the first client subscribes to a job run,
+    and stopped when the last client unsubscribes or when poll_fn reports the polling is done,
+    e.g. the job run reaches a terminal state.
+    """
+
+    def __init__(self, poll_fn, snapshot_fn, interval=10, keep_alive=15) -> None:
+        """Initializes the hub.
+
+        Parameters
+        ----------
+        poll_fn : callable
+            A function taking the job run OCID and a state dictionary owned by the poller.
+            It returns a list of (event, data) tuples and a boolean indicating if the polling is done.
+        snapshot_fn : callable
+            A function taking the job run OCID and the state dictionary.
+            It returns a list of (event, data) tuples representing the latest state for new subscribers.
+        interval : int, optional
+            Number of seconds between polls, by default 10.
+        keep_alive : int, optional
+            Number of seconds without events before yielding a keep-alive, by default 15.
+        """
+        self.poll_fn = poll_fn
+        self.snapshot_fn = snapshot_fn
+        self.interval = interval
+        self.keep_alive = keep_alive
+        self._pollers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, run_ids) -> Subscription:
+        """Subscribes to the events of a list of job runs, with a single subscription."""
+        subscription = Subscription(keep_alive=self.keep_alive)
+        for run_id in dict.fromkeys(run_ids):
+            while True:
+                with self._lock:
+                    poller = self._pollers.get(run_id)
+                    if poller is None or poller.stop_event.is_set():
+                        poller = RunPoller(self, run_id, self.interval)
+                        self._pollers[run_id] = poller
+                        poller.thread.start()
+                if poller.subscribe(subscription):
+                    subscription.pollers.append(poller)
+                    break
+        return subscription
+
+    def remove(self, poller):
+        with self._lock:
+            if self._pollers.get(poller.run_id) is poller:
+                self._pollers.pop(poller.run_id)
+
+    @property
+    def active_runs(self) -> list:
+        """The OCIDs of the job runs being polled."""
+        with self._lock:
+            return list(self._pollers.keys())
@@ -6,6 +6,16 @@ const LOG_CHECKING_INTERVAL = 20000;
 // Interval for checking new job runs
 const RUN_CHECKING_INTERVAL = 30000;
 var jobRunChecking = {};
+// Receive job run updates pushed by the server instead of polling.
+const USE_SERVER_EVENTS = typeof (EventSource) !== "undefined";
+// Metrics of the job runs pushed by the server.
+var runMetrics = {};
+// Output divs of the job runs receiving updates from the server, by OCID.
+var runEventOutputs = {};
+var runEventSource = null;
+var runEventReconnect = null;
+// Delay before reconnecting when the stream is interrupted, in milliseconds.
+const EVENTS_RECONNECT_DELAY = 5000;
 
 function initComponents(compartmentId, projectId) {
   // Load the list of project in the compartment.
@@ -38,48 +48,75 @@ function initComponents(compartmentId, projectId) {
   });
 }
 
+// Show the logs in the output div.
+// New logs are appended unless reset is true.
+function renderLogs(outputDiv, data) {
+  var ansiUp = new AnsiUp;
+  var htmlLogs = ansiUp.ansi_to_html(data.logs.join("\n"));
+  if (data.reset === false) {
+    // Append new logs
+    if (data.logs.length > 0) {
+      if (outputDiv.html().length > 0) htmlLogs = "\n" + htmlLogs;
+      outputDiv.append(htmlLogs);
+    }
+  } else {
+    // Replace all logs
+    outputDiv.html(htmlLogs);
+  }
+  outputDiv.data("cursor", data.cursor);
+  // Scroll to the bottom
+  outputDiv.scrollTop(outputDiv[0].scrollHeight);
+}
+
+// Show the status of the job run in the card containing the output div.
+function renderStatus(outputDiv, data) {
+  var parent = outputDiv.closest(".card");
+  var statusText = parent.find(".run-status");
+  statusText.text(data.status);
+  var statusDetailsText = parent.find(".run-status-details");
+  if (data.statusDetails !== null) {
+    statusDetailsText.text(data.status + " - " + data.statusDetails);
+  } else {
+    statusDetailsText.text(data.status);
+  }
+  if (data.stopped !== true) {
+    // Job is running
+    setCardStyle(parent, "border-primary");
+    statusText.addClass("text-primary");
+    parent.find(".card-header").addClass("bg-primary bg-opacity-10");
+  } else if (data.status === "SUCCEEDED") {
+    setCardStyle(parent, "border-success");
+    statusText.removeClass("text-primary").addClass("text-success");
+    parent.find(".card-header").removeClass("bg-primary").addClass("bg-success text-success bg-opacity-10");
+  } else if (data.status === "FAILED") {
+    setCardStyle(parent, "border-danger");
+    statusText.removeClass("text-primary").addClass("text-danger");
+    parent.find(".card-header").removeClass("bg-primary").addClass("bg-danger text-danger bg-opacity-10");
+  }
+}
+
 function updateLogs(ocid, outputDiv, stopped) {
   // console.log("Getting logs for " + ocid);
   // Get the most recent logs of each job
-  $.getJSON("/logs/" + ocid, function (data) {
+  // Only the new log lines after the cursor are returned.
+  var cursor = outputDiv.data("cursor");
+  var apiEndpoint = "/logs/" + ocid;
+  if (cursor !== undefined) apiEndpoint += "?since=" + cursor;
+  $.getJSON(apiEndpoint, function (data) {
     // console.log($("#" + ocid));
-    var ansiUp = new AnsiUp;
-    var htmlLogs = ansiUp.ansi_to_html(data.logs.join("\n"));
-    outputDiv.html(htmlLogs);
-    // Scroll to the bottom
-    outputDiv.scrollTop(outputDiv[0].scrollHeight);
-    parent = outputDiv.closest(".card");
-    statusText = parent.find(".run-status");
-    statusText.text(data.status);
-    statusDetailsText = parent.find(".run-status-details");
-    if (data.statusDetails !== null) {
-      statusDetailsText.text(data.status + " - " + data.statusDetails);
-    } else {
-      statusDetailsText.text(data.status);
-    }
+    renderLogs(outputDiv, data);
     updateMetrics(ocid);
     // If stopped is set to true, no further update will be performed.
     if (stopped === true) return;
 
+    renderStatus(outputDiv, data);
     if (data.stopped !== true) {
       // Job is running
       setTimeout(function () {
         updateLogs(ocid, outputDiv);
       }, LOG_CHECKING_INTERVAL);
-      setCardStyle(parent, "border-primary");
-      statusText.addClass("text-primary");
-      parent.find(".card-header").addClass("bg-primary bg-opacity-10");
     } else {
       // Job terminated
-      if (data.status === "SUCCEEDED") {
-        setCardStyle(parent, "border-success");
-        statusText.addClass("text-success");
-        parent.find(".card-header").addClass("bg-success text-success bg-opacity-10");
-      } else if (data.status === "FAILED") {
-        setCardStyle(parent, "border-danger");
-        statusText.addClass("text-danger");
-        parent.find(".card-header").addClass("bg-danger text-danger bg-opacity-10");
-      }
       // When job run is stop, there might be logs still being processed by the OCI logging service
       // Here we check the logs after some intervals hoping we can get all the logs.
       setTimeout(function () {
@@ -95,6 +132,67 @@ function updateLogs(ocid, outputDiv, stopped) {
   })
 }
 
+// Subscribe to the status, logs and metrics updates of a job run pushed by the server.
+// The job runs on the page share a single stream, so that the connections of the browser to the server are not used up.
+function subscribeEvents(ocid, outputDiv) {
+  runEventOutputs[ocid] = outputDiv;
+  // Reconnect once all the job runs being added are subscribed.
+  scheduleEventsConnection(0);
+}
+
+function scheduleEventsConnection(delay) {
+  if (runEventReconnect !== null) return;
+  runEventReconnect = setTimeout(function () {
+    runEventReconnect = null;
+    connectEvents();
+  }, delay);
+}
+
+// Open the stream for the job runs being updated, replacing the previous stream.
+// The server sends the latest state of each job run when the stream is opened,
+// and an end event once a job run is finished and all logs are received.
+function connectEvents() {
+  if (runEventSource !== null) runEventSource.close();
+  runEventSource = null;
+  var ocids = Object.keys(runEventOutputs);
+  if (ocids.length === 0) return;
+  var source = new EventSource("/events?runs=" + ocids.join(","));
+  runEventSource = source;
+  function listen(event, callback) {
+    source.addEventListener(event, function (e) {
+      var message = JSON.parse(e.data);
+      var outputDiv = runEventOutputs[message.run];
+      if (outputDiv !== undefined) callback(message.run, outputDiv, message.data);
+    });
+  }
+  listen("status", function (ocid, outputDiv, data) {
+    renderStatus(outputDiv, data);
+  });
+  listen("logs", function (ocid, outputDiv, data) {
+    renderLogs(outputDiv, data);
+  });
+  listen("metrics", function (ocid, outputDiv, data) {
+    mergeRunMetrics(ocid, data);
+    renderMetrics(ocid);
+  });
+  listen("end", function (ocid) {
+    delete runEventOutputs[ocid];
+    if (Object.keys(runEventOutputs).length === 0) {
+      // Stop the browser from reconnecting.
+      source.close();
+      runEventSource = null;
+    }
+  });
+  source.onerror = function (e) {
+    // Errors polling a job run are sent by the server as error events with data.
+    if (e.data !== undefined) return;
+    // Reconnect with the job runs still being updated, instead of the ones in the URL.
+    source.close();
+    if (runEventSource === source) runEventSource = null;
+    scheduleEventsConnection(EVENTS_RECONNECT_DELAY);
+  };
+}
+
 function setCardStyle(card, borderClass) {
   card.removeClass("border-primary");
   card.addClass(borderClass);
@@ -127,7 +225,7 @@ function loadJobs(compartmentId, projectId) {
     if (jobs.length === 0) {
       // Wait for the projects dropdown to be populated so that we can get the project name.
       setTimeout(() => {
-        var compartmentName = $("#compartments option[value='" + compartmentId + "']").text();
+        var compartmentName = $("#compartments option[value='" + compartmentId + "']").text().trim();
         var projectName = $("#projects option[value='" + projectId + "']").text();
         console.log("No job found in compartment: " + compartmentId + ", project: " + projectId);
         toastMessage("No Job", "There is no job in " + compartmentName + "/" + projectName);
@@ -241,6 +339,53 @@ function mergeChartData(chart, data) {
   chart.update();
 }
 
+// Merge the metrics pushed by the server into the metrics of the job run.
+function mergeRunMetrics(ocid, data) {
+  var existing = runMetrics[ocid];
+  if (data.reset !== false || existing === undefined) {
+    runMetrics[ocid] = {metrics: data.metrics, timestamps: data.timestamps, datasets: data.datasets};
+    return;
+  }
+  existing.metrics = data.metrics;
+  existing.timestamps = existing.timestamps.concat(data.timestamps);
+  $.each(data.datasets, function (name, series) {
+    for (let i = 0; i < series.length; i++) {
+      existing.datasets[name][i].data = existing.datasets[name][i].data.concat(series[i].data);
+    }
+  });
+}
+
+// Update the metric chart with the metrics pushed by the server.
+function renderMetrics(ocid) {
+  const canvasId = "metrics-" + ocid.replaceAll(".", "");
+  const ctx = document.getElementById(canvasId);
+  if (ctx === null || runMetrics[ocid] === undefined) return;
+  const data = runMetrics[ocid];
+  const metricDiv = $(ctx).closest(".job-run-metrics");
+  const metricName = metricDiv.find(".dropdown-menu .d-none a").data("val");
+  addMetricOptions(metricDiv.find(".dropdown-menu"), data.metrics);
+  // Copy the data so that the chart does not modify the cached metrics.
+  const chartData = {
+    timestamps: data.timestamps.slice(),
+    datasets: (data.datasets[metricName] || []).map(series => ({label: series.label, data: series.data.slice()}))
+  };
+  var chart = Chart.getChart(canvasId);
+  if (chart === undefined) {
+    newChart(ctx, chartData.timestamps, chartData.datasets);
+  } else {
+    mergeChartData(chart, chartData);
+  }
+}
+
+// Add the metrics which are not in the dropdown.
+function addMetricOptions(metricDropdown, metrics) {
+  $.each(metrics, function (i, metric) {
+    if (metricDropdown.find("[data-val='" + metric.key + "']").length == 0) {
+      metricDropdown.append('<li><a class="dropdown-item" data-val="' + metric.key + '" href="#">' + metric.display + '</a></li>');
+    }
+  })
+}
+
 // Check if there are new metric data and update the metric chart
 function updateMetrics(ocid) {
   const canvasId = "metrics-" + ocid.replaceAll(".", "");
@@ -250,12 +395,7 @@ function updateMetrics(ocid) {
   const metricName = $(ctx).closest(".job-run-metrics").find(".dropdown-menu .d-none a").data("val");
   $.getJSON("/metrics/" + metricName + "/" + ocid, function (data) {
     // Refresh the list of the metrics
-    const metricDropdown = $(ctx).closest(".job-run-metrics").find(".dropdown-menu");
-    $.each(data.metrics, function (i, metric) {
-      if (metricDropdown.find("[data-val='" + metric.key + "']").length == 0) {
-        metricDropdown.append('<li><a class="dropdown-item" data-val="' + metric.key + '" href="#">' + metric.display + '</a></li>');
-      }
-    })
+    addMetricOptions($(ctx).closest(".job-run-metrics").find(".dropdown-menu"), data.metrics);
     var chart = Chart.getChart(canvasId);
     if (chart === undefined) {
       // Create a new chart
@@ -287,10 +427,15 @@ function addJobRun(jobRow, run) {
     });
 
     // Load logs.
+    // Use the server push channel when it is supported by the browser.
     $(jobRunSelector + " .run-monitor").each(function () {
       var ocid = this.id;
       var outputDiv = $(this).find(".card-body.logs pre");
-      updateLogs(ocid, outputDiv);
+      if (USE_SERVER_EVENTS) {
+        subscribeEvents(ocid, outputDiv);
+      } else {
+        updateLogs(ocid, outputDiv);
+      }
     });
   }
 }
@@ -367,6 +512,11 @@ function metricDropdownClicked(element) {
 
   const canvasId = metricDiv.find("canvas").attr("id");
   const ocid = metricDiv.closest(".run-monitor").attr("id");
+  // Use the metrics pushed by the server if available.
+  if (runMetrics[ocid] !== undefined) {
+    renderMetrics(ocid);
+    return;
+  }
   // Update the metric chart
   $.getJSON("/metrics/" + metricLink.data("val") + "/" + ocid, function (data) {
     var chart = Chart.getChart(canvasId);
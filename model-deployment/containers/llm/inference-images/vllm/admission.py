@@ -0,0 +1,241 @@
+"""Admission control and metrics for vllm-api-server.py
+
+AdmissionController bounds the number of requests running in the engine and
+queues the others, one queue for each client served in round robin, so that a
+client sending many requests does not delay the others. When the queue is full,
+requests are rejected with the number of seconds to wait before retrying.
+
+ServerMetrics keeps histograms of time to first token, inter-token latency,
+queue wait and tokens/sec, rendered in the Prometheus text format by /metrics.
+"""
+import asyncio
+import bisect
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+# Buckets of the histograms, in seconds
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+# Buckets of the tokens/sec histogram
+THROUGHPUT_BUCKETS = [1, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+
+class Overloaded(Exception):
+    """The request is rejected, it can be retried after retry_after seconds"""
+
+    def __init__(self, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class Histogram:
+    """Cumulative histogram in the Prometheus format"""
+
+    def __init__(self, name: str, documentation: str, buckets: List[float]):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets + [math.inf], self.counts):
+            cumulative += count
+            le = "+Inf" if bound == math.inf else repr(float(bound))
+            lines.append(f'{self.name}_bucket{{le="{le}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class ServerMetrics:
+    """Metrics of the /predict requests"""
+
+    def __init__(self):
+        self.ttft = Histogram(
+            "vllm_time_to_first_token_seconds",
+            "Time from the arrival of the request to its first generated token.",
+            LATENCY_BUCKETS,
+        )
+        self.inter_token_latency = Histogram(
+            "vllm_inter_token_latency_seconds",
+            "Time between two generated tokens of a request.",
+            LATENCY_BUCKETS,
+        )
+        self.queue_wait = Histogram(
+            "vllm_queue_wait_seconds",
+            "Time spent by a request in the admission queue.",
+            LATENCY_BUCKETS,
+        )
+        self.tokens_per_second = Histogram(
+            "vllm_request_tokens_per_second",
+            "Generated tokens per second of a request, after its first token.",
+            THROUGHPUT_BUCKETS,
+        )
+        self.requests = {"completed": 0, "aborted": 0, "rejected": 0}
+        self.generated_tokens = 0
+
+    def render(self, admission: Optional["AdmissionController"] = None) -> str:
+        lines = []
+        for histogram in (self.ttft, self.inter_token_latency, self.queue_wait, self.tokens_per_second):
+            lines += histogram.render()
+
+        lines += ["# HELP vllm_requests_total Requests by outcome.", "# TYPE vllm_requests_total counter"]
+        lines += [f'vllm_requests_total{{outcome="{k}"}} {v}' for k, v in self.requests.items()]
+        lines += [
+            "# HELP vllm_generated_tokens_total Generated tokens.",
+            "# TYPE vllm_generated_tokens_total counter",
+            f"vllm_generated_tokens_total {self.generated_tokens}",
+        ]
+        if admission is not None:
+            lines += [
+                "# HELP vllm_queue_depth Requests waiting in the admission queue.",
+                "# TYPE vllm_queue_depth gauge",
+                f"vllm_queue_depth {admission.queued}",
+                "# HELP vllm_running_requests Requests running in the engine.",
+                "# TYPE vllm_running_requests gauge",
+                f"vllm_running_requests {admission.running}",
+                "# HELP vllm_max_running_requests Maximum number of requests running in the engine.",
+                "# TYPE vllm_max_running_requests gauge",
+                f"vllm_max_running_requests {admission.max_running}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+class RequestTracker:
+    """Measures the token timings of a request, from the outputs of the engine"""
+
+    def __init__(self, metrics: ServerMetrics, arrival_time: float):
+        self.metrics = metrics
+        self.arrival_time = arrival_time
+        self.first_token_time = None
+        self.last_token_time = None
+        self.num_tokens = 0
+
+    def update(self, num_tokens: int):
+        """Called with the number of tokens generated so far"""
+        new_tokens = num_tokens - self.num_tokens
+        if new_tokens <= 0:
+            return
+        now = time.perf_counter()
+        if self.first_token_time is None:
+            self.first_token_time = now
+            self.metrics.ttft.observe(now - self.arrival_time)
+        else:
+            # the engine may return several tokens in a step
+            for _ in range(new_tokens):
+                self.metrics.inter_token_latency.observe((now - self.last_token_time) / new_tokens)
+        self.last_token_time = now
+        self.num_tokens = num_tokens
+        self.metrics.generated_tokens += new_tokens
+
+    def finish(self, aborted: bool = False):
+        self.metrics.requests["aborted" if aborted else "completed"] += 1
+        if self.num_tokens > 1 and self.last_token_time > self.first_token_time:
+            self.metrics.tokens_per_second.observe(
+                (self.num_tokens - 1) / (self.last_token_time - self.first_token_time)
+            )
+
+
+class AdmissionController:
+    """
+    Lets at most max_running requests in the engine, the vLLM scheduler batches
+    them together. Up to max_queue requests wait for a slot, at most
+    max_queue_per_client from the same client; the clients are served in round robin.
+
+    Usage:
+        ticket = await admission.acquire(client_id)
+        try:
+            ...
+        finally:
+            admission.release(ticket)
+    """
+
+    def __init__(self, metrics: ServerMetrics, max_running: int, max_queue: int = 64, max_queue_per_client: int = 8):
+        self.metrics = metrics
+        self.max_running = max_running
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client
+        self.running = 0
+        self.queued = 0
+        # client id -> waiting futures, in the round robin order
+        self.queues: "OrderedDict[str, deque]" = OrderedDict()
+        # moving average of the duration of the requests, for Retry-After
+        self.mean_duration = 1.0
+
+    def retry_after(self) -> int:
+        """Estimated seconds before a slot is available for a new request"""
+        return max(1, math.ceil((self.queued + 1) * self.mean_duration / self.max_running))
+
+    async def acquire(self, client_id: str) -> float:
+        """Waits for a slot, returns a ticket to release or raises Overloaded"""
+        arrival_time = time.perf_counter()
+        if self.running < self.max_running and not self.queued:
+            self.running += 1
+            self.metrics.queue_wait.observe(0.0)
+            return arrival_time
+
+        if self.queued >= self.max_queue:
+            self._reject("queue full")
+        client_queue = self.queues.setdefault(client_id, deque())
+        if len(client_queue) >= self.max_queue_per_client:
+            self._reject("too many requests from the client")
+
+        waiter = asyncio.get_running_loop().create_future()
+        client_queue.append(waiter)
+        self.queued += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was given to this request, pass it to the next one
+                self._release_slot()
+            elif waiter in client_queue:
+                # otherwise _release_slot already dequeued the cancelled waiter
+                client_queue.remove(waiter)
+                self.queued -= 1
+                if not client_queue and self.queues.get(client_id) is client_queue:
+                    del self.queues[client_id]
+            raise
+
+        self.metrics.queue_wait.observe(time.perf_counter() - arrival_time)
+        return time.perf_counter()
+
+    def release(self, ticket: float):
+        duration = time.perf_counter() - ticket
+        self.mean_duration = 0.9 * self.mean_duration + 0.1 * duration
+        self._release_slot()
+
+    def _release_slot(self):
+        self.running -= 1
+        while self.queues and self.running < self.max_running:
+            # next client in round robin
+            client_id, client_queue = next(iter(self.queues.items()))
+            waiter = client_queue.popleft()
+            self.queued -= 1
+            if client_queue:
+                self.queues.move_to_end(client_id)
+            else:
+                del self.queues[client_id]
+            if not waiter.done():
+                self.running += 1
+                waiter.set_result(None)
+
+    def _reject(self, reason: str):
+        self.metrics.requests["rejected"] += 1
+        raise Overloaded(self.retry_after(), reason)
+
+
+def get_client_id(headers: Dict[str, str], host: Optional[str]) -> str:
+    """Requests are grouped by the X-Client-Id header, or by the address of the client"""
+    return headers.get("x-client-id") or host or "unknown"
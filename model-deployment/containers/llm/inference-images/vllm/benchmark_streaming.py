@@ -0,0 +1,76 @@
+"""Bytes sent and client CPU time of the stream formats of vllm-api-server.py
+
+The chunks of each response are recorded as received, then parsed with
+iter_stream_text to measure the CPU time of the client without the network.
+
+Usage:
+    python vllm-api-server.py --stub-engine --stub-token-interval 0 --port 8080
+    python benchmark_streaming.py --url http://localhost:8080/predict --max-new-tokens 2000
+"""
+import argparse
+import time
+
+import requests
+
+from streaming import STREAM_FORMATS, iter_stream_text
+
+
+def receive(session, url, prompt, max_new_tokens, stream_format):
+    """Returns the chunks of bytes of a streamed response"""
+    payload = {
+        "inputs": prompt,
+        "stream": True,
+        "stream_format": stream_format,
+        "parameters": {"max_new_tokens": max_new_tokens},
+    }
+    with session.post(url, json=payload, stream=True) as response:
+        response.raise_for_status()
+        return list(response.iter_content(chunk_size=None))
+
+
+def parse(chunks, stream_format):
+    """Returns the generated text and the usage of the response"""
+    usage = {}
+    text = "".join(iter_stream_text(chunks, stream_format, usage))
+    return text, usage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the stream formats")
+    parser.add_argument("--url", default="http://localhost:8080/predict")
+    parser.add_argument("--prompt", default="Tell me a long story")
+    parser.add_argument("--max-new-tokens", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--formats", nargs="+", choices=STREAM_FORMATS, default=list(STREAM_FORMATS))
+    args = parser.parse_args()
+
+    session = requests.Session()
+    texts = {}
+    print(f"{'format':<10}{'KB/response':>14}{'parse ms':>12}{'wall s':>10}")
+    for stream_format in args.formats:
+        received, cpu_time, wall_time = 0, 0.0, 0.0
+        for _ in range(args.requests):
+            start_time = time.perf_counter()
+            chunks = receive(session, args.url, args.prompt, args.max_new_tokens, stream_format)
+            wall_time += time.perf_counter() - start_time
+            received += sum(len(chunk) for chunk in chunks)
+
+            start_time = time.process_time()
+            text, usage = parse(chunks, stream_format)
+            cpu_time += time.process_time() - start_time
+        # the legacy format includes the prompt
+        texts[stream_format] = text[len(args.prompt):] if stream_format == "legacy" else text
+
+        print(
+            f"{stream_format:<10}{received / args.requests / 1024:>14.1f}"
+            f"{cpu_time / args.requests * 1000:>12.2f}{wall_time / args.requests:>10.2f}"
+        )
+        if usage:
+            print(f"{'':<10}usage: {usage}")
+
+    if len(set(texts.values())) > 1:
+        print("The formats returned different texts")
+
+
+if __name__ == "__main__":
+    main()
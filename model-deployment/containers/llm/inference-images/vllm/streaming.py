@@ -0,0 +1,125 @@
+"""Stream formats of vllm-api-server.py
+
+legacy: after each step, the full text so far (prompt included) as JSON, separated by "\\0".
+    A response of n tokens sends O(n^2) bytes.
+ndjson: one JSON frame per line, with only the new text of each step:
+    {"index": 0, "text": " world"}
+    and a final frame with the finish reasons and the usage:
+    {"finish_reason": ["length"], "usage": {"prompt_tokens": 5, "completion_tokens": 20, "total_tokens": 25}}
+sse: the same frames as Server-Sent Events, "data: {...}\\n\\n".
+
+iter_stream_text reads any of these formats, and the SSE stream of the
+/generate_stream route of TGI, on the client side.
+"""
+import json
+from typing import Dict, Iterable, Iterator, Optional
+
+STREAM_FORMATS = ("legacy", "ndjson", "sse")
+
+MEDIA_TYPES = {
+    "legacy": "text/plain",
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def get_stream_format(request_dict: Dict, accept: Optional[str]) -> str:
+    """The format is given by the stream_format field, or by the Accept header"""
+    stream_format = request_dict.pop("stream_format", None)
+    if stream_format is None and accept:
+        for name, media_type in MEDIA_TYPES.items():
+            if name != "legacy" and media_type in accept:
+                return name
+    if stream_format is None:
+        return "legacy"
+    if stream_format not in STREAM_FORMATS:
+        raise ValueError(f"stream_format must be one of {', '.join(STREAM_FORMATS)}")
+    return stream_format
+
+
+class DeltaEncoder:
+    """Encodes the outputs of the engine, keeping what was already sent of each output"""
+
+    def __init__(self, stream_format: str):
+        self.stream_format = stream_format
+        # output index -> length of the text sent
+        self.sent = {}
+
+    def frame(self, data: Dict) -> bytes:
+        if self.stream_format == "sse":
+            return f"data: {json.dumps(data)}\n\n".encode("utf-8")
+        return (json.dumps(data) + "\n").encode("utf-8")
+
+    def encode(self, request_output) -> bytes:
+        if self.stream_format == "legacy":
+            text_outputs = [request_output.prompt + output.text for output in request_output.outputs]
+            return (json.dumps({"text": text_outputs}) + "\0").encode("utf-8")
+
+        chunks = []
+        for output in request_output.outputs:
+            sent = self.sent.get(output.index, 0)
+            if len(output.text) > sent:
+                chunks.append(self.frame({"index": output.index, "text": output.text[sent:]}))
+                self.sent[output.index] = len(output.text)
+        return b"".join(chunks)
+
+    def finish(self, request_output) -> bytes:
+        """The final usage frame, nothing in the legacy format"""
+        if self.stream_format == "legacy" or request_output is None:
+            return b""
+        prompt_tokens = len(getattr(request_output, "prompt_token_ids", None) or [])
+        completion_tokens = sum(len(output.token_ids) for output in request_output.outputs)
+        return self.frame(
+            {
+                "finish_reason": [output.finish_reason for output in request_output.outputs],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            }
+        )
+
+
+def iter_stream_text(chunks: Iterable[bytes], stream_format: str, usage: Optional[Dict] = None) -> Iterator[str]:
+    """
+    Yields the new text of a streamed response, from its chunks of bytes
+    (e.g. requests' response.iter_content(chunk_size=None)).
+    The usage of the final frame, if any, is stored in the dict usage.
+    """
+    if stream_format == "legacy":
+        sent = 0
+        buffer = b""
+        for chunk in chunks:
+            buffer += chunk
+            *frames, buffer = buffer.split(b"\0")
+            if not frames:
+                continue
+            # only the last complete frame is needed, it has the full text
+            text = json.loads(frames[-1])["text"][0]
+            yield text[sent:]
+            sent = len(text)
+        return
+
+    buffer = b""
+    for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if stream_format == "sse":
+                if not line.startswith(b"data:"):
+                    continue
+                line = line[len(b"data:"):]
+            if not line.strip():
+                continue
+            frame = json.loads(line)
+            if "text" in frame:
+                yield frame["text"]
+            elif "token" in frame:
+                # TGI /generate_stream
+                if not frame["token"].get("special"):
+                    yield frame["token"]["text"]
+                if frame.get("details") and usage is not None:
+                    usage["completion_tokens"] = frame["details"].get("generated_tokens")
+            elif "usage" in frame and usage is not None:
+                usage.update(frame["usage"])
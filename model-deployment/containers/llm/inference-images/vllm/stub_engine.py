@@ -0,0 +1,82 @@
+"""Stub of AsyncLLMEngine, to run vllm-api-server.py on CPU without a model
+
+The engine generates fake tokens on a timer, with the same output objects as
+vLLM (prompt, outputs[i].text and outputs[i].token_ids, cumulated at each step).
+At most max_num_seqs requests are generated at the same time, as in vLLM.
+
+Usage:
+    python vllm-api-server.py --stub-engine --port 8080
+"""
+import asyncio
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, List, Optional
+
+
+@dataclass
+class SamplingParams:
+    max_tokens: int = 16
+    temperature: float = 1.0
+    top_p: float = 1.0
+    use_beam_search: bool = False
+    n: int = 1
+
+
+@dataclass
+class CompletionOutput:
+    index: int
+    text: str = ""
+    token_ids: List[int] = field(default_factory=list)
+    finish_reason: Optional[str] = None
+
+
+@dataclass
+class RequestOutput:
+    request_id: str
+    prompt: str
+    outputs: List[CompletionOutput]
+    finished: bool = False
+    prompt_token_ids: List[int] = field(default_factory=list)
+
+
+class StubEngine:
+    """
+    Args:
+        token_interval: seconds between two tokens of a request
+        max_num_seqs: requests generated at the same time, the others wait
+    """
+
+    def __init__(self, token_interval: float = 0.02, max_num_seqs: int = 256):
+        self.token_interval = token_interval
+        self.max_num_seqs = max_num_seqs
+        self._slots = None
+        self._running = set()
+        self._aborted = set()
+
+    async def generate(
+        self, prompt: str, sampling_params: SamplingParams, request_id: str
+    ) -> AsyncGenerator[RequestOutput, None]:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_num_seqs)
+
+        output = CompletionOutput(index=0)
+        prompt_token_ids = list(range(len(prompt.split())))
+        self._running.add(request_id)
+        try:
+            async with self._slots:
+                for i in range(sampling_params.max_tokens):
+                    await asyncio.sleep(self.token_interval)
+                    if request_id in self._aborted:
+                        return
+                    output.token_ids.append(i)
+                    output.text += f" token{i}"
+                    finished = i == sampling_params.max_tokens - 1
+                    if finished:
+                        output.finish_reason = "length"
+                    yield RequestOutput(request_id, prompt, [output], finished, prompt_token_ids)
+        finally:
+            self._running.discard(request_id)
+            self._aborted.discard(request_id)
+
+    async def abort(self, request_id: str) -> None:
+        if request_id in self._running:
+            self._aborted.add(request_id)
@@ -1,29 +1,50 @@
 import argparse
-import json
+import time
+import uuid
 from typing import AsyncGenerator
 
 from fastapi import BackgroundTasks, FastAPI, Request
-from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 import uvicorn
 from uvicorn.config import LOGGING_CONFIG
 
-from vllm.engine.arg_utils import AsyncEngineArgs
-from vllm.engine.async_llm_engine import AsyncLLMEngine
-from vllm.sampling_params import SamplingParams
-from vllm.utils import random_uuid
+try:
+    from vllm.engine.arg_utils import AsyncEngineArgs
+    from vllm.engine.async_llm_engine import AsyncLLMEngine
+    from vllm.sampling_params import SamplingParams
+    from vllm.utils import random_uuid
+
+    import torch
+except ImportError:
+    # without vLLM, the server can only run with --stub-engine
+    AsyncEngineArgs = None
+    from stub_engine import SamplingParams
+
+    def random_uuid() -> str:
+        return str(uuid.uuid4().hex)
 
-import torch
 import yaml
 
+from admission import AdmissionController, Overloaded, RequestTracker, ServerMetrics, get_client_id
+from streaming import MEDIA_TYPES, DeltaEncoder, get_stream_format
+from stub_engine import StubEngine
+
 TIMEOUT_KEEP_ALIVE = 5  # seconds.
 TIMEOUT_TO_PREVENT_DEADLOCK = 1  # seconds.
 app = FastAPI()
+metrics = ServerMetrics()
+admission = None
 
 
 @app.get("/health")
 async def health():
     return {"status":"success"}
 
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(admission))
+
 @app.post("/predict")
 async def generate(request: Request) -> Response:
     """Generate completion for the request. The specification is same as Text Generation Inference
@@ -31,6 +52,9 @@ async def generate(request: Request) -> Response:
     The request should be a JSON object with the following fields:
     - inputs: the prompt to use for the generation.
     - stream: whether to stream the results or not.
+    - stream_format: legacy (default, the full text at each step separated by "\\0"),
+      ndjson or sse (only the new text at each step, and a final usage frame), see streaming.py.
+      Without it, ndjson or sse are chosen with the Accept header.
     - parameters: the sampling parameters (See `SamplingParams` for details).
     """
     request_dict = await request.json()
@@ -52,35 +76,84 @@ async def generate(request: Request) -> Response:
         params["n"] = 1
 
     stream = request_dict.pop("stream", False)
+    try:
+        stream_format = get_stream_format(request_dict, request.headers.get("accept"))
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
     sampling_params = SamplingParams(**params)
+
+    # Wait for a slot in the engine, or reject the request when overloaded
+    arrival_time = time.perf_counter()
+    client_id = get_client_id(request.headers, request.client.host if request.client else None)
+    try:
+        ticket = await admission.acquire(client_id)
+    except Overloaded as e:
+        return JSONResponse(
+            {"error": f"Server overloaded: {e.reason}"},
+            status_code=429,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    tracker = RequestTracker(metrics, arrival_time)
+
     request_id = random_uuid()
     results_generator = engine.generate(prompt, sampling_params, request_id)
 
+    released = False
+
+    def release(aborted: bool) -> None:
+        nonlocal released
+        if not released:
+            released = True
+            tracker.finish(aborted=aborted)
+            admission.release(ticket)
+
     # Streaming case
     async def stream_results() -> AsyncGenerator[bytes, None]:
-        async for request_output in results_generator:
-            prompt = request_output.prompt
-            text_outputs = [prompt + output.text for output in request_output.outputs]
-            ret = {"text": text_outputs}
-            yield (json.dumps(ret) + "\0").encode("utf-8")
+        encoder = DeltaEncoder(stream_format)
+        request_output = None
+        finished = False
+        try:
+            # the next output is read once the chunk is sent to the client
+            async for request_output in results_generator:
+                tracker.update(sum(len(output.token_ids) for output in request_output.outputs))
+                chunk = encoder.encode(request_output)
+                if chunk:
+                    yield chunk
+            finished = True
+            chunk = encoder.finish(request_output)
+            if chunk:
+                yield chunk
+        finally:
+            release(aborted=not finished)
+            if not finished:
+                # the client disconnected, stop the generation now
+                await engine.abort(request_id)
 
     async def abort_request() -> None:
+        # the stream may not have started if the client disconnected
+        release(aborted=True)
         await engine.abort(request_id)
 
     if stream:
         background_tasks = BackgroundTasks()
         # Abort the request if the client disconnects.
         background_tasks.add_task(abort_request)
-        return StreamingResponse(stream_results(), background=background_tasks)
+        return StreamingResponse(
+            stream_results(), media_type=MEDIA_TYPES[stream_format], background=background_tasks
+        )
 
     # Non-streaming case
     final_output = None
-    async for request_output in results_generator:
-        if await request.is_disconnected():
-            # Abort the request if the client disconnects.
-            await engine.abort(request_id)
-            return Response(status_code=499)
-        final_output = request_output
+    try:
+        async for request_output in results_generator:
+            if await request.is_disconnected():
+                # Abort the request if the client disconnects.
+                await engine.abort(request_id)
+                return Response(status_code=499)
+            tracker.update(sum(len(output.token_ids) for output in request_output.outputs))
+            final_output = request_output
+    finally:
+        release(aborted=final_output is None or not final_output.finished)
 
     assert final_output is not None
     prompt = final_output.prompt
@@ -96,11 +169,34 @@ if __name__ == "__main__":
     parser.add_argument("--host", type=str, default="localhost")
     parser.add_argument("--port", type=int, default=80)
     parser.add_argument("--log-config", default=None)
-    parser = AsyncEngineArgs.add_cli_args(parser)
+    parser.add_argument(
+        "--max-running",
+        type=int,
+        default=None,
+        help="requests running in the engine at the same time, by default --max-num-seqs",
+    )
+    parser.add_argument("--max-queue", type=int, default=64, help="requests waiting for the engine")
+    parser.add_argument("--max-queue-per-client", type=int, default=8, help="waiting requests of a client")
+    parser.add_argument("--stub-engine", action="store_true", help="generate fake tokens, without a model")
+    parser.add_argument("--stub-token-interval", type=float, default=0.02, help="seconds between fake tokens")
+    if AsyncEngineArgs is not None:
+        parser = AsyncEngineArgs.add_cli_args(parser)
     args = parser.parse_args()
 
-    engine_args = AsyncEngineArgs.from_cli_args(args)
-    engine = AsyncLLMEngine.from_engine_args(engine_args)
+    if args.stub_engine:
+        max_num_seqs = getattr(args, "max_num_seqs", None) or 256
+        engine = StubEngine(token_interval=args.stub_token_interval, max_num_seqs=max_num_seqs)
+    else:
+        engine_args = AsyncEngineArgs.from_cli_args(args)
+        engine = AsyncLLMEngine.from_engine_args(engine_args)
+        max_num_seqs = engine_args.max_num_seqs
+
+    admission = AdmissionController(
+        metrics,
+        max_running=args.max_running or max_num_seqs,
+        max_queue=args.max_queue,
+        max_queue_per_client=args.max_queue_per_client,
+    )
 
     LOGGING_CONFIG["formatters"]["default"][
         "fmt"
@@ -8,6 +8,8 @@ import yaml
 import string
 from loguru import logger
 
+from deployment_client import CachedSigner, DeploymentClient
+
 
 app_config = yaml.load(open("config.yaml"), Loader=yaml.SafeLoader)
 
@@ -25,7 +27,9 @@ prompt_template = string.Template(
 
 logger.info(f"Setting prompt template to: {prompt_template}")
 
+# the first endpoint is used, the others (endpoints) when it fails
 endpoint = app_config["models"][model]["endpoint"]
+endpoints = [endpoint] + app_config["models"][model].get("endpoints", [])
 
 SECURITY_TOKEN_GENERIC_HEADERS = ["date", "(request-target)", "host"]
 SECURITY_TOKEN_BODY_HEADERS = ["content-length", "content-type", "x-content-sha256"]
@@ -82,6 +86,15 @@ def create_default_signer():
     return auth
 
 
+# create auth using one of the oci signers, AUTH=security_token for a session token
+signer = CachedSigner(
+    create_security_token_signer
+    if os.environ.get("AUTH") == "security_token"
+    else create_default_signer
+)
+client = DeploymentClient(endpoints, signer)
+
+
 def query(prompt, max_tokens=200, **kwargs):
     body = {
         "inputs": prompt_template.substitute({"prompt": prompt}),
@@ -94,9 +107,11 @@ def query(prompt, max_tokens=200, **kwargs):
         },
     }
 
-    # create auth using one of the oci signers
-    auth = create_default_signer()
-    data = requests.post(endpoint, json=body, auth=auth, headers=headers).json()
+    # the signer and the connections are reused across the queries
+    try:
+        data = client.predict(body, headers=headers)
+    except requests.RequestException as e:
+        data = {"error": str(e)}
     # return model generated response, or any error as a string
     return str(data.get("generated_text", data))
 
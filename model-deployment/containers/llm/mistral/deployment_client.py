@@ -0,0 +1,175 @@
+"""Client for the predict endpoints of LLM model deployments, used by inference.py
+
+Usage:
+    signer = CachedSigner(create_security_token_signer)
+    client = DeploymentClient([endpoint, failover_endpoint], signer)
+    data = client.predict({"inputs": prompt, "parameters": {"max_new_tokens": 200}})
+"""
+import base64
+import json
+import random
+import threading
+import time
+
+import requests
+from loguru import logger
+from requests.adapters import HTTPAdapter
+
+# HTTP status codes retried, on the same or on the next endpoint
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def token_expiry(token):
+    """
+    Return the expiry time (epoch seconds) of a JWT security token, or None if it can't be read
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (IndexError, KeyError, ValueError):
+        return None
+
+
+class CachedSigner:
+    """
+    Create the signer once, and again before the security token it uses expires
+
+    Args:
+        signer_factory: function returning a new signer, e.g. create_security_token_signer
+        refresh_margin: seconds before the expiry of the token when the signer is created again
+        max_age: seconds before the signer is created again, for signers without a security token (None: never)
+    """
+
+    def __init__(self, signer_factory, refresh_margin=300, max_age=None):
+        self.signer_factory = signer_factory
+        self.refresh_margin = refresh_margin
+        self.max_age = max_age
+        self._signer = None
+        self._expires_at = None
+        self._lock = threading.Lock()
+
+    def get(self, renew=False):
+        with self._lock:
+            if (
+                self._signer is None
+                or renew
+                or (self._expires_at is not None and time.time() >= self._expires_at - self.refresh_margin)
+            ):
+                self._signer = self.signer_factory()
+                self._expires_at = self._get_expiry(self._signer)
+                logger.debug(f"Created a new signer, expiring at {self._expires_at}")
+            return self._signer
+
+    def _get_expiry(self, signer):
+        api_key = getattr(signer, "api_key", "") or ""
+        if api_key.startswith("ST$"):
+            expiry = token_expiry(api_key[len("ST$"):])
+            if expiry is not None:
+                return expiry
+        if self.max_age is not None:
+            # refresh_margin is subtracted by get
+            return time.time() + self.max_age + self.refresh_margin
+        return None
+
+
+class DeploymentClient:
+    """
+    Thread safe client for the predict endpoints of a model, deployed once or more
+
+    The HTTP session keeps the connections alive, and the signer is cached. A request
+    failing with 429, 5xx or a connection error is retried with an exponential backoff
+    with jitter, on the next endpoint: the client fails over to the other deployments
+    and keeps using the endpoint that answered last.
+
+    Args:
+        endpoints: list of the predict endpoints of the model
+        signer: CachedSigner, or None for endpoints without authentication
+        pool_size: connections kept alive for each host
+        timeout: timeout of a request, in seconds
+        max_retries: retries of a failed request, on all the endpoints
+        backoff: base of the exponential backoff, in seconds
+        max_backoff: maximum wait between two attempts, in seconds
+    """
+
+    def __init__(
+        self,
+        endpoints,
+        signer=None,
+        pool_size=10,
+        timeout=120,
+        max_retries=4,
+        backoff=0.5,
+        max_backoff=10,
+    ):
+        if not endpoints:
+            raise ValueError("At least one endpoint is required")
+        self.endpoints = list(endpoints)
+        self.signer = signer
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._current = 0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _wait(self, attempt, retry_after=None):
+        # full jitter, or the Retry-After of the server if it's longer
+        wait = random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+        if retry_after:
+            try:
+                wait = max(wait, min(float(retry_after), self.max_backoff))
+            except ValueError:
+                pass
+        time.sleep(wait)
+
+    def predict(self, body, headers=None):
+        """
+        Send body as JSON and return the JSON response, raise the last error
+        if all the attempts failed
+        """
+        data = json.dumps(body)
+        headers = {"Content-Type": "application/json", **(headers or {})}
+        start = self._current
+        renewed = False
+        error = None
+
+        for attempt in range(self.max_retries + 1):
+            index = (start + attempt) % len(self.endpoints)
+            endpoint = self.endpoints[index]
+            auth = self.signer.get() if self.signer else None
+            retry_after = None
+            try:
+                response = self.session.post(
+                    endpoint, data=data, auth=auth, headers=headers, timeout=self.timeout
+                )
+                if response.status_code == 401 and self.signer and not renewed:
+                    # the token may have been revoked or expired early
+                    logger.info("Request not authorized, creating a new signer...")
+                    self.signer.get(renew=True)
+                    renewed = True
+                    response = self.session.post(
+                        endpoint, data=data, auth=self.signer.get(), headers=headers, timeout=self.timeout
+                    )
+                if response.status_code not in RETRY_STATUS_CODES:
+                    if response.ok:
+                        self._current = index
+                    # errors of the request itself are returned, as the body of the error
+                    return response.json()
+                retry_after = response.headers.get("Retry-After")
+                error = requests.HTTPError(f"{response.status_code} from {endpoint}", response=response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+
+            logger.warning(f"Request to {endpoint} failed ({error}), attempt {attempt + 1}")
+            if attempt < self.max_retries:
+                self._wait(attempt, retry_after)
+
+        raise error
+
+    def close(self):
+        self.session.close()
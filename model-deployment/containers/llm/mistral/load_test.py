@@ -0,0 +1,113 @@
+"""Concurrent load test of DeploymentClient against local mock endpoints
+
+Starts mock predict endpoints answering after --latency seconds, the first one
+failing with 503 for a fraction --failure-rate of the requests, and sends
+--requests queries from --concurrency threads:
+- with a new connection for each query (requests.post, as before)
+- with DeploymentClient, failing over to the second endpoint
+
+Usage:
+    python load_test.py --requests 500 --concurrency 16 --failure-rate 0.1
+"""
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+
+from deployment_client import DeploymentClient
+
+
+def start_mock_endpoint(latency, failure_rate):
+    """Start a mock predict endpoint in a thread, return its URL"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # the headers and the body are written separately, don't wait for the ACK of the headers
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(latency)
+            if random.random() < failure_rate:
+                status, data = 503, {"error": "Service unavailable"}
+            else:
+                status, data = 200, {"generated_text": body["inputs"][::-1]}
+            payload = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        request_queue_size = 128
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/predict"
+
+
+def run(send, n_requests, concurrency):
+    """Return the latencies (seconds) of the successful queries, the errors and the wall time"""
+
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            ok = "generated_text" in send({"inputs": f"prompt {i}", "parameters": {"max_new_tokens": 200}})
+        except requests.RequestException:
+            ok = False
+        return ok, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, range(n_requests)))
+    wall_time = time.perf_counter() - start
+
+    latencies = np.array([latency for ok, latency in results if ok])
+    return latencies, sum(not ok for ok, _ in results), wall_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the deployment client")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.02, help="latency of the mock endpoints")
+    parser.add_argument("--failure-rate", type=float, default=0.1, help="503 rate of the first endpoint")
+    args = parser.parse_args()
+
+    endpoints = [
+        start_mock_endpoint(args.latency, args.failure_rate),
+        start_mock_endpoint(args.latency, 0.0),
+    ]
+
+    def send_new_connection(body):
+        return requests.post(endpoints[0], json=body).json()
+
+    client = DeploymentClient(endpoints, pool_size=args.concurrency, backoff=0.05)
+
+    print(f"{'client':<20}{'ok':>6}{'errors':>8}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, send in [("new connection", send_new_connection), ("DeploymentClient", client.predict)]:
+        latencies, errors, wall_time = run(send, args.requests, args.concurrency)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000 if len(latencies) else (0, 0, 0)
+        print(
+            f"{name:<20}{len(latencies):>6}{errors:>8}{args.requests / wall_time:>8.0f}"
+            f"{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}"
+        )
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Requests/sec of the /predict API of model_artifact/api.py, before and after loading the model once
+
+Serves on localhost, with the threaded Werkzeug server:
+- before: the former /predict, reading test.json and loading the model at each request
+- after: /predict and /predict_batch of api.py
+and sends --requests requests from --concurrency threads.
+
+Usage:
+    python benchmark_api.py --generate 2000
+    python benchmark_api.py --work-directory <directory with test.json and models/>
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import requests
+from werkzeug.serving import make_server
+
+ARTIFACT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_artifact")
+
+
+def generate_test_data(path, n_rows, n_features):
+    """Write a test.json of random rows, in the format read by api.py"""
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(rng.normal(size=(n_rows, n_features)), columns=[f"x{i}" for i in range(n_features)])
+    data.insert(0, "Line", np.arange(n_rows))
+    data.insert(1, "Letter", "a")
+    data.insert(2, "# Letter", 0)
+    # api.py transposes the data read
+    data.transpose().to_json(path)
+
+
+def serve(app):
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def load_test(url, payloads, concurrency):
+    """Return the requests/sec, and the response of the first request"""
+    session = requests.Session()
+
+    def send(payload):
+        response = session.post(url, json=payload)
+        response.raise_for_status()
+        return response.json()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, payloads))
+    return len(payloads) / (time.perf_counter() - start), results[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the NLP model API")
+    parser.add_argument("--work-directory", default=ARTIFACT_DIR)
+    parser.add_argument("--generate", type=int, default=0, help="write a test.json of this number of rows")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    os.environ["WORK_DIRECTORY"] = args.work_directory
+    os.environ.setdefault("MODEL_DIR", os.path.join(args.work_directory, "models"))
+    os.environ.setdefault("MODEL_FILE_LDA", "clf_lda.joblib")
+    test_data = os.path.join(args.work_directory, "test.json")
+
+    if args.generate:
+        from joblib import load
+
+        model = load(os.path.join(os.environ["MODEL_DIR"], os.environ["MODEL_FILE_LDA"]))
+        generate_test_data(test_data, args.generate, model.n_features_in_)
+
+    sys.path.insert(0, ARTIFACT_DIR)
+    import api
+    from flask import request
+    from joblib import load
+
+    # the former /predict
+    @api.app.route("/predict_before", methods=["POST"])
+    def prediction_before():
+        data = pd.read_json(api.TEST_DATA)
+        line = json.loads(request.get_data().decode("utf-8"))["line"]
+        data_test = data.transpose()
+        X = data_test.drop(data_test.loc[:, "Line":"# Letter"].columns, axis=1)
+        X_test = X.iloc[int(line), :].values.reshape(1, -1)
+        clf_lda = load(api.MODEL_PATH_LDA)
+        return {"prediction LDA": int(clf_lda.predict(X_test)[0])}
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    n_rows = len(api.store.snapshot.features)
+    lines = [str(i % n_rows) for i in range(args.requests)]
+    server, base_url = serve(api.app)
+
+    before, before_result = load_test(base_url + "/predict_before", [{"line": line} for line in lines], args.concurrency)
+    after, after_result = load_test(base_url + "/predict", [{"line": line} for line in lines], args.concurrency)
+    batches = [{"lines": lines[i:i + args.batch_size]} for i in range(0, len(lines), args.batch_size)]
+    batch, _ = load_test(base_url + "/predict_batch", batches * 10, args.concurrency)
+    server.shutdown()
+
+    print(f"Rows in test.json: {n_rows}, requests: {args.requests}, concurrency: {args.concurrency}")
+    print(f"{'/predict before':<28}{before:>10.1f} req/s")
+    print(f"{'/predict after':<28}{after:>10.1f} req/s")
+    print(f"{'/predict_batch of ' + str(args.batch_size):<28}{batch * args.batch_size:>10.1f} rows/s")
+    if before_result != after_result:
+        print(f"Different predictions: {before_result} {after_result}")
+
+
+if __name__ == "__main__":
+    main()
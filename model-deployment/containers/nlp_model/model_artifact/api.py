@@ -1,12 +1,12 @@
 # We now need the json library so we can load and export json data
 import json
 import os
+import threading
+import time
+from collections import namedtuple
 import numpy as np
-from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
-from sklearn.neural_network import MLPClassifier
 import pandas as pd
 from joblib import load
-from sklearn import preprocessing
 import logging
 
 from flask import Flask, request
@@ -17,15 +17,71 @@ TEST_DATA = os.path.join(WORK_DIRECTORY, "test.json")
 MODEL_DIR = os.environ["MODEL_DIR"]
 MODEL_FILE_LDA = os.environ["MODEL_FILE_LDA"]
 MODEL_PATH_LDA = os.path.join(MODEL_DIR, MODEL_FILE_LDA)
+# Seconds between two checks of the model and test data files for changes
+RELOAD_CHECK_INTERVAL = float(os.environ.get("RELOAD_CHECK_INTERVAL", 5))
 
-# Loading LDA model
-print("Loading model from: {}".format(MODEL_PATH_LDA))
-inference_lda = load(MODEL_PATH_LDA)
+# The model and the features of the test data, loaded together
+Snapshot = namedtuple("Snapshot", ["model", "features", "version"])
+
+
+def file_version(*paths):
+    # Modification time and size of the files, a change means the files were replaced
+    return tuple((os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in paths)
+
+
+def load_features(path):
+    # Rows of the test data, without the columns from Line to # Letter
+    data_test = pd.read_json(path).transpose()
+    X = data_test.drop(data_test.loc[:, 'Line':'# Letter'].columns, axis = 1)
+    return X.to_numpy(dtype=float)
+
+
+class ModelStore:
+    # Loads the model and the test data once per worker, and again when the files change.
+    # The new snapshot replaces the previous one at once, a request uses the snapshot it got.
+
+    def __init__(self, model_path, data_path, check_interval=RELOAD_CHECK_INTERVAL):
+        self.model_path = model_path
+        self.data_path = data_path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._next_check = time.monotonic() + check_interval
+        self.snapshot = self._load()
+
+    def _load(self):
+        version = file_version(self.model_path, self.data_path)
+        print("Loading model from: {}".format(self.model_path))
+        model = load(self.model_path)
+        features = load_features(self.data_path)
+        return Snapshot(model, features, version)
+
+    def get(self):
+        if time.monotonic() >= self._next_check and self._lock.acquire(blocking=False):
+            # Only one request checks the files, the others use the current snapshot
+            try:
+                self._next_check = time.monotonic() + self.check_interval
+                if file_version(self.model_path, self.data_path) != self.snapshot.version:
+                    self.snapshot = self._load()
+            except Exception:
+                logging.exception("Reload failed, keeping the current model")
+            finally:
+                self._lock.release()
+        return self.snapshot
+
+
+# Loading LDA model and test data
+store = ModelStore(MODEL_PATH_LDA, TEST_DATA)
 
 # Creation of the Flask app
 app = Flask(__name__)
 
 
+def parse_request(request_data):
+    if isinstance(request_data, bytes):
+        request_data = request_data.decode("utf-8")
+    return json.loads(request_data)
+
+
 # API 1
 # Flask route so that we can serve HTTP traffic on that route
 @app.route('/health')
@@ -39,23 +95,24 @@ def health():
 @app.route('/predict',methods=['POST'])
 # Return prediction for both Neural Network and LDA inference model with the requested row as input
 def prediction():
-    data = pd.read_json(TEST_DATA)
-    request_data = request.get_data()
-    print(request_data)
-    print(type(request_data))
-    if isinstance(request_data, bytes):
-        print("Data is of type bytes")
-        request_data = request_data.decode("utf-8")
-    print(request_data)
-    line = json.loads(request_data)['line']
-    data_test = data.transpose()
-    X = data_test.drop(data_test.loc[:, 'Line':'# Letter'].columns, axis = 1)
-    X_test = X.iloc[int(line),:].values.reshape(1, -1)
+    line = parse_request(request.get_data())['line']
+    snapshot = store.get()
+    X_test = snapshot.features[int(line)].reshape(1, -1)
+    prediction_lda = snapshot.model.predict(X_test)
 
-    clf_lda = load(MODEL_PATH_LDA)
-    prediction_lda = clf_lda.predict(X_test)
+    return {'prediction LDA': int(prediction_lda[0])}
+
+# API 3
+# Flask route so that we can serve HTTP traffic on that route
+@app.route('/predict_batch',methods=['POST'])
+# Return the LDA predictions of the requested rows, scored together: {"lines": ["12", "13"]}
+def prediction_batch():
+    lines = parse_request(request.get_data())['lines']
+    snapshot = store.get()
+    X_test = snapshot.features[[int(line) for line in lines]]
+    prediction_lda = snapshot.model.predict(X_test) if len(X_test) else []
 
-    return {'prediction LDA': int(prediction_lda)}
+    return {'prediction LDA': [int(p) for p in prediction_lda]}
 
 
 if __name__ == "__main__":
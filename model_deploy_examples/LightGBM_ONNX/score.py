@@ -23,6 +23,32 @@ def load_model(model_file_name=model_name):
         return rt.InferenceSession(os.path.join(model_dir, model_file_name))
     else:
         raise Exception('{0} is not found in model directory {1}'.format(model_file_name, model_dir))
+def load_transformer(transformer_file_name=transformer_name):
+    """
+    Loads the ONNXTransformer saved with the model, if any
+
+    Returns
+    -------
+    transformer: an ONNXTransformer instance, or None
+    """
+    model_dir = os.path.dirname(os.path.realpath(__file__))
+    contents = os.listdir(model_dir)
+    if transformer_file_name in contents:
+        return ONNXTransformer.load(os.path.join(model_dir, transformer_file_name))
+    else:
+        return None
+def to_input_array(X):
+    """
+    Returns the rows of X as one array, float32 when all the columns are numeric
+
+    Parameters
+    ----------
+    X: pandas.DataFrame, output of ONNXTransformer.transform
+    """
+    if all(pd.api.types.is_numeric_dtype(dtype) for dtype in X.dtypes):
+        return X.to_numpy(dtype=np.float32)
+    # Columns of strings, a list for each row
+    return X.values.tolist()
 def predict(data, model=load_model()):
     """
     Returns prediction given the model and data to predict
@@ -41,19 +67,12 @@ def predict(data, model=load_model()):
     from pandas import read_json, DataFrame
     from io import StringIO
     X = read_json(StringIO(data)) if isinstance(data, str) else DataFrame.from_dict(data)
-    model_dir = os.path.dirname(os.path.realpath(__file__))
-    contents = os.listdir(model_dir)
     # Note: User may need to edit this
-    if transformer_name in contents:
-        onnx_data_transformer = ONNXTransformer.load(os.path.join(model_dir, transformer_name))
+    if onnx_data_transformer is not None:
         X, _ = onnx_data_transformer.transform(X)
-    else:
-        onnx_data_transformer = None
-    
-    onnx_transformed_rows = []
-    for name, row in X.iterrows():
-        onnx_transformed_rows.append(list(row))
-    input_data = {'input': onnx_transformed_rows}
+
+    # All the rows in one array, instead of a list for each row
+    input_data = {'input': to_input_array(X)}
     
     pred = model.run(None, input_data)[0].tolist()
     return {'prediction':pred}
@@ -99,7 +118,14 @@ class ONNXTransformer(object):
             # Label encode them to identify new categories in test data
             self.cat_unique_values[k] = _X[k].unique()
         return _X
+    def _category_lookups(self):
+        # Lookup table of the categories seen in fit, for each categorical column
+        # Built once, the transformer may have been saved without it
+        if getattr(self, '_lookups', None) is None:
+            self._lookups = {k: pd.Index(v) for k, v in self.cat_unique_values.items()}
+        return self._lookups
     def fit(self, X, y=None):
+        self._lookups = None
         _X = self._handle_dtypes(X)
         self.dtypes = _X.dtypes
         if self.task == 'classification' and y is not None:
@@ -116,12 +142,12 @@ class ONNXTransformer(object):
         # So cast the numerical columns first, without loop
         # Then impute categorical columns
         _X = X.astype(self.dtypes)
-        for k in _X.columns[_X.dtypes != 'float32']:
-            # Replace unseen categories with NaNs and impute them
-            _X.loc[~_X[k].isin(self.cat_unique_values[k]), k] = np.nan
+        for k, categories in self._category_lookups().items():
+            # Index of each value in the categories seen in fit, -1 for unseen categories and NaNs
+            seen = categories.get_indexer(_X[k]) >= 0
             # SimpleImputer is not available for strings in ONNX-ML specifications
-            # Replace NaNs with the most frequent category
-            _X[k] = _X[k].fillna(self.cat_impute_values[k])
+            # Replace unseen categories and NaNs with the most frequent category
+            _X[k] = _X[k].where(seen, self.cat_impute_values[k])
 
         if self.label_encoder is not None and y is not None:
             y = self.label_encoder.transform(y)
@@ -169,4 +195,6 @@ class ONNXTransformer(object):
         le.set_params(**export_dict["label_encoder"]["value"]["params"])
         le.classes_ = np.asarray(export_dict["label_encoder"]["value"]["classes_"])
         onnx_transformer.label_encoder = le
-        return onnx_transformer
\ No newline at end of file
+        return onnx_transformer
+# Loaded once, when the scoring server imports this file
+onnx_data_transformer = load_transformer()
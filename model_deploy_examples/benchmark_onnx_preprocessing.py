@@ -0,0 +1,120 @@
+"""
+Rows/sec of the preprocessing of the ONNX score.py (LightGBM_ONNX, XGBoost_ONNX),
+before and after the column-wise ONNXTransformer, on random data:
+- before: the transformer loaded at each predict, unseen categories replaced with isin,
+  and the input built with a list for each row (iterrows)
+- after: the transformer loaded once, the category lookup tables built once,
+  and the input built in one array
+
+Checks that both give the same input and the same predictions.
+
+Usage:
+    python benchmark_onnx_preprocessing.py --model_dir LightGBM_ONNX --rows 10000
+"""
+import argparse
+import importlib.util
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def load_score(model_dir):
+    spec = importlib.util.spec_from_file_location("score", os.path.join(model_dir, "score.py"))
+    score = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(score)
+    return score
+
+
+def random_data(n_rows, n_features, rng):
+    """Numeric features with missing values, and a categorical column with unseen categories"""
+    X = pd.DataFrame(rng.normal(size=(n_rows, n_features)), columns=[f"f{i}" for i in range(n_features)])
+    X.iloc[rng.integers(n_rows, size=n_rows // 20), 0] = np.nan
+    X["category"] = pd.Series(rng.choice(["a", "b", "c", "d", None], size=n_rows), dtype=object)
+    return X
+
+
+def transform_before(transformer, X):
+    # ONNXTransformer.transform before the lookup tables
+    _X = X.astype(transformer.dtypes)
+    for k in _X.columns[_X.dtypes != 'float32']:
+        _X.loc[~_X[k].isin(transformer.cat_unique_values[k]), k] = np.nan
+        _X[k] = _X[k].fillna(transformer.cat_impute_values[k])
+    return _X
+
+
+def input_before(X):
+    onnx_transformed_rows = []
+    for name, row in X.iterrows():
+        onnx_transformed_rows.append(list(row))
+    return onnx_transformed_rows
+
+
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the ONNX preprocessing")
+    parser.add_argument("--model_dir", default="LightGBM_ONNX")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    score = load_score(args.model_dir)
+    model = score.load_model()
+    n_features = model.get_inputs()[0].shape[1]
+    rng = np.random.default_rng(0)
+
+    # Transformer fit on data with a categorical column, saved and loaded as in score.py
+    train = random_data(args.rows, n_features, rng)
+    train.loc[train["category"] == "d", "category"] = None
+    test = random_data(args.rows, n_features, rng)
+    transformer = score.ONNXTransformer(task="regression").fit(train)
+    # lists, as in a transformer loaded from JSON
+    transformer.cat_unique_values = {k: list(v) for k, v in transformer.cat_unique_values.items()}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, score.transformer_name)
+        transformer.save(path)
+
+        def before():
+            loaded = score.ONNXTransformer.load(path)
+            return input_before(transform_before(loaded, test))
+
+        loaded = score.ONNXTransformer.load(path)
+
+        def after():
+            X, _ = loaded.transform(test)
+            return score.to_input_array(X)
+
+        time_before, rows_before = best_time(before, args.repeat)
+        time_after, rows_after = best_time(after, args.repeat)
+
+    print(f"Rows: {args.rows}, features: {n_features} and a categorical column")
+    print(f"{'preprocessing before':<24}{args.rows / time_before:>14,.0f} rows/s")
+    print(f"{'preprocessing after':<24}{args.rows / time_after:>14,.0f} rows/s")
+    same = pd.DataFrame(rows_before).equals(pd.DataFrame(rows_after))
+    print(f"Same input: {same}")
+
+    # Numeric columns only, as the model input
+    X = test.drop(columns="category")
+    time_before, input_rows = best_time(lambda: input_before(X), args.repeat)
+    time_after, input_array = best_time(lambda: score.to_input_array(X), args.repeat)
+    time_model, pred = best_time(lambda: model.run(None, {"input": input_array})[0], args.repeat)
+    pred_before = model.run(None, {"input": input_rows})[0]
+
+    print(f"{'input before':<24}{args.rows / time_before:>14,.0f} rows/s")
+    print(f"{'input after':<24}{args.rows / time_after:>14,.0f} rows/s")
+    print(f"{'onnx inference':<24}{args.rows / time_model:>14,.0f} rows/s")
+    print(f"Same predictions: {np.array_equal(pred, pred_before)}")
+
+
+if __name__ == "__main__":
+    main()